@@ -25,34 +25,27 @@ version 0.9, 2016-01-27, mommermiscience@gmail.com
 
 import os
 import sys
+import json
 import logging
 
 import numpy as np
 import sqlite3 as sql
 import astropy.units as u
 import astropy.coordinates as coord
-from astropy.table import Table, Column
+from astropy.table import Table, Column, MaskedColumn
 from astropy import __version__ as astropyversion
 from astropy.io import fits
-import scipy.optimize as optimization
 import warnings
 warnings.simplefilter("ignore", UserWarning)
-from pandas import read_sql
-
+from pandas import read_sql, DataFrame
 
+# Arrow/Parquet files are optional
 try:
-    from scipy import spatial
+    import pyarrow
+    import pyarrow.parquet
 except ImportError:
-    print('Module scipy not found. Please install with: pip install scipy')
-    sys.exit()
+    pyarrow = None
 
-try:
-    from astroquery.vizier import Vizier
-    from astroquery.sdss import SDSS
-except ImportError:
-    print('Module astroquery not found. Please install with: pip install '
-          'astroquery')
-    sys.exit()
 
 # translates numpy datatypes to sql-readable datatypes
 sql.register_adapter(np.float64, float)
@@ -62,6 +55,13 @@ sql.register_adapter(np.int32, int)
 
 # import pp modules
 import _pp_conf
+import catalog_cache
+import catalog_tiles
+import catalog_match
+import catalog_transform
+import toolbox
+from services import Vizier, SDSS
+from pp_setup import confcatalog
 
 # setup logging
 logging.basicConfig(filename=_pp_conf.log_filename,
@@ -70,8 +70,141 @@ logging.basicConfig(filename=_pp_conf.log_filename,
                     datefmt=_pp_conf.log_datefmt)
 
 
+# fields that magnitude limits in catalog queries apply to; catalogs that
+# are not listed here are not magnitude-limited
+catalog_mag_keys = {'PANSTARRS': 'rp1mag',
+                    'GAIA': 'Gmag',
+                    'TGAS': 'mag',
+                    '2MASS': 'Jmag',
+                    'URAT-1': 'mag',
+                    'APASS9': 'Vmag',
+                    'SDSS-R9': 'gmag',
+                    'SDSS-R13': 'gmag'}
+
+
+# SQLite column names are case-insensitive; Johnson magnitudes are
+# renamed in database files to avoid collisions with SDSS magnitudes
+
+def database_names(fields):
+    """
+    column names of fields in database files
+    input: field names
+    return: dictionary (field name: column name)
+    """
+    names = {field: field for field in fields}
+    for filtername in ['B', 'V', 'R', 'I']:
+        if '_'+filtername+'mag' in names:
+            prefix = '_'
+        elif filtername+'mag' in names:
+            prefix = ''
+        else:
+            continue
+        for key in [prefix+filtername, prefix+'e_'+filtername]:
+            if key+'mag' in names:
+                names[key+'mag'] = key+'Johnsonmag'
+    return names
+
+
+def field_names(columns):
+    """
+    field names of columns in database files
+    input: column names
+    return: dictionary (column name: field name)
+    """
+    names = {column: column for column in columns}
+    for filtername in ['B', 'V', 'R', 'I']:
+        if '_'+filtername+'Johnsonmag' in names:
+            prefix = '_'
+        elif filtername+'Johnsonmag' in names:
+            prefix = ''
+        else:
+            continue
+        for key in [prefix+filtername, prefix+'e_'+filtername]:
+            if key+'Johnsonmag' in names:
+                names[key+'Johnsonmag'] = key+'mag'
+    return names
+
+
+def sql_type(dtype):
+    """SQLite column type for a numpy dtype"""
+    if dtype.kind == 'f':
+        return 'REAL'
+    if dtype.kind in 'iub':
+        return 'INTEGER'
+    return 'TEXT'
+
+
+def sky_boxes(region):
+    """
+    RA/Dec boxes that cover a sky region
+    input: region: cone (ra_deg, dec_deg, rad_deg) or box (ra_min,
+           ra_max, dec_min, dec_max; ra_min > ra_max: box crosses RA=0)
+    return: list of boxes (ra_min, ra_max, dec_min, dec_max) within
+            0 <= ra <= 360
+    """
+    if len(region) == 3:
+        ra_deg, dec_deg, rad_deg = region
+        dec_min, dec_max = dec_deg-rad_deg, dec_deg+rad_deg
+        if dec_min <= -90 or dec_max >= 90:
+            # cone includes a pole
+            return [(0., 360., max(dec_min, -90.), min(dec_max, 90.))]
+        dra = np.rad2deg(np.arcsin(np.sin(np.deg2rad(rad_deg)) /
+                                   np.cos(np.deg2rad(dec_deg))))
+        ra_min, ra_max = ra_deg-dra, ra_deg+dra
+    else:
+        ra_min, ra_max, dec_min, dec_max = region
+        if ra_min > ra_max:
+            ra_min -= 360
+
+    if ra_min < 0:
+        ra_min += 360
+    if ra_max > 360:
+        ra_max -= 360
+    if ra_min > ra_max:
+        return [(ra_min, 360., dec_min, dec_max),
+                (0., ra_max, dec_min, dec_max)]
+    return [(ra_min, ra_max, dec_min, dec_max)]
+
+
+def region_condition(region, ra_column='ra_deg', dec_column='dec_deg'):
+    """
+    SQL condition that selects sources within a sky region; boxes make
+    use of indexes on (dec_column, ra_column), cone conditions use the
+    SQL function `angular_separation` (see `sql_functions`)
+    input: region (see `sky_boxes`), ra_column, dec_column (position
+           columns)
+    return: condition, parameters
+    """
+    boxes = sky_boxes(region)
+    condition = '({:s})'.format(' OR '.join(
+        ['({:s} BETWEEN ? AND ? AND {:s} BETWEEN ? AND ?)'.format(
+            ra_column, dec_column)]*len(boxes)))
+    parameters = [value for box in boxes for value in box]
+
+    if len(region) == 3:
+        condition += ' AND angular_separation({:s}, {:s}, ?, ?) <= ?'.format(
+            ra_column, dec_column)
+        parameters += list(region)
+
+    return condition, parameters
+
+
+def sql_functions(db_conn):
+    """register SQL functions used in `region_condition`"""
+
+    def angular_separation(ra1_deg, dec1_deg, ra2_deg, dec2_deg):
+        if None in (ra1_deg, dec1_deg, ra2_deg, dec2_deg):
+            return None
+        return float(catalog_cache.angular_separation(
+            ra1_deg, dec1_deg, ra2_deg, dec2_deg))
+
+    db_conn.create_function('angular_separation', 4, angular_separation,
+                            deterministic=True)
+
+
 class catalog(object):
     def __init__(self, catalogname, display=False):
+        self.lazy = confcatalog.lazy_rejection  # defer rejections?
         self.data = None  # will be an astropy table
         self.catalogname = catalogname
         self.obstime = [None, None]  # observation midtime (JD) +
@@ -82,14 +215,39 @@ class catalog(object):
         self.magsys = ''  # [AB|Vega|instrumental]
         self.display = display
         self.filtername = None
+        self.n_queried = None  # number of sources returned by server
+        self.complete = True  # query result not truncated by row limit?
 
     # data access functions
 
+    @property
+    def data(self):
+        """source data (astropy table); pending rejections are applied
+        before the table is returned"""
+        if self._active is not None:
+            self._data = self._data[self._active]
+            self._active = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._active = None  # mask of sources not rejected yet (lazy mode)
+        self._index = {}  # spatial indices are invalid for new data
+
+    def __getstate__(self):
+        """spatial indices are not copied or pickled"""
+        state = self.__dict__.copy()
+        state['_index'] = {}
+        return state
+
     @property
     def shape(self):
         """
         return: tuple of number of sources and fields
         """
+        if self._active is not None:
+            return (int(np.sum(self._active)), len(self.fields))
         try:
             return (len(self.data), len(self.fields))
         except AttributeError:
@@ -100,16 +258,156 @@ class catalog(object):
         """
         return: array of all available fields
         """
-        return self.data.columns
+        return self._data.columns
 
     def __getitem__(self, ident):
         """
-        return: source or field
+        return: source or field; while rejections are pending (lazy
+        mode), a field is returned as a read-only copy of its active
+        sources, so in-place changes have to go through `self.data`
         """
+        if self._active is not None and isinstance(ident, str):
+            # extract a single field without applying pending rejections
+            # to the whole table
+            field = self._data[ident][self._active]
+            field.setflags(write=False)
+            return field
         return self.data[ident]
 
+    def spatial_index(self, ra_key='ra_deg', dec_key='dec_deg',
+                      pixel=False):
+        """
+        spatial index (kd-tree, see `catalog_match.build_tree` and
+        `catalog_match.build_pixel_tree`) of source positions; built on
+        first use and kept until sources are rejected or fields are added
+        input: ra_key, dec_key (or x and y keys, if pixel is True), pixel
+        return: catalog_match.Tree
+        """
+        ra, dec = self.data[ra_key], self.data[dec_key]
+        index = self._index.get((ra_key, dec_key, pixel))
+        # rebuild if position columns have been replaced
+        if index is None or index[1] is not ra or index[2] is not dec:
+            if pixel:
+                index = (catalog_match.build_pixel_tree(ra, dec), ra, dec)
+            else:
+                index = (catalog_match.build_tree(ra, dec), ra, dec)
+            self._index[(ra_key, dec_key, pixel)] = index
+        return index[0]
+
+    # positional queries
+
+    # Positions are sky coordinates (deg, using `ra_deg`, `dec_deg`) or,
+    # if pixel is True, pixel coordinates (using `XWIN_IMAGE`,
+    # `YWIN_IMAGE`); other fields can be used through `keys`. All queries
+    # use the cached spatial index and return source indices and
+    # distances (deg or px), sorted by distance.
+
+    def _query_point(self, x, y, pixel, keys):
+        """spatial index and query point for positional queries"""
+        if keys is None:
+            keys = (('XWIN_IMAGE', 'YWIN_IMAGE') if pixel
+                    else ('ra_deg', 'dec_deg'))
+        tree = self.spatial_index(keys[0], keys[1], pixel=pixel)
+        if pixel:
+            point = np.array([x, y], dtype=float)
+        else:
+            point = catalog_match.unit_vectors(x, y)[0]
+        return tree, point
+
+    def _distances(self, tree, point, idx, pixel):
+        """sort query results (tree indices) by distance; return source
+        indices"""
+        idx = np.asarray(idx, dtype=int)
+        dist = np.sqrt(np.sum((tree.data[idx]-point)**2, axis=1))
+        if not pixel:
+            dist = catalog_match.chord_to_angle(dist)
+        order = np.argsort(dist, kind='stable')
+        return tree.index[idx[order]], dist[order]
+
+    def cone_search(self, x, y, radius, pixel=False, keys=None):
+        """
+        identify sources within radius of a position
+        input: x, y (ra and dec in deg or pixel coordinates), radius
+               (deg or px), pixel, keys (position fields)
+        return: source indices, distances
+        """
+        tree, point = self._query_point(x, y, pixel, keys)
+        if pixel:
+            idx = tree.query_ball_point(point, radius)
+        else:
+            idx = tree.query_ball_point(
+                point, catalog_match.angle_to_chord(radius))
+        return self._distances(tree, point, idx, pixel)
+
+    def box_search(self, x, y, width, height, pixel=False, keys=None):
+        """
+        identify sources within a box centered on a position; in sky
+        coordinates, the box is defined in the tangent plane
+        input: x, y (ra and dec in deg or pixel coordinates), width,
+               height (deg or px), pixel, keys (position fields)
+        return: source indices, distances from box center
+        """
+        tree, point = self._query_point(x, y, pixel, keys)
+        if pixel:
+            idx = np.array(tree.query_ball_point(
+                point, max(width, height)/2, p=np.inf), dtype=int)
+            inside = ((np.abs(tree.data[idx, 0]-x) <= width/2) &
+                      (np.abs(tree.data[idx, 1]-y) <= height/2))
+        else:
+            # the half-diagonal in the tangent plane exceeds the
+            # angular distance of the box corners
+            idx = np.array(tree.query_ball_point(
+                point, catalog_match.angle_to_chord(
+                    np.hypot(width, height)/2)), dtype=int)
+            vectors = tree.data[idx]
+            xi, eta, cos_c = toolbox.tangent_plane(
+                x, y, np.rad2deg(np.arctan2(vectors[:, 1], vectors[:, 0])),
+                np.rad2deg(np.arcsin(np.clip(vectors[:, 2], -1, 1))))
+            inside = ((cos_c > 0) &
+                      (np.abs(np.rad2deg(xi)) <= width/2) &
+                      (np.abs(np.rad2deg(eta)) <= height/2))
+        return self._distances(tree, point, idx[inside], pixel)
+
+    def nearest(self, x, y, k=1, max_distance=None, pixel=False,
+                keys=None):
+        """
+        identify the k sources closest to a position
+        input: x, y (ra and dec in deg or pixel coordinates), k,
+               max_distance (deg or px; None: no limit), pixel,
+               keys (position fields)
+        return: source indices, distances (up to k sources)
+        """
+        tree, point = self._query_point(x, y, pixel, keys)
+        if max_distance is None:
+            bound = np.inf
+        elif pixel:
+            bound = max_distance
+        else:
+            bound = catalog_match.angle_to_chord(max_distance)
+        dist, idx = tree.query(point, k=[i+1 for i in range(k)],
+                               distance_upper_bound=bound*(1+1e-12))
+        return self._distances(tree, point, idx[np.isfinite(dist)], pixel)
+
     # data manipulation functions
 
+    def _keep_sources(self, keep):
+        """
+        keep only sources for which `keep` is True; in lazy mode
+        (`self.lazy`), boolean conditions are accumulated into a mask of
+        active sources that is applied to the table only when
+        `self.data` is accessed
+        """
+        keep_array = np.asarray(keep)
+        if (not self.lazy or keep_array.dtype != bool or
+                keep_array.shape != (self.shape[0],)):
+            self.data = self.data[keep]
+            return
+
+        if self._active is None:
+            self._active = np.ones(len(self._data), dtype=bool)
+        self._active[self._active] = keep_array
+        self._index = {}
+
     def reject_sources_other_than(self, condition):
         """
         reject sources based on condition
@@ -119,32 +417,48 @@ class catalog(object):
 
         n_raw = self.shape[0]
 
-        self.data = self.data[condition]
+        self._keep_sources(condition)
 
         logging.info('{:s}:reject {:d} sources'.format(self.catalogname,
                                                        n_raw-self.shape[0]))
 
-        return len(self.data)
+        return self.shape[0]
 
     def reject_sources_with(self, condition):
         """
         reject sources based on condition
         input: condition
-        return: number of sources left
+        return: number of sources rejected
         """
 
         n_raw = self.shape[0]
-        self.data = self.data[~condition]
+        self._keep_sources(~condition)
 
         logging.info('{:s}:reject {:d} sources'.format(self.catalogname,
                                                        n_raw-self.shape[0]))
 
-        return n_raw - len(self.data)
+        return n_raw - self.shape[0]
+
+    def _new_table(self, records=None, names=None, rows=None):
+        """
+        empty table or table from a record array; only the requested
+        fields and rows are copied from the record array
+        input: records, names (None: all fields), rows (index or boolean
+               array; None: all rows)
+        """
+        if records is None:
+            return Table()
+        if names is None:
+            names = records.dtype.names
+        columns = [np.array(records.field(name) if rows is None else
+                            records.field(name)[rows]) for name in names]
+        return Table(columns, names=names)
 
     def add_field(self, field_name, field_array, field_type=None):
         """
         single-field wrapper for add_fields
         """
+        self._index = {}
         if field_type is not None:
             return self.data.add_column(Column(field_array, name=field_name,
                                                format=field_type))
@@ -161,7 +475,8 @@ class catalog(object):
         assert len(field_names) == len(field_arrays)
 
         if self.data is None:
-            self.data = Table()
+            self.data = self._new_table()
+        self._index = {}
 
         for i in range(len(field_names)):
             if field_types is None:
@@ -193,29 +508,92 @@ class catalog(object):
                               [mags], [e_mags], epoch_jd
         """
 
+        # query properties as used by the catalog cache: magnitude
+        # limit and row limit that actually apply to this query
+        mag_key = catalog_mag_keys.get(self.catalogname)
+        query_max_mag = max_mag if mag_key is not None else None
+        row_limit = {'SkyMapper': 10000,
+                     'SDSS-R13': None}.get(self.catalogname, max_sources)
+        n_queried = None  # number of sources returned by server
+
+        # check local catalog cache for this query
+        cached = None
+        if confcatalog.cache_catalogs or confcatalog.offline:
+            cached, cached_complete = catalog_cache.cache.retrieve(
+                self.catalogname, ra_deg, dec_deg, rad_deg, row_limit,
+                max_mag=query_max_mag, mag_key=mag_key)
+
+        # check local tile store for this query
+        tiled = None
+        if (cached is None and confcatalog.use_tile_store and
+                self.catalogname in catalog_tiles.tile_catalogs):
+            tiles = catalog_tiles.store.cone_tiles(ra_deg, dec_deg, rad_deg)
+            missing = catalog_tiles.store.missing_tiles(
+                self.catalogname, tiles, query_max_mag)
+            if len(missing) < len(tiles) and len(missing) > 0:
+                if self.display:
+                    print(('tile store covers only {:d} of {:d} {:s} '
+                           'tiles').format(len(tiles)-len(missing),
+                                           len(tiles), self.catalogname))
+                logging.warning(('tile store covers only {:d} of {:d} {:s} '
+                                 'tiles; missing: {:s}').format(
+                                     len(tiles)-len(missing), len(tiles),
+                                     self.catalogname,
+                                     ', '.join([str(pix) for pix
+                                                in missing])))
+            # serve partial coverage only if there is no alternative
+            if len(missing) == 0 or (confcatalog.offline and
+                                     len(missing) < len(tiles)):
+                tiled, tiled_complete = catalog_tiles.store.assemble(
+                    self.catalogname, ra_deg, dec_deg, rad_deg, row_limit,
+                    query_max_mag, mag_key, tiles=tiles)
+
         # setup Vizier query
         # note: column filters uses original Vizier column names
         # -> green column names in Vizier
 
+        if cached is not None:
+            query_message = ('read {:s} at {:7.3f}/{:+.3f} in a {:.2f} deg '
+                             'radius from local cache')
+        elif tiled is not None:
+            query_message = ('read {:s} at {:7.3f}/{:+.3f} in a {:.2f} deg '
+                             'radius from local tile store')
+        else:
+            query_message = ('query Vizier for {:s} at {:7.3f}/{:+.3f} in '
+                             'a {:.2f} deg radius')
+
         if self.display:
-            print(('query Vizier for {:s} at {:7.3f}/{:+.3f} in '
-                   + 'a {:.2f} deg radius').format(self.catalogname,
-                                                   ra_deg, dec_deg,
-                                                   rad_deg),
+            print(query_message.format(self.catalogname, ra_deg, dec_deg,
+                                       rad_deg),
                   end=' ', flush=True)
 
-        logging.info(('query Vizier for {:s} at {:7.3f}/{:+.3f} in '
-                      + 'a {:.2f} deg radius').format(self.catalogname,
-                                                      ra_deg, dec_deg,
-                                                      rad_deg))
+        logging.info(query_message.format(self.catalogname, ra_deg, dec_deg,
+                                          rad_deg))
 
         field = coord.SkyCoord(ra=ra_deg, dec=dec_deg, unit=(u.deg, u.deg),
                                frame='icrs')
 
         # -----------------------------------------------------------------
 
+        # use cached query result
+        if cached is not None:
+            self.data = cached
+
+        # use data from local tile store
+        elif tiled is not None:
+            self.data = tiled
+
+        # offline mode: do not contact any server
+        elif confcatalog.offline:
+            if self.display:
+                print(('offline: {:s} not available from local cache or '
+                       'tile store').format(self.catalogname))
+            logging.error(('offline: {:s} not available from local cache '
+                           'or tile store').format(self.catalogname))
+            return 0
+
         # use vizier query for Pan-STARRS
-        if self.catalogname == 'PANSTARRS':
+        elif self.catalogname == 'PANSTARRS':
 
             vquery = Vizier(columns=['objID', 'RAJ2000', 'DEJ2000',
                                      'e_RAJ2000', 'e_DEJ2000',
@@ -242,6 +620,8 @@ class catalog(object):
                     self.catalogname))
                 return 0
 
+            n_queried = len(self.data)
+
             # rename column names using PP conventions
             self.data.rename_column('objID', 'ident')
             self.data.rename_column('RAJ2000', 'ra_deg')
@@ -288,6 +668,7 @@ class catalog(object):
                                     verbose=False)
 
             self.data = job.get_results()
+            n_queried = len(self.data)
 
             # rename column names using PP conventions
             self.data.rename_column('object_id', 'ident')
@@ -418,6 +799,8 @@ class catalog(object):
                     self.catalogname))
                 return 0
 
+            n_queried = len(self.data)
+
             # filter columns to only have really good detections
             # see the Vizier webpage for a description of what the flags mean
             Qflags = set('ABC')  # only A, B, or C flagged detections
@@ -650,6 +1033,30 @@ class catalog(object):
             self.data['e_ra_deg'] = self.data['e_ra_deg'] * u.arcsec
             self.data['e_dec_deg'] = self.data['e_dec_deg'] * u.arcsec
 
+        elif self.catalogname == 'VSX':
+            # variable star index; positions only
+            vquery = Vizier(columns=['Name', 'RAJ2000', 'DEJ2000'],
+                            row_limit=max_sources)
+
+            try:
+                self.data = vquery.query_region(field,
+                                                radius=rad_deg*u.deg,
+                                                catalog="B/vsx/vsx",
+                                                cache=False)[0]
+            except IndexError:
+                if self.display:
+                    print('no data available from {:s}'.format(
+                        self.catalogname))
+                logging.error('no data available from {:s}'.format(
+                    self.catalogname))
+                return 0
+            n_queried = len(self.data)
+
+            # rename column names using PP conventions
+            self.data.rename_column('Name', 'ident')
+            self.data.rename_column('RAJ2000', 'ra_deg')
+            self.data.rename_column('DEJ2000', 'dec_deg')
+
         else:
             if self.display:
                 print('catalog {:s} not available.'.format(
@@ -665,11 +1072,41 @@ class catalog(object):
         self.history = '{:d} sources downloaded'.format(len(self.data))
 
         # convert all coordinate uncertainties to degrees
-        self.data['e_ra_deg'] = self.data['e_ra_deg'].to(u.deg)
-        self.data['e_dec_deg'] = self.data['e_dec_deg'].to(u.deg)
+        if 'e_ra_deg' in self.data.columns:
+            self.data['e_ra_deg'] = self.data['e_ra_deg'].to(u.deg)
+            self.data['e_dec_deg'] = self.data['e_dec_deg'].to(u.deg)
+
+        # number of sources returned by the server (before filtering);
+        # the query was truncated if this reaches the row limit; cache
+        # and tile store report whether their data are truncated
+        if cached is not None:
+            self.n_queried, self.complete = None, cached_complete
+        elif tiled is not None:
+            self.n_queried, self.complete = None, tiled_complete
+        else:
+            self.n_queried = (n_queried if n_queried is not None
+                              else len(self.data))
+            self.complete = (row_limit is None or
+                             self.n_queried < row_limit)
+
+        # add query result to local catalog cache
+        if (cached is None and tiled is None and
+                confcatalog.cache_catalogs):
+            catalog_cache.cache.store(self.catalogname, ra_deg, dec_deg,
+                                      rad_deg, row_limit, query_max_mag,
+                                      self.data, n_queried=n_queried)
+
+        # add query result to local tile store
+        if (cached is None and tiled is None and
+                confcatalog.use_tile_store and confcatalog.fill_tile_store and
+                self.catalogname in catalog_tiles.tile_catalogs):
+            catalog_tiles.store.ingest(
+                self.catalogname, self.data, ra_deg, dec_deg, rad_deg,
+                max_mag=query_max_mag,
+                complete=self.query_complete())
 
         # set catalog magnitude system
-        self.magsystem = _pp_conf.allcatalogs_magsys[self.catalogname]
+        self.magsystem = _pp_conf.allcatalogs_magsys.get(self.catalogname)
 
         # write ldac catalog
         if save_catalog:
@@ -677,19 +1114,35 @@ class catalog(object):
 
         return self.shape[0]
 
+    def query_complete(self):
+        """
+        check whether the last catalog query was not truncated by its
+        row limit
+        return: boolean
+        """
+        return self.complete
+
     # FITS/LDAC interface
 
+    # LDAC fields that are renamed in catalogs
+    ldac_names = {'ra_deg': 'XWIN_WORLD', 'dec_deg': 'YWIN_WORLD'}
+
     def read_ldac(self, filename, fits_filename=None, maxflag=None,
                   time_keyword='MIDTIMJD', exptime_keyword='EXPTIME',
-                  object_keyword='OBJECT', telescope_keyword='TEL_KEYW'):
+                  object_keyword='OBJECT', telescope_keyword='TEL_KEYW',
+                  fields=None):
         """
-        read in FITS_LDAC file
-        input: LDAC filename
+        read in FITS_LDAC file; the file is memory-mapped and only the
+        requested fields of sources that pass the flag limit are read
+        input: LDAC filename, fits_filename (image file to read
+               observation time and object from), maxflag (None: all
+               sources), keywords, fields (field names as in the
+               catalog, e.g., ra_deg; None: all fields)
         return: (number of sources, number of fields)
         """
 
         # load LDAC file
-        hdulist = fits.open(filename, ignore_missing_end=True)
+        hdulist = fits.open(filename, ignore_missing_end=True, memmap=True)
 
         if len(hdulist) < 3:
             print(('ERROR: {:s} seems to be empty; check LOG file if ' +
@@ -700,8 +1153,19 @@ class catalog(object):
                                filename))
             return None
 
-        # load data array
-        self.data = Table(hdulist[2].data)
+        # reject flagged sources (if requested) and load data array
+        records = hdulist[2].data
+        rows = None
+        if maxflag is not None:
+            # FLAGS <= 3: allow for blending and nearby sources
+            rows = records.field('FLAGS') <= maxflag
+            logging.info('{:s}:reject {:d} sources'.format(
+                filename, int(np.sum(~rows))))
+        names = records.dtype.names
+        if fields is not None:
+            ldac_fields = [self.ldac_names.get(key, key) for key in fields]
+            names = [name for name in names if name in ldac_fields]
+        self.data = self._new_table(records, names=names, rows=rows)
 
         # set other properties
         telescope = ''
@@ -715,28 +1179,23 @@ class catalog(object):
             self.origin = '{:s};'.format(telescope.strip())
         self.magsys = 'instrumental'
 
-        # reject flagged sources (if requested)
-        if maxflag is not None:
-            self.reject_sources_other_than(self.data['FLAGS'] <= maxflag)
-            # FLAGS <= 3: allow for blending and nearby sources
-
-        # read data from image header, if requested
+        # read data from image header (without image data), if requested
         if fits_filename is not None:
-            fitsheader = fits.open(fits_filename,
-                                   ignore_missing_end=True)[0].header
+            fitsheader = fits.getheader(fits_filename,
+                                        ignore_missing_end=True)
             self.obstime[0] = float(fitsheader[time_keyword])
             self.obstime[1] = float(fitsheader[exptime_keyword])
             self.obj = fitsheader[object_keyword]
 
         # rename columns
-        if 'XWIN_WORLD' in self.fields:
-            self.data.rename_column('XWIN_WORLD', 'ra_deg')
-        if 'YWIN_WORLD' in self.fields:
-            self.data.rename_column('YWIN_WORLD', 'dec_deg')
+        for key, name in self.ldac_names.items():
+            if name in self.fields:
+                self.data.rename_column(name, key)
 
         # force positive RA values
-        flip_idc = np.where(self.data['ra_deg'] < 0)[0]
-        self.data['ra_deg'][flip_idc] += 360
+        if 'ra_deg' in self.fields:
+            flip_idc = np.where(self.data['ra_deg'] < 0)[0]
+            self.data['ra_deg'][flip_idc] += 360
 
         logging.info(('read {:d} sources in {:d} columns '
                       'from LDAC file {:s}').format(
@@ -840,6 +1299,19 @@ class catalog(object):
 
     # SQLite interface
 
+    def database_fields(self):
+        """
+        fields that can be written into database files; vector fields
+        (e.g., photometry in several apertures) are skipped
+        return: list of field names
+        """
+        fields = [key for key in self.fields if np.ndim(self[key]) == 1]
+        if len(fields) < len(self.fields):
+            logging.warning('{:s}: fields {:s} not written'.format(
+                self.catalogname, ', '.join([key for key in self.fields
+                                            if key not in fields])))
+        return fields
+
     def write_database(self, filename):
         """
         write catalog object to SQLite database file
@@ -847,50 +1319,43 @@ class catalog(object):
         output: number of sources written to file
         """
 
-        # open database file (delete existing ones)
+        # open database file (delete existing ones); the file is
+        # written in one transaction without rollback journal
         os.remove(filename) if os.path.exists(filename) else None
         db_conn = sql.connect(filename)
-        db = db_conn.cursor()
-
-        from copy import deepcopy
-        write_table = deepcopy(self.data)
+        db_conn.execute('PRAGMA journal_mode=OFF')
+        db_conn.execute('PRAGMA synchronous=OFF')
 
         # rename Johnson filternames to avoid collisions with SDSS
-        for filtername in ['B', 'V', 'R', 'I']:
-            if '_'+filtername+'mag' in list(write_table.columns):
-                write_table.rename_column(
-                    '_{:s}mag'.format(filtername),
-                    '_{:s}Johnsonmag'.format(filtername))
-                write_table.rename_column(
-                    '_e_{:s}mag'.format(filtername),
-                    '_e_{:s}Johnsonmag'.format(filtername))
-            elif filtername+'mag' in list(write_table.columns):
-                write_table.rename_column(
-                    '{:s}mag'.format(filtername),
-                    '{:s}Johnsonmag'.format(filtername))
-                write_table.rename_column(
-                    'e_{:s}mag'.format(filtername),
-                    'e_{:s}Johnsonmag'.format(filtername))
-
-        # create header and write to database
-        header = Table([[self.catalogname], [self.origin], [self.history],
-                        [self.magsys], [self.obstime[0]], [self.obstime[1]],
-                        [self.obj], [self.filtername]],
-                       names=['name', 'origin', 'description',
-                              'magsys', 'obstime', 'exptime', 'obj',
-                              'filtername'])
-        header.to_pandas().to_sql('header', db_conn, index=False)
-
-        # write data to database
-        write_table.to_pandas().to_sql('data', db_conn, index=False)
-
-        db_conn.commit()
-
-        # return number of objects written to database
-        db.execute(
-            "SELECT COUNT(DISTINCT {:s}) FROM data".format(
-                self.fields[0].name))
-        n_obj = db.fetchall()[0][0]
+        fields = self.database_fields()
+        names = database_names(fields)
+
+        with db_conn:
+            # create header and write to database
+            db_conn.execute(('CREATE TABLE header (name TEXT, '
+                             'origin TEXT, description TEXT, magsys TEXT, '
+                             'obstime REAL, exptime REAL, obj TEXT, '
+                             'filtername TEXT)'))
+            db_conn.execute('INSERT INTO header VALUES (?,?,?,?,?,?,?,?)',
+                            (self.catalogname, self.origin, self.history,
+                             self.magsys, self.obstime[0], self.obstime[1],
+                             self.obj, self.filtername))
+
+            # write data to database; masked values and nan are NULL
+            arrays = [self[key] for key in fields]
+            db_conn.execute('CREATE TABLE data ({:s})'.format(
+                ', '.join(['"{:s}" {:s}'.format(names[key],
+                                                sql_type(array.dtype))
+                           for key, array in zip(fields, arrays)])))
+            n_obj = db_conn.executemany(
+                'INSERT INTO data VALUES ({:s})'.format(
+                    ', '.join(['?']*len(fields))),
+                zip(*[array.tolist() for array in arrays])).rowcount
+
+            # index of source positions for sky region queries
+            if 'ra_deg' in fields and 'dec_deg' in fields:
+                db_conn.execute(('CREATE INDEX data_position '
+                                 'ON data (dec_deg, ra_deg)'))
 
         logging.info(('wrote {:d} sources from catalog {:s} '
                       'to database file {:s}'.format(
@@ -904,8 +1369,16 @@ class catalog(object):
 
         return n_obj
 
-    def read_database(self, filename):
-        """ read in photometry database into catalog """
+    def read_database(self, filename, fields=None, region=None):
+        """
+        read in photometry database into catalog
+        input: filename, fields (field names to be read or function
+               fields(cat, key) that selects fields to be read; cat
+               holds the header information only; None: all fields),
+               region (sky region of sources to be read, see
+               `sky_boxes`; None: all sources)
+        return: number of sources read
+        """
 
         # open database file
         try:
@@ -929,546 +1402,272 @@ class catalog(object):
         self.obj = header['obj'][0]
         self.filtername = header['filtername'][0]
 
+        # select columns; rename Johnson filternames
+        columns = [row[1] for row in
+                   db.execute('PRAGMA table_info(data)').fetchall()]
+        names = field_names(columns)
+        if callable(fields):
+            columns = [column for column in columns
+                       if fields(self, names[column])]
+        elif fields is not None:
+            columns = [column for column in columns
+                       if names[column] in fields]
+
+        # select sources within region (using the index of source
+        # positions, if available); sources are kept in file order
+        condition, parameters = '', []
+        if region is not None:
+            sql_functions(db_conn)
+            condition, parameters = region_condition(region)
+            condition = ' WHERE ' + condition + ' ORDER BY rowid'
+
         # read in data table
-        self.data = Table.from_pandas(read_sql('SELECT * FROM data',
-                                               db_conn))
-
-        # rename Johnson filternames
-        for filtername in ['B', 'V', 'R', 'I']:
-            if '_'+filtername+'Johnsonmag' in list(self.data.columns):
-                self.data.rename_column(
-                    '_{:s}Johnsonmag'.format(filtername),
-                    '_{:s}mag'.format(filtername))
-                self.data.rename_column(
-                    '_e_{:s}Johnsonmag'.format(filtername),
-                    '_e_{:s}mag'.format(filtername))
-            elif filtername+'Johnsonmag' in list(self.data.columns):
-                self.data.rename_column(
-                    '{:s}Johnsonmag'.format(filtername),
-                    '{:s}mag'.format(filtername))
-                self.data.rename_column(
-                    'e_{:s}Johnsonmag'.format(filtername),
-                    'e_{:s}mag'.format(filtername))
+        data = read_sql('SELECT {:s} FROM data{:s}'.format(
+            ', '.join(['"{:s}"'.format(column) for column in columns]),
+            condition), db_conn, params=parameters) \
+            if len(columns) > 0 else DataFrame()
+        self.data = Table.from_pandas(data.rename(columns=names))
+
+        db_conn.close()
 
         return self.shape[0]
 
-    # filter transformations
+    # Arrow/Parquet interface
 
-    def lin_func(self, x, a, b):
-        return a*x + b
+    # header information in the schema metadata of Arrow tables
+    arrow_metadata_key = b'pp_catalog'
 
-    def transform_filters(self, targetfilter):
+    def to_arrow(self):
         """
-        transform a given catalog into a different filter band; crop the
-        resulting catalog to only those sources that have transformed magnitudes
-        transformed magnitudes start with an asterisk
-        input: targetfilter name
-        return: number of transformed magnitudes
+        convert catalog into an Arrow table; header information is stored
+        in the schema metadata, vector fields as fixed-size lists, masked
+        values as nulls
+        return: pyarrow.Table
         """
+        columns, fields = [], []
+        for key in self.fields:
+            column = self[key]
+            mask = (np.ma.getmaskarray(column)
+                    if isinstance(column, np.ma.MaskedArray) else None)
+            values = np.ascontiguousarray(np.ma.getdata(column))
+            if not values.dtype.isnative:
+                # FITS data are big-endian
+                values = values.astype(values.dtype.newbyteorder('='))
+            if values.ndim > 1:
+                array = pyarrow.FixedSizeListArray.from_arrays(
+                    pyarrow.array(values.ravel()),
+                    int(np.prod(values.shape[1:])))
+            else:
+                array = pyarrow.array(values, mask=mask)
+            unit = getattr(column, 'unit', None)
+            columns.append(array)
+            fields.append(pyarrow.field(
+                key, array.type, metadata=(None if unit is None else
+                                           {b'unit': str(unit)})))
+
+        header = {'catalogname': self.catalogname, 'origin': self.origin,
+                  'history': self.history, 'magsys': self.magsys,
+                  'obstime': [None if t is None else float(t)
+                              for t in self.obstime],
+                  'obj': self.obj, 'filtername': self.filtername}
+        return pyarrow.Table.from_arrays(
+            columns, schema=pyarrow.schema(
+                fields, metadata={self.arrow_metadata_key:
+                                  json.dumps(header)}))
+
+    def from_arrow(self, table):
+        """
+        read catalog from an Arrow table (see `to_arrow`)
+        input: pyarrow.Table
+        return: number of sources read
+        """
+        metadata = table.schema.metadata or {}
+        if self.arrow_metadata_key in metadata:
+            header = json.loads(metadata[self.arrow_metadata_key])
+            self.catalogname = header['catalogname']
+            self.origin = header['origin']
+            self.history = header['history']
+            self.magsys = header['magsys']
+            self.obstime = header['obstime']
+            self.obj = header['obj']
+            self.filtername = header['filtername']
+
+        columns = []
+        for field, column in zip(table.schema, table.columns):
+            column = column.combine_chunks()
+            if pyarrow.types.is_fixed_size_list(field.type):
+                values = np.array(column.flatten().to_numpy(
+                    zero_copy_only=False)).reshape(len(column), -1)
+            else:
+                # arrays are copied, so that fields can be modified
+                values = column
+                if column.null_count > 0:
+                    values = column.fill_null(
+                        False if pyarrow.types.is_boolean(field.type) else
+                        '' if pyarrow.types.is_string(field.type) else
+                        b'' if pyarrow.types.is_binary(field.type) else 0)
+                values = values.to_numpy(zero_copy_only=False)
+                values = np.array(values.tolist() if values.dtype == object
+                                  else values)
+                if column.null_count > 0:
+                    values = np.ma.MaskedArray(
+                        values, mask=column.is_null().to_numpy(
+                            zero_copy_only=False))
+            unit = (field.metadata or {}).get(b'unit')
+            unit = None if unit is None else unit.decode()
+            if isinstance(values, np.ma.MaskedArray):
+                columns.append(MaskedColumn(values, name=field.name,
+                                            unit=unit, copy=False))
+            else:
+                columns.append(Column(values, name=field.name, unit=unit,
+                                      copy=False))
 
-        # TBD: modify this function to make use of table functionality
-
-        if len(self.data) == 0:
-            return 0
-
-        # check if this specific transformation has already been done
-        if '_'+targetfilter+'mag' in self.fields:
-            logging.info(targetfilter + ' already available')
-            return self.shape[0]
-
-        # SDSS to BVRI
-        # transformations based on Chonis & Gaskell 2008, AJ, 135
-        if ((('SDSS' in self.catalogname) or
-             ('SkyMapper' in self.catalogname)) and
-                (targetfilter in {'B', 'V', 'R', 'I'})):
-
-            logging.info(('trying to transform {:d} SDSS sources to '
-                          + '{:s}').format(self.shape[0], targetfilter))
-
-            mags = np.array([self['gmag'].data, self['rmag'].data,
-                             self['imag'].data,
-                             self['e_gmag'].data,
-                             self['e_rmag'].data,
-                             self['e_imag'].data,
-                             self['umag'].data,
-                             self['e_umag'].data])
-
-            # sort out sources that do not meet the C&G requirements
-            keep_idc = (mags[1]-mags[2] > 0.08) & (mags[1]-mags[2] < 0.5) & \
-                (mags[0]-mags[1] > 0.2) & (mags[0]-mags[1] < 1.4) & \
-                (mags[0] >= 14.5) & (mags[0] < 19.5) & \
-                (mags[1] >= 14.5) & (mags[1] < 19.5) & \
-                (mags[2] >= 14.5) & (mags[2] < 19.5)
-            filtered_mags = np.array([mags[i][keep_idc]
-                                      for i in range(len(mags))])
-
-            # ... derive a linear best fit and remove outliers (>3 sigma)
-            ri = np.array(filtered_mags[1]) - np.array(filtered_mags[2])
-            gr = np.array(filtered_mags[0]) - np.array(filtered_mags[1])
-            if len(ri) == 0 or len(gr) == 0:
-                logging.warning(('no suitable stars for transformation '
-                                 'to {:s}').format(targetfilter))
-                return 0
-
-            param = optimization.curve_fit(self.lin_func, ri, gr, [1, 0])[0]
-            resid = np.sqrt(((ri+param[0]*gr-param[0]*param[1]) /
-                             (param[0]**2+1))**2 +
-                            (param[0]*(ri+param[0]*gr-param[0]*param[1]) /
-                             (param[0]**2+1)+param[1]-gr)**2)
-            remove = np.where(np.array(resid) > 3.*np.std(resid))[0]
-
-            keep = [idx for idx in np.arange(len(keep_idc))[keep_idc]
-                    if idx not in set(remove)]
-
-            # transformed magnitudes; uncertainties through Gaussian and C&G2008
-            nmags = np.array([np.empty(len(mags[0])),
-                              np.empty(len(mags[0]))])
-            if targetfilter == 'U':
-                nmags[0] = mags[6] - 0.854
-                nmags[1] = np.sqrt(mags[7]**2 + 0.007**2)
-            elif targetfilter == 'B':
-                nmags[0] = mags[0] + 0.327*(mags[0] - mags[1]) + 0.216
-                nmags[1] = np.sqrt(((1+0.327)*mags[3])**2
-                                   + (0.327*mags[4])**2
-                                   + ((mags[0]-mags[1])*0.047)**2
-                                   + 0.027**2)
-            elif targetfilter == 'V':
-                nmags[0] = mags[0] - 0.587*(mags[0] - mags[1]) - 0.011
-                nmags[1] = np.sqrt(((1+0.587)*mags[3])**2
-                                   + (0.587*mags[4])**2
-                                   + ((mags[0]-mags[1])*0.022)**2
-                                   + 0.011**2)
-            elif targetfilter == 'R':
-                nmags[0] = mags[1] - 0.272*(mags[1] - mags[2]) - 0.159
-                nmags[1] = np.sqrt(((1-0.272)*mags[4])**2
-                                   + (0.272*mags[5])**2
-                                   + ((mags[1]-mags[2])*0.092)**2
-                                   + 0.022**2)
-            elif targetfilter == 'I':
-                nmags[0] = mags[2] - 0.337*(mags[1] - mags[2]) - 0.370
-                nmags[1] = np.sqrt(((1+0.337)*mags[5])**2
-                                   + (0.337*mags[4])**2
-                                   + ((mags[1]-mags[2])*0.191)**2
-                                   + 0.041**2)
-
-            # add new filter and according uncertainty to catalog
-            self.add_field('_'+targetfilter+'mag', nmags[0])
-            self.add_field('_e_'+targetfilter+'mag', nmags[1])
-
-            # get rid of sources that have not been transformed
-            self.data = self.data[keep]
-
-            if '_transformed' not in self.catalogname:
-                self.catalogname += '_transformed'
-                self.history += ', {:d} transformed to {:s} (Vega)'.format(
-                                self.shape[0], targetfilter)
-                self.magsystem = 'AB (ugriz), Vega ({:s})'.format(
-                    targetfilter)
-
-            logging.info(('{:d} sources sucessfully '
-                          'transformed to {:s}').format(self.shape[0],
-                                                        targetfilter))
-
-            return self.shape[0]
-
-        # APASS to R/I
-        # todo: include g magnitudes and account for color
-        elif ('URAT' in self.catalogname or
-              'APASS' in self.catalogname and
-              (targetfilter == 'R' or targetfilter == 'I')
-              and self.magsystem == 'Vega'):
-
-            logging.info(('trying to transform {:d} {:s} sources '
-                          'to {:s}'.format(self.shape[0],
-                                           self.catalogname,
-                                           targetfilter)))
-
-            # transformations based on Chonis & Gaskell 2008, AJ, 135
-            mags = np.array([self['rmag'].data,
-                             self['imag'].data,
-                             self['e_rmag'].data,
-                             self['e_imag'].data])
-
-            # sort out sources that do not meet the C&G requirements
-            keep_idc = (mags[0]-mags[1] > 0.08) & (mags[0]-mags[1] < 0.5)
-
-            # transformed magnitudes; uncertainties through Gaussian and C&G2008
-            nmags = np.array([np.empty(len(mags[0])),
-                              np.empty(len(mags[0]))])
-
-            if targetfilter == 'R':
-                nmags[0] = mags[0] - 0.272*(mags[0] - mags[1]) - 0.159
-                nmags[1] = np.sqrt(((1-0.272)*mags[2])**2
-                                   + (0.272*mags[3])**2
-                                   + ((mags[0]-mags[1])*0.092)**2
-                                   + 0.022**2)
-            elif targetfilter == 'I':
-                nmags[0] = mags[1] - 0.337*(mags[0] - mags[1]) - 0.370
-                nmags[1] = np.sqrt(((1+0.337)*mags[3])**2
-                                   + (0.337*mags[2])**2
-                                   + ((mags[0]-mags[1])*0.191)**2
-                                   + 0.041**2)
-
-            # add new filter and according uncertainty to catalog
-            self.add_field('_'+targetfilter+'mag', nmags[0])
-            self.add_field('_e_'+targetfilter+'mag', nmags[1])
-
-            # get rid of sources that have not been transformed
-            self.data = self.data[keep_idc]
-
-            if '_transformed' not in self.catalogname:
-                self.catalogname += '_transformed'
-                self.history += ', {:d} transformed to {:s} (Vega)'.format(
-                    self.shape[0], targetfilter)
-                self.magsystem = 'Vega'
+        self.data = Table(columns, copy=False)
 
-            logging.info(('{:d} sources sucessfully transformed '
-                          'to {:s}').format(self.shape[0], targetfilter))
+        return self.shape[0]
 
-            return self.shape[0]
+    def write_arrow(self, filename, format='parquet'):
+        """
+        write catalog to Parquet or Arrow IPC (Feather) file
+        input: target filename, file format ('parquet' or 'ipc')
+        return: number of sources written to file
+        """
+        if pyarrow is None:
+            print('Module pyarrow not found. Please install with: '
+                  'pip install pyarrow')
+            logging.error('Module pyarrow not found; cannot write '
+                          '{:s}'.format(filename))
+            return 0
 
-        # 2MASS to UKIRT YZJHK)
-        elif (self.catalogname.find('2MASS') > -1) and \
-            (targetfilter in {'Y', 'Z', 'J',
-                              'H', 'K'}) and \
-                (self.magsystem == 'Vega'):
-
-            logging.info(('trying to transform {:d} 2MASS sources to '
-                          + 'UKIRT YZJHK').format(self.shape[0]))
-
-            # transformations using the recipe by Hodgkin et al. 2009, MNRAS
-            mags = [self['Jmag'].data, self['Hmag'].data,
-                    self['Ksmag'].data, self['e_Jmag'].data,
-                    self['e_Hmag'].data, self['e_Ksmag'].data]
-            lbl = {'_Ymag': 0, '_e_Ymag': 1, '_Zmag': 2, '_e_Zmag': 3,
-                   '_Jmag': 4, '_e_Jmag': 5, '_Hmag': 6, '_e_Hmag': 7,
-                   '_Kmag': 8, '_e_Kmag': 9}
-            nmags = [np.zeros(self.shape[0]) for i in range(len(lbl))]
-
-            for idx in range(self.shape[0]):
-                keep = True
-                # remove objects with extreme J-Ks color index
-                cidx = mags[0][idx]-mags[1][idx]
-                if cidx < -0.1 or cidx > 1.0:
-                    keep = False
-                # reject faint stars based on Figure 6 by Hodgkin et
-                # al. 2009, MNRAS
-                if mags[0][idx] > 18 or mags[1][idx] > 17:
-                    keep = False
-
-                if keep:
-                    # 0.064 (sig: 0.035) is a systematic offset
-                    # between UKIRT_Z and SDSS_Z
-                    nmags[lbl['_Zmag']][idx] = mags[0][idx] \
-                        + 0.95*(mags[0][idx]
-                                - mags[1][idx]) + 0.064
-                    nmags[lbl['_e_Zmag']][idx] = np.sqrt(mags[3][idx]**2
-                                                         + 0.035**2)
-
-                    nmags[lbl['_Ymag']][idx] = mags[0][idx] \
-                        + 0.5*(mags[0][idx]
-                               - mags[1][idx]) + 0.08
-                    nmags[lbl['_e_Ymag']][idx] = mags[3][idx]
-
-                    oldH = mags[1][idx]
-                    nmags[lbl['_Hmag']][idx] = mags[1][idx] \
-                        + 0.07*(mags[0][idx] -
-                                mags[2][idx]) - 0.03
-                    nmags[lbl['_e_Hmag']][idx] = mags[4][idx]
-
-                    nmags[lbl['_Jmag']][idx] = mags[0][idx] \
-                        - 0.065*(mags[0][idx] - oldH)
-                    nmags[lbl['_e_Jmag']][idx] = mags[3][idx]
-
-                    nmags[lbl['_Kmag']][idx] = mags[2][idx] \
-                        + 0.01*(mags[0][idx]
-                                - mags[2][idx])
-                    nmags[lbl['_e_Kmag']][idx] = mags[5][idx]
-
-                else:
-                    for mag in list(lbl.keys()):
-                        nmags[lbl[mag]][idx] = 99
-
-            # append nmags arrays to catalog
-            for key, idx in list(lbl.items()):
-                self.add_field(key, nmags[idx])
+        table = self.to_arrow()
+        if format == 'parquet':
+            pyarrow.parquet.write_table(table, filename)
+        else:
+            with pyarrow.OSFile(filename, 'wb') as outf:
+                with pyarrow.ipc.new_file(outf, table.schema) as writer:
+                    writer.write_table(table)
 
-            # get rid of sources that have not been transformed
-            self.data = self.data[self['_Zmag'] < 99]
+        logging.info('wrote {:d} sources from {:s} to {:s} file {:s}'.format(
+            table.num_rows, self.catalogname, format, filename))
 
-            if '_transformed' not in self.catalogname:
-                self.catalogname += '_transformed'
-                self.history += (', {:d} transformed to UKIRT YZJHK '
-                                 '(Vega)').format(self.shape[0])
-                self.magsystem = 'Vega'
+        return table.num_rows
 
-            logging.info(('{:d} sources sucessfully transformed to '
-                          'UKIRT YZJHK').format(self.shape[0]))
+    def read_arrow(self, filename, fields=None, format='parquet'):
+        """
+        read catalog from memory-mapped Parquet or Arrow IPC (Feather)
+        file; only the requested fields are read from the file
+        input: filename, fields (field names to be read; fields that are
+               not in the file are ignored; None: all fields), file format
+               ('parquet' or 'ipc')
+        return: number of sources read
+        """
+        if pyarrow is None:
+            print('Module pyarrow not found. Please install with: '
+                  'pip install pyarrow')
+            logging.error('Module pyarrow not found; cannot read '
+                          '{:s}'.format(filename))
+            return 0
 
-            return self.shape[0]
+        if format == 'parquet':
+            schema = pyarrow.parquet.read_schema(filename, memory_map=True)
+            columns = (None if fields is None else
+                       [key for key in schema.names if key in fields])
+            table = pyarrow.parquet.read_table(filename, columns=columns,
+                                               memory_map=True)
+        else:
+            source = pyarrow.memory_map(filename, 'r')
+            table = pyarrow.ipc.open_file(source).read_all()
+            if fields is not None:
+                table = table.select([key for key in table.column_names
+                                      if key in fields])
 
-        # PANSTARRS to BVRI
-        elif ('PANSTARRS' in self.catalogname and
-              targetfilter in ['B', 'V', 'R', 'I']):
-
-            logging.info(('trying to transform {:d} PANSTARRS sources to '
-                          + '{:s}').format(self.shape[0], targetfilter))
-
-            # transform magnitudes to BVRI, Vega system
-            # using Tonry et al. 2012, ApJ 750
-            g = self.data['gp1mag'].data
-            e_g = self.data['e_gp1mag'].data
-            r = self.data['rp1mag'].data
-            e_r = self.data['e_rp1mag'].data
-            i = self.data['ip1mag'].data
-            e_i = self.data['e_ip1mag'].data
-
-            B = (g + 0.212 + 0.556*(g-r) + 0.034*(g-r)**2)
-            Berr = np.sqrt(e_g**2 + 0.032**2)
-            V = (g + 0.005 - 0.536*(g-r) + 0.011*(g-r)**2)
-            Verr = np.sqrt(e_g**2 + 0.012**2)
-            R = (r - 0.137 - 0.108*(g-r) - 0.029*(g-r)**2)
-            Rerr = np.sqrt(e_r**2 + 0.015**2)
-            I = (i - 0.366 - 0.136*(g-r) - 0.018*(g-r)**2)
-            Ierr = np.sqrt(e_i**2 + 0.017**2)
-
-            self.data.add_column(Column(data=B, name='_Bmag', unit=u.mag))
-            self.data.add_column(Column(data=Berr, name='_e_Bmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=V, name='_Vmag', unit=u.mag))
-            self.data.add_column(Column(data=Verr, name='_e_Vmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=R, name='_Rmag', unit=u.mag))
-            self.data.add_column(Column(data=Rerr, name='_e_Rmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=I, name='_Imag', unit=u.mag))
-            self.data.add_column(Column(data=Ierr, name='_e_Imag',
-                                        unit=u.mag))
+        n_sources = self.from_arrow(table)
 
-            if '_transformed' not in self.catalogname:
-                self.catalogname += '_transformed'
-                self.history += ', {:d} transformed to {:s} (Vega)'.format(
-                    self.shape[0], targetfilter)
-                self.magsystem = 'Vega'
+        logging.info('read {:d} sources in {:d} columns from {:s}'.format(
+            n_sources, self.shape[1], filename))
 
-            logging.info(('{:d} sources sucessfully transformed '
-                          'to {:s}').format(self.shape[0], targetfilter))
+        return n_sources
 
-            return self.shape[0]
+    # filter transformations
 
-        # PANSTARRS to Sloan griz
-        elif ('PANSTARRS' in self.catalogname and
-              targetfilter in ['g', 'r', 'i', 'z']):
-
-            logging.info(('trying to transform {:d} PANSTARRS sources to '
-                          + '{:s}').format(self.shape[0], targetfilter))
-
-            # transform magnitudes to SDSS AB system
-            # using Tonry et al. 2012, ApJ 750
-
-            g = self.data['gp1mag'].data
-            e_g = self.data['e_gp1mag'].data
-            r = self.data['rp1mag'].data
-            e_r = self.data['e_rp1mag'].data
-            i = self.data['ip1mag'].data
-            e_i = self.data['e_ip1mag'].data
-            z = self.data['zp1mag'].data
-            e_z = self.data['e_zp1mag'].data
-
-            g_sdss = (g + 0.013 + 0.145*(g-r) + 0.019*(g-r)**2)
-            gerr_sdss = np.sqrt(e_g**2 + 0.008**2)
-            r_sdss = (r - 0.001 + 0.004*(g-r) + 0.007*(g-r)**2)
-            rerr_sdss = np.sqrt(e_r**2 + 0.004**2)
-            i_sdss = (i - 0.005 + 0.011*(g-r) + 0.010*(g-r)**2)
-            ierr_sdss = np.sqrt(e_i**2 + 0.004**2)
-            z_sdss = (z + 0.013 - 0.039*(g-r) - 0.012*(g-r)**2)
-            zerr_sdss = np.sqrt(e_z**2 + 0.01**2)
-
-            self.data.add_column(Column(data=g_sdss, name='_gmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=gerr_sdss, name='_e_gmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=r_sdss, name='_rmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=rerr_sdss, name='_e_rmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=i_sdss, name='_imag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=ierr_sdss, name='_e_imag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=z_sdss, name='_zmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=zerr_sdss, name='_e_zmag',
-                                        unit=u.mag))
+    def transform_filters(self, targetfilter):
+        """
+        transform a given catalog into one or several different filter
+        bands using the transformations registered in `catalog_transform`;
+        crop the resulting catalog to only those sources that have
+        transformed magnitudes; transformed magnitudes start with an
+        underscore
+        input: targetfilter name or list of names
+        return: number of transformed magnitudes
+        """
 
-            if '_transformed' not in self.catalogname:
-                self.catalogname += '_transformed'
-                self.history += ', {:d} transformed to {:s} (AB)'.format(
-                    self.shape[0], targetfilter)
-                self.magsystem = 'AB'
+        if len(self.data) == 0:
+            return 0
 
-            logging.info(('{:d} sources sucessfully transformed '
-                          'to {:s}').format(self.shape[0], targetfilter))
+        if isinstance(targetfilter, str):
+            targetfilters = [targetfilter]
+        else:
+            targetfilters = list(targetfilter)
 
+        # check if these transformations have already been done
+        missing = [band for band in targetfilters
+                   if '_'+band+'mag' not in self.fields]
+        if len(missing) == 0:
+            logging.info(', '.join(targetfilters) + ' already available')
             return self.shape[0]
 
-        # SDSS to UKIRT Z
-        elif (self.catalogname.find('SDSS') > -1) and \
-                targetfilter == 'Z_UKIRT' and \
-                self.catalogname == 'AB':
+        found = catalog_transform.find_transformations(
+            self.catalogname, getattr(self, 'magsystem', None), missing)
+        available = [band for trans, bands in found for band in bands]
+        if len(found) == 0 or len(available) < len(missing):
+            if self.display:
+                print(('ERROR: no transformation from {:s} to '
+                       '{:s} available').format(
+                           self.catalogname,
+                           ', '.join([band for band in missing
+                                      if band not in available])))
+            return 0
 
-            logging.info(('trying to transform {:d} SDSS sources to '
-                          + 'UKIRT Z').format(self.shape[0]))
+        for trans, bands in found:
 
-            # transformations using the recipe by Hodgkin et al. 2009, MNRAS
-            # select sources for input catalog
-            mags = [self['zmag'].data, self['imag'].data,
-                    self['e_zmag'].data]
-            lbl = {'_Zmag': 0, '_e_Zmag': 1}
-            nmags = [np.zeros(self.shape[0]) for i in range(len(lbl))]
+            logging.info(('trying to transform {:d} {:s} sources to '
+                          '{:s}').format(self.shape[0], self.catalogname,
+                                         ', '.join(bands)))
 
-            for idx in range(self.shape[0]):
-                # transformations according to Hewett et al. 2006, MNRAS
-                # (slope is average of III and V classes)
-                nmags[lbl['_Zmag']][idx] = mags[0][idx] - 0.01 + 0.06 * \
-                    (mags[1][idx]-mags[0][idx])-0.528
-                nmags[lbl['_e_Zmag']][idx] = mags[2][idx]
+            keep, mags = catalog_transform.derive_magnitudes(
+                self.data, trans, bands)
+            if np.sum(keep) == 0:
+                logging.warning(('no suitable stars for transformation '
+                                 'to {:s}').format(', '.join(bands)))
+                return 0
 
-            # append nmags arrays to catalog
-            for key, idx in list(lbl.items()):
-                self.add_field(key, nmags[idx])
+            # add all bands provided by this transformation
+            for band in trans['bands']:
+                for key in [band, 'e_'+band]:
+                    if '_'+key+'mag' in self.fields:
+                        self.data.remove_column('_'+key+'mag')
+                    column = (MaskedColumn if np.ma.is_masked(mags[key])
+                              else Column)
+                    self.data.add_column(column(mags[key],
+                                                name='_'+key+'mag',
+                                                unit=u.mag))
 
             # get rid of sources that have not been transformed
-            self.data = self.data[self['_Zmag'] < 99]
-
-            self.catalogname += '_transformed'
-            self.history += ', {:d} transformed to UKIRT Z (Vega)'.format(
-                self.shape[0])
-            self.magsystem = 'AB (ugriz), Z_UKIRT (Vega)'
-
-            logging.info(('{:d} sources sucessfully transformed to '
-                          'UKIRT Z').format(self.shape[0]))
-
-            return self.shape[0]
-
-        # Gaia DR2+ to Johnson Cousins VRI
-        elif ('GAIA' in self.catalogname and
-              targetfilter in ['V', 'R', 'I']):
-
-            logging.info(('trying to transform {:d} GAIA sources to '
-                          + '{:s}').format(self.shape[0], targetfilter))
-
-            # transform magnitudes to Johnson-Cousins, Vega system
-            # using http://gea.esac.esa.int/archive/documentation/GDR2/Data_processing/chap_cu5pho/sec_cu5pho_calibr/ssec_cu5pho_PhotTransf.html
-
-            colormask = ((self.data['BPmag']-self.data['RPmag'] > -0.5) &
-                         (self.data['BPmag']-self.data['RPmag'] < 2.75))
-            self.data = self.data[colormask]
-
-            g = self.data['Gmag'].data
-            e_g = self.data['e_Gmag'].data
-            bp = self.data['BPmag'].data
-            rp = self.data['RPmag'].data
-
-            V = g - (-0.0176 - 0.00686*(bp-rp) - 0.1732*(bp-rp)**2)
-            e_V = np.sqrt(e_g**2 + 0.045858**2)
-            R = g - (-0.003226 + 0.3833*(bp-rp) - 0.1345*(bp-rp)**2)
-            e_R = np.sqrt(e_g**2 + 0.04840**2)
-            I = g - (0.02085 + 0.7419*(bp-rp) - 0.09531*(bp-rp)**2)
-            e_I = np.sqrt(e_g**2 + 0.04956**2)
-
-            self.data.add_column(Column(data=V, name='_Vmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=e_V, name='_e_Vmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=R, name='_Rmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=e_R, name='_e_Rmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=I, name='_Imag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=e_I, name='_e_Imag',
-                                        unit=u.mag))
+            if not np.all(keep):
+                self.data = self.data[keep]
 
             if '_transformed' not in self.catalogname:
                 self.catalogname += '_transformed'
-                self.history += ', {:d} transformed to {:s} (Vega)'.format(
-                    self.shape[0], targetfilter)
-                self.magsystem = 'Vega'
+                self.magsystem = trans['magsystem_out'].format(
+                    ', '.join(bands))
+                self.history += ', {:d} transformed to {:s} ({:s})'.format(
+                    self.shape[0], ', '.join(bands), self.magsystem)
 
-            logging.info(
-                '{:d} sources sucessfully transformed to {:s}'.format(
-                    self.shape[0], targetfilter))
-
-            return self.shape[0]
-
-        # Gaia DR2+ to SDSS
-        elif ('GAIA' in self.catalogname and
-              targetfilter in ['g', 'r', 'i']):
-
-            logging.info(('trying to transform {:d} GAIA sources to '
-                          + '{:s}').format(self.shape[0], targetfilter))
-
-            # transform magnitudes to Johnson-Cousins, Vega system
-            # using http://gea.esac.esa.int/archive/documentation/GDR2/Data_processing/chap_cu5pho/sec_cu5pho_calibr/ssec_cu5pho_PhotTransf.html
-
-            if targetfilter == 'g':
-                colormask = ((self.data['BPmag']-self.data['RPmag'] > -0.5) &
-                             (self.data['BPmag']-self.data['RPmag'] < 2.0))
-            elif targetfilter == 'r':
-                colormask = ((self.data['BPmag']-self.data['RPmag'] > 0.2) &
-                             (self.data['BPmag']-self.data['RPmag'] < 2.7))
-            elif targetfilter == 'i':
-                colormask = ((self.data['BPmag']-self.data['RPmag'] > 0) &
-                             (self.data['BPmag']-self.data['RPmag'] < 4.5))
-
-            self.data = self.data[colormask]
-
-            g = self.data['Gmag'].data
-            e_g = self.data['e_Gmag'].data
-            bp = self.data['BPmag'].data
-            rp = self.data['RPmag'].data
-
-            g_sdss = g - (0.13518 - 0.46245*(bp-rp) -
-                          0.25171*(bp-rp)**2 + 0.021349*(bp-rp)**3)
-            e_g_sdss = np.sqrt(e_g**2 + 0.16497**2)
-            r_sdss = g - (-0.12879 + 0.24662*(bp-rp) -
-                          0.027464*(bp-rp)**2 - 0.049465*(bp-rp)**3)
-            e_r_sdss = np.sqrt(e_g**2 + 0.066739**2)
-            i_sdss = g - (-0.29676 + 0.64728*(bp-rp) - 0.10141*(bp-rp)**2)
-            e_i_sdss = np.sqrt(e_g**2 + 0.098957**2)
-
-            self.data.add_column(Column(data=g_sdss, name='_gmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=e_g_sdss, name='_e_gmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=r_sdss, name='_rmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=e_r_sdss, name='_e_rmag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=i_sdss, name='_imag',
-                                        unit=u.mag))
-            self.data.add_column(Column(data=e_i_sdss, name='_e_imag',
-                                        unit=u.mag))
-
-            if '_transformed' not in self.catalogname:
-                self.catalogname += '_transformed'
-                self.history += ', {:d} transformed to {:s} (AB)'.format(
-                    self.shape[0], targetfilter)
-                self.magsystem = 'AB'
-
-            logging.info(
-                '{:d} sources sucessfully transformed to {:s}'.format(
-                    self.shape[0], targetfilter))
-
-            return self.shape[0]
+            logging.info(('{:d} sources sucessfully '
+                          'transformed to {:s}').format(self.shape[0],
+                                                        ', '.join(bands)))
 
-        else:
-            if self.display:
-                print(('ERROR: no transformation from {:s} to '
-                       '{:s} available').format(self.catalogname,
-                                                targetfilter))
-            return 0
+        return self.shape[0]
 
     # catalog operations
 
@@ -1477,67 +1676,72 @@ class catalog(object):
                    match_keys_other_catalog=['ra_deg', 'dec_deg'],
                    extract_this_catalog=['ra_deg', 'dec_deg'],
                    extract_other_catalog=['ra_deg', 'dec_deg'],
-                   tolerance=0.5/3600):
-        """ match sources from different catalogs based on two fields
-            (e.g., postions)
+                   tolerance=0.5/3600, select_this_catalog=None):
+        """ match sources from different catalogs based on positions
+            (match keys: RA and Dec in degrees); tolerance in degrees
+            tolerance == None: find the closest source in `catalog` for
+                               each source in this catalog
+            select_this_catalog: boolean array; only consider these
+                                 sources of this catalog (None: all)
             return: requested fields for matched sources
-            note: will only match exclusive pairs
-
-            TBD: replace this routine with something that uses
-                 astropy.table functionality; how about astropy.coord matching?
+            note: will only match exclusive pairs; matched sources with
+                  nan values in any of the extracted fields are rejected;
+                  the spatial index of this catalog is reused, so
+                  matching many catalogs against this catalog builds
+                  only one kd-tree
         """
 
-        this_tree = spatial.KDTree(list(zip(self[match_keys_this_catalog[0]].data,
-                                            self[match_keys_this_catalog[1]].data)))
+        other_ra = np.asarray(catalog[match_keys_other_catalog[0]],
+                              dtype=float)
+        other_dec = np.asarray(catalog[match_keys_other_catalog[1]],
+                               dtype=float)
 
-        # kd-tree matching
         if tolerance is not None:
-            other_tree = spatial.KDTree(
-                list(zip(catalog[match_keys_other_catalog[0]].data,
-                         catalog[match_keys_other_catalog[1]].data)))
-
-            match = this_tree.query_ball_tree(other_tree, tolerance)
-
-            indices_this_catalog = [x for x in range(
-                len(match)) if len(match[x]) == 1]
-            indices_other_catalog = [x[0] for x in list(
-                filter((lambda x: len(x) == 1), match))]
-
+            indices_this_catalog, indices_other_catalog = \
+                catalog_match.match_exclusive(
+                    None, None, other_ra, other_dec, tolerance,
+                    tree1=self.spatial_index(*match_keys_this_catalog))
+            # counterparts are counted for each source in this catalog,
+            # hence selecting sources before or after matching is equal
+            if select_this_catalog is not None:
+                selected = np.asarray(select_this_catalog)[
+                    indices_this_catalog]
+                indices_this_catalog = indices_this_catalog[selected]
+                indices_other_catalog = indices_other_catalog[selected]
+        elif select_this_catalog is not None:
+            # will find the closest match for each selected target
+            selected = np.where(select_this_catalog)[0]
+            indices_this_catalog, indices_other_catalog = \
+                catalog_match.match_nearest(
+                    np.asarray(self[match_keys_this_catalog[0]],
+                               dtype=float)[selected],
+                    np.asarray(self[match_keys_this_catalog[1]],
+                               dtype=float)[selected],
+                    other_ra, other_dec)
+            indices_this_catalog = selected[indices_this_catalog]
         else:
             # will find the closest match for each target in this catalog
-            other_cat = list(zip(catalog[match_keys_other_catalog[0]].data,
-                                 catalog[match_keys_other_catalog[1]].data))
-
-            match = this_tree.query(other_cat)
-
-            indices_this_catalog, indices_other_catalog = [], []
-
-            for target_idx in range(self.shape[0]):
-                other_cat_indices = np.where(match[1] == target_idx)[0]
-                if len(other_cat_indices) > 0:
-                    # find closest match
-                    min_idx = other_cat_indices[np.argmin(
-                        [match[0][i] for i in other_cat_indices])]
-
-                    indices_this_catalog.append(target_idx)
-                    indices_other_catalog.append(min_idx)
-
-        # match outputs based on indices provided and require
-        # extract_fields to be filled
-        assert len(indices_this_catalog) == len(indices_other_catalog)
-        indices = list(zip(indices_this_catalog, indices_other_catalog))
-        # check if element is either not nan or not a float
-
-        def check_not_nan(x): return not np.isnan(x) if \
-            (type(x) is np.float_) else True
-
-        indices = [i for i in indices if all([check_not_nan(self[i[0]][key])
-                                              for key in extract_this_catalog]
-                                             + [check_not_nan(catalog[i[1]][key])
-                                                for key in extract_other_catalog])]
-        output_this_catalog = [self[key][[i[0] for i in indices]]
+            indices_this_catalog, indices_other_catalog = \
+                catalog_match.match_nearest(
+                    None, None, other_ra, other_dec,
+                    tree1=self.spatial_index(*match_keys_this_catalog))
+
+        # require extract fields to be filled (not nan)
+        valid = np.ones(len(indices_this_catalog), dtype=bool)
+        for cat, keys, indices in [
+                (self, extract_this_catalog, indices_this_catalog),
+                (catalog, extract_other_catalog, indices_other_catalog)]:
+            for key in keys:
+                if not np.issubdtype(cat[key].dtype, np.floating):
+                    continue
+                valid &= ~(np.isnan(np.ma.getdata(cat[key])[indices]) &
+                           ~np.ma.getmaskarray(cat[key])[indices])
+        indices_this_catalog = indices_this_catalog[valid]
+        indices_other_catalog = indices_other_catalog[valid]
+
+        output_this_catalog = [self[key][indices_this_catalog]
                                for key in extract_this_catalog]
-        output_other_catalog = [catalog[key][[i[1] for i in indices]]
+        output_other_catalog = [catalog[key][indices_other_catalog]
                                 for key in extract_other_catalog]
 
         return [output_this_catalog, output_other_catalog]
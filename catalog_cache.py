@@ -0,0 +1,275 @@
+""" CATALOG_CACHE - local on-disk cache for reference catalog queries
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3 as sql
+
+import numpy as np
+from astropy.table import Table
+
+# pipeline-specific modules
+import _pp_conf
+from pp_setup import confcatalog as conf
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+
+def angular_separation(ra1_deg, dec1_deg, ra2_deg, dec2_deg):
+    """angular separation (deg) between two positions (haversine formula)"""
+    ra1, dec1, ra2, dec2 = [np.deg2rad(x) for x in
+                            (ra1_deg, dec1_deg, ra2_deg, dec2_deg)]
+    hav = (np.sin((dec2-dec1)/2)**2 +
+           np.cos(dec1)*np.cos(dec2)*np.sin((ra2-ra1)/2)**2)
+    return np.rad2deg(2*np.arcsin(np.sqrt(np.clip(hav, 0, 1))))
+
+
+class Catalog_Cache():
+    """local cache for catalog queries
+
+    Each query result is stored as a FITS table in `conf.cache_path`;
+    query parameters are kept in a sqlite index file. A query is served
+    from the cache if a cached query with the same catalog fully contains
+    it. The cache size is bounded by `conf.cache_max_size`; least
+    recently used results are removed first.
+    """
+
+    index_filename = 'catalogs.db'
+
+    def __init__(self, path=None, max_size=None):
+        self._path = path
+        self._max_size = max_size
+
+    @property
+    def path(self):
+        if self._path is not None:
+            return self._path
+        return conf.cache_path
+
+    @property
+    def max_size(self):
+        """maximum cache size in bytes"""
+        if self._max_size is not None:
+            return self._max_size
+        return conf.cache_max_size*1024**2
+
+    def connect(self):
+        """open cache index database (create it, if necessary)"""
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        db_conn = sql.connect(os.path.join(self.path, self.index_filename),
+                              timeout=60)
+        db_conn.execute(('CREATE TABLE IF NOT EXISTS queries ('
+                         'filename TEXT PRIMARY KEY, catalogname TEXT, '
+                         'ra_deg REAL, dec_deg REAL, rad_deg REAL, '
+                         'max_sources INTEGER, max_mag REAL, '
+                         'n_sources INTEGER, complete INTEGER, '
+                         'size INTEGER, last_access REAL)'))
+        return db_conn
+
+    def retrieve(self, catalogname, ra_deg, dec_deg, rad_deg, max_sources,
+                 max_mag=None, mag_key=None, exact=False):
+        """
+        retrieve the result of a catalog query from the cache
+        input: catalogname, ra_deg, dec_deg, rad_deg, max_sources
+               (None: no limit), max_mag (None: no limit), mag_key (field
+               the magnitude limit applies to), exact (only serve
+               identical queries)
+        return: astropy table (None, if not available), completeness
+                flag (False, if the data are known to be truncated by a
+                row limit)
+        """
+
+        try:
+            db_conn = self.connect()
+        except (OSError, sql.Error) as e:
+            logging.warning('cannot access catalog cache: {:s}'.format(
+                str(e)))
+            return None, False
+
+        entries = db_conn.execute(
+            ('SELECT filename, ra_deg, dec_deg, rad_deg, max_sources, '
+             'max_mag, complete FROM queries WHERE catalogname=? '
+             'ORDER BY rad_deg'), (catalogname,)).fetchall()
+
+        for (filename, c_ra, c_dec, c_rad, c_max_sources,
+             c_max_mag, complete) in entries:
+
+            identical = (np.isclose(c_ra, ra_deg, rtol=0, atol=1e-7) and
+                         np.isclose(c_dec, dec_deg, rtol=0, atol=1e-7) and
+                         np.isclose(c_rad, rad_deg, rtol=0, atol=1e-7) and
+                         c_max_sources == max_sources and
+                         c_max_mag == max_mag)
+
+            if not identical:
+                if exact or not complete:
+                    continue
+                # magnitude limit has to be at least as deep
+                if max_mag is None and c_max_mag is not None:
+                    continue
+                if (max_mag is not None and c_max_mag is not None and
+                        c_max_mag < max_mag):
+                    continue
+                # cached cone has to contain requested cone
+                if (angular_separation(c_ra, c_dec, ra_deg, dec_deg) +
+                        rad_deg > c_rad + 1e-9):
+                    continue
+
+            try:
+                data = Table.read(os.path.join(self.path, filename),
+                                  format='fits')
+            except (OSError, IOError):
+                # cached file is gone or corrupt; remove from index
+                db_conn.execute('DELETE FROM queries WHERE filename=?',
+                                (filename,))
+                db_conn.commit()
+                continue
+
+            if not identical:
+                # restrict cached data to requested cone
+                dist = angular_separation(ra_deg, dec_deg,
+                                          data['ra_deg'].data,
+                                          data['dec_deg'].data)
+                sel = dist <= rad_deg
+                if (mag_key is not None and max_mag is not None and
+                        mag_key in data.columns):
+                    sel &= np.less(np.ma.filled(data[mag_key].data,
+                                                np.nan), max_mag)
+                idc = np.where(sel)[0]
+                # enforce row limit, keep sources closest to the center
+                if max_sources is not None and len(idc) > max_sources:
+                    idc = np.sort(idc[np.argsort(dist[idc])[
+                        :int(max_sources)]])
+                    complete = False
+                data = data[idc]
+
+            db_conn.execute(('UPDATE queries SET last_access=? WHERE '
+                             'filename=?'), (time.time(), filename))
+            db_conn.commit()
+            db_conn.close()
+
+            logging.info(('{:d} {:s} sources retrieved from catalog cache '
+                          '({:s})').format(len(data), catalogname, filename))
+
+            return data, bool(complete)
+
+        db_conn.close()
+        return None, False
+
+    def store(self, catalogname, ra_deg, dec_deg, rad_deg, max_sources,
+              max_mag, data, n_queried=None, meta=None):
+        """
+        add the result of a catalog query to the cache
+        input: catalogname, ra_deg, dec_deg, rad_deg, max_sources (None: no
+               limit), max_mag (None: no limit), data (astropy table),
+               n_queried (number of rows returned by the server before
+               any further filtering), meta (dictionary of strings kept
+               with the data; FITS header keywords)
+        return: cache filename or None
+        """
+
+        if n_queried is None:
+            n_queried = len(data)
+        complete = max_sources is None or n_queried < max_sources
+
+        key = '{:s}|{:.7f}|{:.7f}|{:.7f}|{:s}|{:s}'.format(
+            catalogname, ra_deg, dec_deg, rad_deg, str(max_sources),
+            str(max_mag))
+        filename = '{:s}_{:s}.fits'.format(
+            catalogname.translate(_pp_conf.target2filename),
+            hashlib.md5(key.encode('utf-8')).hexdigest()[:16])
+
+        try:
+            db_conn = self.connect()
+            # strip metadata that cannot be represented in FITS headers
+            write_table = data.copy(copy_data=False)
+            write_table.meta = {} if meta is None else dict(meta)
+            tmp_filename = os.path.join(self.path, filename+'.tmp')
+            write_table.write(tmp_filename, format='fits', overwrite=True)
+            os.replace(tmp_filename, os.path.join(self.path, filename))
+        except (OSError, IOError, sql.Error) as e:
+            logging.warning('cannot write to catalog cache: {:s}'.format(
+                str(e)))
+            return None
+
+        db_conn.execute(('INSERT OR REPLACE INTO queries VALUES '
+                         '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'),
+                        (filename, catalogname, float(ra_deg),
+                         float(dec_deg), float(rad_deg),
+                         None if max_sources is None else int(max_sources),
+                         None if max_mag is None else float(max_mag),
+                         len(data), int(complete),
+                         os.path.getsize(os.path.join(self.path, filename)),
+                         time.time()))
+        db_conn.commit()
+
+        logging.info('{:d} {:s} sources added to catalog cache ({:s})'.format(
+            len(data), catalogname, filename))
+
+        self.evict(db_conn)
+        db_conn.close()
+
+        return filename
+
+    def evict(self, db_conn=None):
+        """remove least recently used cache entries until the cache size
+        is below `max_size`"""
+
+        close = db_conn is None
+        if db_conn is None:
+            db_conn = self.connect()
+
+        entries = db_conn.execute(('SELECT filename, size FROM queries '
+                                   'ORDER BY last_access DESC')).fetchall()
+        total_size = 0
+        for idx, (filename, size) in enumerate(entries):
+            total_size += size
+            # always keep the most recently used entry
+            if idx > 0 and total_size > self.max_size:
+                if os.path.exists(os.path.join(self.path, filename)):
+                    os.remove(os.path.join(self.path, filename))
+                db_conn.execute('DELETE FROM queries WHERE filename=?',
+                                (filename,))
+                logging.info('removed {:s} from catalog cache'.format(
+                    filename))
+        db_conn.commit()
+
+        if close:
+            db_conn.close()
+
+    def clear(self):
+        """remove all entries from the cache"""
+        db_conn = self.connect()
+        for (filename,) in db_conn.execute(
+                'SELECT filename FROM queries').fetchall():
+            if os.path.exists(os.path.join(self.path, filename)):
+                os.remove(os.path.join(self.path, filename))
+        db_conn.execute('DELETE FROM queries')
+        db_conn.commit()
+        db_conn.close()
+
+
+cache = Catalog_Cache()
@@ -0,0 +1,190 @@
+""" CATALOG_MATCH - spherical cross-matching of source positions
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import sys
+from itertools import chain
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    print('Module scipy not found. Please install with: pip install scipy')
+    sys.exit()
+
+# Positions are matched as unit vectors in 3d; distances in the trees
+# are chord lengths, which are monotonic in angular separation. This
+# avoids distortions due to cos(dec) and discontinuities at RA=0 and
+# the poles. Sources with non-finite positions are not part of any
+# tree and are never matched.
+
+# Sources can be matched within groups (e.g., frames of a sequence) by
+# adding the group index times `group_spacing` as a fourth coordinate;
+# as chord lengths never exceed 2, sources in different groups are
+# never closer than sources in the same group.
+group_spacing = 10.
+
+
+class Tree(cKDTree):
+    """kd-tree on the finite positions of a set of sources; `index` is
+    the index of each tree point in the full set"""
+
+    def __init__(self, points, index):
+        super().__init__(points)
+        self.index = np.asarray(index, dtype=int)
+
+    def __reduce__(self):
+        return (Tree, (self.data, self.index))
+
+
+def finite_positions(x, y):
+    """indices of finite positions"""
+    return np.where(np.isfinite(np.asarray(x, dtype=float)) &
+                    np.isfinite(np.asarray(y, dtype=float)))[0]
+
+
+def unit_vectors(ra_deg, dec_deg):
+    """unit vectors (N x 3) for positions in degrees"""
+    ra = np.deg2rad(np.asarray(ra_deg, dtype=float))
+    dec = np.deg2rad(np.asarray(dec_deg, dtype=float))
+    return np.column_stack([np.cos(dec)*np.cos(ra),
+                            np.cos(dec)*np.sin(ra),
+                            np.sin(dec)])
+
+
+def angle_to_chord(angle_deg):
+    """chord length for an angular separation in degrees"""
+    return 2*np.sin(np.deg2rad(np.minimum(angle_deg, 180))/2)
+
+
+def chord_to_angle(chord):
+    """angular separation in degrees for a chord length"""
+    return np.rad2deg(2*np.arcsin(np.clip(chord/2, 0, 1)))
+
+
+def group_vectors(vectors, groups):
+    """add group coordinate to unit vectors"""
+    return np.column_stack([vectors,
+                            group_spacing*np.asarray(groups, dtype=float)])
+
+
+def build_tree(ra_deg, dec_deg, groups=None):
+    """kd-tree on unit vectors for finite positions in degrees (and group
+    indices, if provided)"""
+    finite = finite_positions(ra_deg, dec_deg)
+    vectors = unit_vectors(np.asarray(ra_deg, dtype=float)[finite],
+                           np.asarray(dec_deg, dtype=float)[finite])
+    if groups is not None:
+        vectors = group_vectors(vectors, np.asarray(groups)[finite])
+    return Tree(vectors, finite)
+
+
+def match_exclusive(ra1, dec1, ra2, dec2, tolerance, tree1=None,
+                    tree2=None):
+    """
+    match sources in the first set that have exactly one counterpart in
+    the second set within tolerance
+    input: ra1, dec1, ra2, dec2 (deg), tolerance (deg),
+           tree1, tree2 (tree of first or second set; if tree1 is
+           provided, the second set is queried against it, otherwise
+           the first set is queried against tree2, which is built if
+           necessary)
+    return: index arrays into first and second set (sorted by first index)
+    """
+    radius = angle_to_chord(tolerance)
+    empty = np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    if tree1 is not None:
+        finite2 = finite_positions(ra2, dec2)
+        if len(finite2) == 0 or tree1.n == 0:
+            return empty
+        vectors2 = unit_vectors(np.asarray(ra2, dtype=float)[finite2],
+                                np.asarray(dec2, dtype=float)[finite2])
+
+        # all pairs within tolerance; count counterparts for each source
+        # in the first set
+        neighbors = tree1.query_ball_point(vectors2, radius)
+        n_neighbors = np.fromiter(map(len, neighbors), dtype=int,
+                                  count=len(neighbors))
+        pairs1 = np.fromiter(chain.from_iterable(neighbors), dtype=int,
+                             count=np.sum(n_neighbors))
+        pairs2 = np.repeat(np.arange(len(vectors2)), n_neighbors)
+        exclusive = np.bincount(pairs1, minlength=tree1.n)[pairs1] == 1
+        order = np.argsort(pairs1[exclusive])
+        return (tree1.index[pairs1[exclusive][order]],
+                finite2[pairs2[exclusive][order]])
+
+    if tree2 is None:
+        tree2 = build_tree(ra2, dec2)
+    finite1 = finite_positions(ra1, dec1)
+    if len(finite1) == 0 or tree2.n == 0:
+        return empty
+    vectors1 = unit_vectors(np.asarray(ra1, dtype=float)[finite1],
+                            np.asarray(dec1, dtype=float)[finite1])
+
+    n_neighbors = tree2.query_ball_point(vectors1, radius,
+                                         return_length=True)
+    idx1 = np.where(n_neighbors == 1)[0]
+    dist, idx2 = tree2.query(vectors1[idx1], k=1)
+
+    return finite1[idx1], tree2.index[np.asarray(idx2, dtype=int)]
+
+
+def match_nearest(ra1, dec1, ra2, dec2, tree1=None, groups1=None,
+                  groups2=None):
+    """
+    assign each source in the second set to the closest source in the
+    first set; for each source in the first set, keep the closest of the
+    sources assigned to it
+    input: ra1, dec1, ra2, dec2 (deg), tree1 (tree of first set, built
+           if None), groups1, groups2 (group indices of both sets; if
+           provided, only sources in the same group are matched)
+    return: index arrays into first and second set (sorted by first index)
+    """
+    if tree1 is None:
+        tree1 = build_tree(ra1, dec1, groups1)
+    finite = finite_positions(ra2, dec2)
+    if len(finite) == 0 or tree1.n == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    vectors2 = unit_vectors(np.asarray(ra2, dtype=float)[finite],
+                            np.asarray(dec2, dtype=float)[finite])
+    if groups2 is not None:
+        vectors2 = group_vectors(vectors2, np.asarray(groups2)[finite])
+
+    dist, nearest = tree1.query(vectors2, k=1)
+    valid = np.isfinite(dist)
+    if groups2 is not None:
+        # groups without sources in the first set
+        valid &= dist < group_spacing/2
+    finite, dist, nearest = finite[valid], dist[valid], nearest[valid]
+
+    # group by nearest source in first set, closest first; ties are
+    # resolved in favor of the lower index in the second set
+    order = np.lexsort((finite, dist, nearest))
+    idx1, first = np.unique(nearest[order], return_index=True)
+
+    return tree1.index[idx1], finite[order][first]
+
+
+def build_pixel_tree(x, y):
+    """kd-tree on finite pixel positions"""
+    finite = finite_positions(x, y)
+    return Tree(np.column_stack([np.asarray(x, dtype=float)[finite],
+                                 np.asarray(y, dtype=float)[finite]]),
+                finite)
@@ -0,0 +1,214 @@
+""" CATALOG_STACK - sources of a sequence of frames in one catalog
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import logging
+
+import numpy as np
+from astropy.table import Table
+
+# pipeline-specific modules
+import _pp_conf
+import catalog_match
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+
+class Catalog_Stack():
+    """sources of several frame catalogs in one table
+
+    The requested fields of all catalogs are concatenated into a single
+    astropy table with an additional field `frame` (index of the catalog
+    in `catalogs`); sources of each frame are contiguous.
+    Rejections and new fields apply to all frames in single vectorized
+    operations; `unstack` writes the result back into the catalogs.
+    """
+
+    frame_key = 'frame'
+
+    def __init__(self, catalogs, fields=None):
+        """
+        input: catalogs, fields (None: all fields common to all
+               catalogs)
+        """
+        self.catalogs = list(catalogs)
+        if fields is None:
+            fields = ([] if len(self.catalogs) == 0 else
+                      [key for key in self.catalogs[0].fields
+                       if all([key in cat.fields
+                               for cat in self.catalogs[1:]])])
+        self.fields = list(fields)
+        self.added = []  # fields added to the stack
+
+        lengths = np.array([cat.shape[0] for cat in self.catalogs],
+                           dtype=int)
+        frames = np.repeat(np.arange(len(self.catalogs)), lengths)
+        # source index in its catalog
+        self.rows = np.arange(len(frames)) - np.repeat(
+            np.cumsum(lengths)-lengths, lengths)
+        self._set_bounds(frames)
+
+        columns = [self._concatenate(key) for key in self.fields]
+        self.data = Table(columns+[frames],
+                          names=self.fields+[self.frame_key], copy=False)
+
+    def _concatenate(self, key):
+        """concatenate field of all catalogs"""
+        if len(self.catalogs) == 0:
+            return np.zeros(0)
+        arrays = [cat[key] for cat in self.catalogs]
+        if any([isinstance(array, np.ma.MaskedArray) for array in arrays]):
+            return np.ma.concatenate(arrays)
+        return np.concatenate([np.asarray(array) for array in arrays])
+
+    def _set_bounds(self, frames):
+        """first and last+1 stack index of each frame"""
+        self.bounds = np.concatenate(
+            [[0], np.cumsum(np.bincount(frames,
+                                        minlength=len(self.catalogs)))])
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        """return: field"""
+        return self.data[key]
+
+    @property
+    def frames(self):
+        """frame index of each source"""
+        return self.data[self.frame_key]
+
+    def frame(self, idx):
+        """return: slice of the sources of frame idx"""
+        return slice(self.bounds[idx], self.bounds[idx+1])
+
+    # data manipulation functions
+
+    def reject_sources_other_than(self, condition):
+        """
+        reject sources in all frames based on condition
+        input: condition (boolean array)
+        return: number of sources left
+        """
+        n_raw = len(self)
+        self.data = self.data[condition]
+        self.rows = self.rows[condition]
+        self._set_bounds(self.frames)
+
+        logging.info('{:d} frames: reject {:d} sources'.format(
+            len(self.catalogs), n_raw-len(self)))
+
+        return len(self)
+
+    def reject_sources_with(self, condition):
+        """
+        reject sources in all frames based on condition
+        input: condition (boolean array)
+        return: number of sources rejected
+        """
+        n_raw = len(self)
+        self.reject_sources_other_than(~np.asarray(condition))
+        return n_raw - len(self)
+
+    def add_fields(self, field_names, field_arrays):
+        """
+        add fields (replace them, if they exist)
+        input: field_names, field_arrays
+        return: number of added fields
+        """
+        for name, array in zip(field_names, field_arrays):
+            if name in self.data.columns:
+                self.data.remove_column(name)
+            else:
+                self.fields.append(name)
+            if name not in self.added:
+                self.added.append(name)
+            self.data.add_column(np.asarray(array), name=name)
+        return len(field_arrays)
+
+    def apply_zeropoints(self, zp, zp_sig, mag_key, magerr_key,
+                         cal_key, calerr_key):
+        """
+        add calibrated magnitudes and uncertainties
+        input: zp, zp_sig (for each frame or one for all frames),
+               mag_key, magerr_key (instrumental magnitude fields),
+               cal_key, calerr_key (new fields)
+        return: number of calibrated sources
+        """
+        n_frames = len(self.catalogs)
+        zp = np.broadcast_to(np.asarray(zp, dtype=float), n_frames)
+        zp_sig = np.broadcast_to(np.asarray(zp_sig, dtype=float), n_frames)
+        self.add_fields([cal_key, calerr_key],
+                        [self[mag_key] + zp[self.frames],
+                         np.sqrt(self[magerr_key]**2 +
+                                 zp_sig[self.frames]**2)])
+        return len(self)
+
+    def unstack(self, fields=None):
+        """
+        write sources back into the catalogs: remove rejected sources
+        from the catalogs and add or replace fields
+        input: fields (None: fields added to the stack)
+        return: None
+        """
+        if fields is None:
+            fields = self.added
+        for idx, cat in enumerate(self.catalogs):
+            selection = self.frame(idx)
+            rows = self.rows[selection]
+            if len(rows) < cat.shape[0]:
+                cat.data = cat.data[rows]
+            for key in fields:
+                if key in cat.fields:
+                    cat.data.remove_column(key)
+                cat.add_field(key, self.data[key][selection])
+
+    # catalog operations
+
+    def match_nearest(self, ra_deg, dec_deg, frames, extract=None,
+                      keys=('ra_deg', 'dec_deg')):
+        """
+        identify the closest source in the same frame for each target;
+        equivalent to `catalog.match_with` with tolerance=None for each
+        frame
+        input: ra_deg, dec_deg, frames (frame index of each target),
+               extract (fields; matches with nan values in these fields
+               are rejected), keys (position fields)
+        return: index arrays into targets and stack (sorted by target
+                index)
+        """
+        idx_targets, idx_stack = catalog_match.match_nearest(
+            ra_deg, dec_deg,
+            np.asarray(self[keys[0]], dtype=float),
+            np.asarray(self[keys[1]], dtype=float),
+            groups1=frames, groups2=self.frames)
+
+        valid = np.ones(len(idx_stack), dtype=bool)
+        for key in (extract if extract is not None else []):
+            if not np.issubdtype(self[key].dtype, np.floating):
+                continue
+            valid &= ~(np.isnan(np.ma.getdata(self[key])[idx_stack]) &
+                       ~np.ma.getmaskarray(self[key])[idx_stack])
+
+        return idx_targets[valid], idx_stack[valid]
@@ -0,0 +1,338 @@
+""" CATALOG_STORE - per-run database of calibrated frame catalogs
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import logging
+import sqlite3 as sql
+from itertools import repeat
+
+import numpy as np
+from astropy.table import Table
+
+# pipeline-specific modules
+import _pp_conf
+from catalog import (catalog, database_names, sql_type, region_condition,
+                     sql_functions)
+from pp_setup import confcatalog as conf
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+
+# numpy types of SQLite column types
+column_types = {'REAL': float, 'INTEGER': int, 'TEXT': str}
+
+
+def column_array(values, dtype):
+    """numpy array from database values; NULL values are nan in float
+    fields and masked in other fields"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f' or None not in values:
+        return np.array(values, dtype=dtype)
+    mask = np.array([value is None for value in values], dtype=bool)
+    filled = np.array([value for value in values if value is not None],
+                      dtype=dtype)
+    data = np.zeros(len(values), dtype=filled.dtype)
+    data[~mask] = filled
+    return np.ma.MaskedArray(data, mask=mask)
+
+
+class Catalog_Store():
+    """per-run database of frame catalogs
+
+    All frame catalogs of a run are kept in a single sqlite database
+    (`conf.photometry_store` in the working directory): table `frames`
+    holds one row per frame (the header information written by
+    `catalog.write_database`), table `sources` all sources of all frames,
+    identified by frame and source index. Columns are added to `sources`
+    as frames with new fields are written; the fields of each frame are
+    recorded in `frames`. Sources are indexed by frame, source index,
+    and position. Writing a frame again replaces its sources.
+    """
+
+    def __init__(self, filename=None):
+        self._filename = filename
+
+    @property
+    def filename(self):
+        if self._filename is not None:
+            return self._filename
+        return conf.photometry_store
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def connect(self):
+        """open store database (create it, if necessary)"""
+        db_conn = sql.connect(self.filename, timeout=60)
+        db_conn.execute('PRAGMA journal_mode=WAL')
+        db_conn.execute('PRAGMA synchronous=NORMAL')
+        db_conn.execute(('CREATE TABLE IF NOT EXISTS frames ('
+                         'frame_id INTEGER PRIMARY KEY, name TEXT UNIQUE, '
+                         'origin TEXT, description TEXT, magsys TEXT, '
+                         'obstime REAL, exptime REAL, obj TEXT, '
+                         'filtername TEXT, n_sources INTEGER, '
+                         'fields TEXT)'))
+        db_conn.execute(('CREATE TABLE IF NOT EXISTS sources ('
+                         'frame_id INTEGER, source_id INTEGER, '
+                         'ra_deg REAL, dec_deg REAL, '
+                         'PRIMARY KEY (frame_id, source_id))'))
+        db_conn.execute(('CREATE INDEX IF NOT EXISTS sources_source '
+                         'ON sources (source_id)'))
+        db_conn.execute(('CREATE INDEX IF NOT EXISTS sources_position '
+                         'ON sources (dec_deg, ra_deg)'))
+        sql_functions(db_conn)
+        return db_conn
+
+    @staticmethod
+    def columns(db_conn):
+        """return: dictionary of column names of table sources (lower
+        case) and their types"""
+        return {row[1].lower(): row[2] for row in
+                db_conn.execute('PRAGMA table_info(sources)')}
+
+    def write(self, cat, db_conn=None):
+        """
+        write catalog into store
+        input: catalog, db_conn (open store database; None: open store)
+        return: number of sources written
+        """
+
+        close = db_conn is None
+        if db_conn is None:
+            db_conn = self.connect()
+
+        fields = cat.database_fields()
+        names = database_names(fields)
+        arrays = [cat[key] for key in fields]
+        n_sources = cat.shape[0]
+
+        with db_conn:
+            existing = self.columns(db_conn)
+            for key, array in zip(fields, arrays):
+                if names[key].lower() not in existing:
+                    db_conn.execute(
+                        'ALTER TABLE sources ADD COLUMN "{:s}" {:s}'.format(
+                            names[key], sql_type(array.dtype)))
+
+            header = (cat.origin, cat.history, cat.magsys,
+                      cat.obstime[0], cat.obstime[1], cat.obj,
+                      cat.filtername, n_sources,
+                      json.dumps([[key, array.dtype.str] for key, array
+                                  in zip(fields, arrays)]))
+            frame = db_conn.execute('SELECT frame_id FROM frames '
+                                    'WHERE name=?',
+                                    (cat.catalogname,)).fetchone()
+            if frame is not None:
+                frame_id = frame[0]
+                db_conn.execute('DELETE FROM sources WHERE frame_id=?',
+                                (frame_id,))
+                db_conn.execute(('UPDATE frames SET origin=?, '
+                                 'description=?, magsys=?, obstime=?, '
+                                 'exptime=?, obj=?, filtername=?, '
+                                 'n_sources=?, fields=? WHERE frame_id=?'),
+                                header+(frame_id,))
+            else:
+                frame_id = db_conn.execute(
+                    ('INSERT INTO frames (name, origin, description, '
+                     'magsys, obstime, exptime, obj, filtername, '
+                     'n_sources, fields) VALUES (?,?,?,?,?,?,?,?,?,?)'),
+                    (cat.catalogname,)+header).lastrowid
+
+            # masked values and nan are stored as NULL
+            db_conn.executemany(
+                'INSERT INTO sources (frame_id, source_id, {:s}) '
+                'VALUES (?, ?, {:s})'.format(
+                    ', '.join(['"{:s}"'.format(names[key])
+                               for key in fields]),
+                    ', '.join(['?']*len(fields))),
+                zip(repeat(frame_id), range(n_sources),
+                    *[array.tolist() for array in arrays]))
+
+        if close:
+            db_conn.close()
+
+        logging.info('wrote {:d} sources from catalog {:s} to {:s}'.format(
+            n_sources, cat.catalogname, self.filename))
+
+        return n_sources
+
+    def write_catalogs(self, catalogs):
+        """
+        write catalogs into store; each frame is written in one
+        transaction
+        return: number of sources written
+        """
+        db_conn = self.connect()
+        n_sources = 0
+        for cat in catalogs:
+            n_sources += self.write(cat, db_conn=db_conn)
+        db_conn.close()
+        return n_sources
+
+    def frames(self):
+        """
+        return: list of frame names in store
+        """
+        if not self.exists():
+            return []
+        db_conn = self.connect()
+        names = [row[0] for row in
+                 db_conn.execute('SELECT name FROM frames ORDER BY obstime')]
+        db_conn.close()
+        return names
+
+    def read(self, name, cat=None, fields=None, region=None, db_conn=None):
+        """
+        read frame catalog from store
+        input: name (catalog name of the frame), cat (catalog to fill;
+               None: create new catalog), fields (see
+               `catalog.read_database`; None: all fields of this frame),
+               region (sky region of sources to be read, see
+               `catalog.sky_boxes`; None: all sources), db_conn (open
+               store database; None: open store)
+        return: catalog or None (frame not in store)
+        """
+
+        close = db_conn is None
+        if db_conn is None:
+            db_conn = self.connect()
+
+        frame = db_conn.execute(
+            ('SELECT frame_id, name, origin, description, magsys, '
+             'obstime, exptime, obj, filtername, fields FROM frames '
+             'WHERE name=?'), (name,)).fetchone()
+        if frame is None:
+            if close:
+                db_conn.close()
+            return None
+
+        if cat is None:
+            cat = catalog(name)
+        (cat.catalogname, cat.origin, cat.history, cat.magsys,
+         cat.obstime[0], cat.obstime[1], cat.obj,
+         cat.filtername) = frame[1:9]
+
+        dtypes = json.loads(frame[9])
+        if callable(fields):
+            dtypes = [[key, dtype] for key, dtype in dtypes
+                      if fields(cat, key)]
+        elif fields is not None:
+            dtypes = [[key, dtype] for key, dtype in dtypes
+                      if key in fields]
+        names = database_names([key for key, dtype in dtypes])
+
+        condition, parameters = '', []
+        if region is not None:
+            condition, parameters = region_condition(region)
+            condition = ' AND ' + condition
+
+        rows = db_conn.execute(
+            ('SELECT {:s} FROM sources WHERE frame_id=?{:s} '
+             'ORDER BY source_id').format(
+                 ', '.join(['"{:s}"'.format(names[key])
+                            for key, dtype in dtypes]), condition),
+            [frame[0]]+parameters).fetchall() if len(dtypes) > 0 else []
+        if close:
+            db_conn.close()
+
+        values = list(zip(*rows)) if len(rows) > 0 else [()]*len(dtypes)
+        cat.data = Table([column_array(column, dtype) for
+                          column, (key, dtype) in zip(values, dtypes)],
+                         names=[key for key, dtype in dtypes], copy=False)
+
+        return cat
+
+    def query(self, fields, where=None, parameters=()):
+        """
+        select sources from all frames
+        input: fields (field names), where (SQL condition on columns of
+               tables sources and frames; None: all sources),
+               parameters (SQL parameters of the condition)
+        return: astropy table with frame name (`frame`) and fields; fields
+                that are missing in some frames are NULL (nan or masked)
+        """
+        db_conn = self.connect()
+        names = database_names(fields)
+        types = self.columns(db_conn)
+        rows = db_conn.execute(
+            ('SELECT frames.name, {:s} FROM sources JOIN frames '
+             'USING (frame_id){:s} ORDER BY frames.obstime, '
+             'sources.frame_id, sources.source_id').format(
+                 ', '.join(['sources."{:s}"'.format(names[key])
+                            for key in fields]),
+                 '' if where is None else ' WHERE '+where),
+            parameters).fetchall()
+        db_conn.close()
+
+        values = list(zip(*rows)) if len(rows) > 0 else [()]*(len(fields)+1)
+        dtypes = [str]+[column_types.get(types[names[key].lower()], str)
+                        for key in fields]
+        return Table([column_array(column, dtype) for column, dtype
+                      in zip(values, dtypes)],
+                     names=['frame']+list(fields), copy=False)
+
+
+def read_catalogs(filenames, fields=None, region=None):
+    """
+    read calibrated catalogs of image files from the photometry store
+    or, if not available there, from their database files
+    input: image filenames, fields (see `catalog.read_database`; None:
+           all fields), region (sky region of sources to be read, see
+           `catalog.sky_boxes`; None: all sources)
+    return: list of catalogs
+    """
+
+    store = Catalog_Store()
+    db_conn = (store.connect() if conf.photometry_store is not None and
+               store.exists() else None)
+
+    catalogs = []
+    for filename in filenames:
+        ldac_filename = filename[:filename.find('.fit')]+'.ldac'
+        if db_conn is not None:
+            cat = store.read(ldac_filename, fields=fields, region=region,
+                             db_conn=db_conn)
+            if cat is not None:
+                catalogs.append(cat)
+                continue
+
+        filename = ldac_filename+'.db'
+        cat = catalog(filename)
+        try:
+            cat.read_database(filename, fields=fields, region=region)
+        except IOError:
+            logging.error('Cannot find database %s' % filename)
+            print('Cannot find database', filename)
+            continue
+        except sql.OperationalError:
+            logging.error('File %s is not a database file' % filename)
+            print('File %s is not a database file' % filename)
+            continue
+        catalogs.append(cat)
+
+    if db_conn is not None:
+        db_conn.close()
+
+    return catalogs
@@ -0,0 +1,429 @@
+""" CATALOG_TILES - HEALPix-tiled local reference catalog store
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import logging
+import sqlite3 as sql
+
+import numpy as np
+from astropy.table import Table, vstack, unique
+from astropy.io import fits
+import astropy.units as u
+
+# pipeline-specific modules
+import _pp_conf
+from pp_setup import confcatalog as conf
+from catalog_cache import angular_separation
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+# catalogs that can be served from the tile store
+tile_catalogs = ['GAIA', 'PANSTARRS', 'SDSS-R9', 'APASS9', '2MASS',
+                 'URAT-1', 'SkyMapper']
+
+
+# HEALPix (nested scheme) utilities; see Gorski et al. 2005, ApJ 622
+
+_jrll = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4])
+_jpll = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7])
+
+
+def _spread_bits(v):
+    """interleave bits of v with zeros"""
+    v = np.asarray(v, dtype=np.int64)
+    result = np.zeros_like(v)
+    for bit in range(30):
+        result |= ((v >> bit) & 1) << (2*bit)
+    return result
+
+
+def _compress_bits(v):
+    """inverse of _spread_bits"""
+    v = np.asarray(v, dtype=np.int64)
+    result = np.zeros_like(v)
+    for bit in range(30):
+        result |= ((v >> (2*bit)) & 1) << bit
+    return result
+
+
+def healpix_ang2pix(nside, ra_deg, dec_deg):
+    """HEALPix pixel index (nested scheme) for positions in degrees"""
+    ra_deg, dec_deg = np.broadcast_arrays(np.atleast_1d(ra_deg),
+                                          np.atleast_1d(dec_deg))
+    z = np.sin(np.deg2rad(dec_deg))
+    za = np.abs(z)
+    tt = np.mod(np.deg2rad(ra_deg)/(np.pi/2), 4.0)
+
+    ix = np.zeros(z.shape, dtype=np.int64)
+    iy = np.zeros(z.shape, dtype=np.int64)
+    face = np.zeros(z.shape, dtype=np.int64)
+
+    # equatorial region
+    eq = za <= 2/3
+    temp1 = nside*(0.5+tt[eq])
+    temp2 = nside*(z[eq]*0.75)
+    jp = (temp1-temp2).astype(np.int64)
+    jm = (temp1+temp2).astype(np.int64)
+    ifp = jp // nside
+    ifm = jm // nside
+    face[eq] = np.where(ifp == ifm, ifp | 4,
+                        np.where(ifp < ifm, ifp, ifm+8))
+    ix[eq] = jm & (nside-1)
+    iy[eq] = nside - (jp & (nside-1)) - 1
+
+    # polar caps
+    pol = ~eq
+    ntt = np.minimum(3, tt[pol].astype(np.int64))
+    tp = tt[pol] - ntt
+    tmp = nside*np.sqrt(3*(1-za[pol]))
+    jp = np.minimum((tp*tmp).astype(np.int64), nside-1)
+    jm = np.minimum(((1-tp)*tmp).astype(np.int64), nside-1)
+    north = z[pol] >= 0
+    face[pol] = np.where(north, ntt, ntt+8)
+    ix[pol] = np.where(north, nside-jm-1, jp)
+    iy[pol] = np.where(north, nside-jp-1, jm)
+
+    return face*nside**2 + _spread_bits(ix) + (_spread_bits(iy) << 1)
+
+
+def healpix_pix2xyf(nside, pix):
+    """decompose nested pixel index into (ix, iy, face)"""
+    pix = np.asarray(pix, dtype=np.int64)
+    face = pix // nside**2
+    ipf = pix % nside**2
+    return _compress_bits(ipf), _compress_bits(ipf >> 1), face
+
+
+def healpix_xyf2ang(x, y, face):
+    """convert continuous face coordinates (x, y in [0, 1]) into
+    (ra_deg, dec_deg)"""
+    x, y, face = np.broadcast_arrays(np.asarray(x, dtype=float),
+                                     np.asarray(y, dtype=float),
+                                     np.asarray(face))
+    jr = _jrll[face] - x - y
+    nr = np.where(jr < 1, jr, np.where(jr > 3, 4-jr, 1.))
+    z = np.where(jr < 1, 1-nr**2/3,
+                 np.where(jr > 3, nr**2/3-1, (2-jr)*2/3))
+    tmp = np.mod(_jpll[face]*nr + x - y, 8)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        phi = np.where(nr < 1e-15, 0, (np.pi/4)*tmp/nr)
+    return np.rad2deg(phi), np.rad2deg(np.arcsin(np.clip(z, -1, 1)))
+
+
+def healpix_boundaries(nside, pix, step=8):
+    """positions along the boundary of a HEALPix pixel (nested)"""
+    ix, iy, face = healpix_pix2xyf(nside, pix)
+    t = np.arange(step)/step
+    x = np.hstack([t, np.ones(step), 1-t, np.zeros(step)])
+    y = np.hstack([np.zeros(step), t, np.ones(step), 1-t])
+    return healpix_xyf2ang((ix+x)/nside, (iy+y)/nside, face)
+
+
+def offset_positions(ra_deg, dec_deg, dist_deg, bearing_deg):
+    """positions at given distances and bearings from a position"""
+    ra0, dec0 = np.deg2rad(ra_deg), np.deg2rad(dec_deg)
+    d, b = np.deg2rad(dist_deg), np.deg2rad(bearing_deg)
+    dec = np.arcsin(np.clip(np.sin(dec0)*np.cos(d) +
+                            np.cos(dec0)*np.sin(d)*np.cos(b), -1, 1))
+    ra = ra0 + np.arctan2(np.sin(b)*np.sin(d)*np.cos(dec0),
+                          np.cos(d)-np.sin(dec0)*np.sin(dec))
+    return np.mod(np.rad2deg(ra), 360), np.rad2deg(dec)
+
+
+class Tile_Store():
+    """local reference catalog store
+
+    Catalogs are split into HEALPix tiles (nested scheme); each tile is
+    stored as a FITS table `<path>/<catalog>/<nside>/<pixel>.fits`. A
+    sqlite coverage index keeps track of which tiles are available and
+    to which depth they are complete.
+    """
+
+    index_filename = 'coverage.db'
+
+    def __init__(self, path=None, nside=None):
+        self._path = path
+        self._nside = nside
+
+    @property
+    def path(self):
+        if self._path is not None:
+            return self._path
+        return conf.tile_store_path
+
+    @property
+    def nside(self):
+        if self._nside is not None:
+            return self._nside
+        return conf.tile_nside
+
+    def connect(self):
+        """open coverage index database (create it, if necessary)"""
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        db_conn = sql.connect(os.path.join(self.path, self.index_filename),
+                              timeout=60)
+        db_conn.execute(('CREATE TABLE IF NOT EXISTS tiles ('
+                         'catalogname TEXT, nside INTEGER, pix INTEGER, '
+                         'n_sources INTEGER, complete INTEGER, '
+                         'max_mag REAL, updated REAL, '
+                         'PRIMARY KEY (catalogname, nside, pix))'))
+        return db_conn
+
+    def tile_filename(self, catalogname, pix):
+        return os.path.join(self.path, catalogname, str(self.nside),
+                            '{:d}.fits'.format(pix))
+
+    def cone_tiles(self, ra_deg, dec_deg, rad_deg):
+        """
+        identify tiles that overlap with a cone
+        input: ra_deg, dec_deg, rad_deg
+        return: array of tile indices
+        """
+        # sample the cone interior on rings that are much finer than the
+        # tile size, the cone boundary is sampled more densely to catch
+        # tiles that only clip the cone
+        pixsize = np.rad2deg(np.sqrt(4*np.pi/(12*self.nside**2)))
+        step = pixsize/4
+        dists, bearings = [np.array([0.])], [np.array([0.])]
+        for dist in np.arange(step, rad_deg, step):
+            n = int(np.ceil(2*np.pi*dist/step))
+            dists.append(np.ones(n)*dist)
+            bearings.append(np.arange(n)*360/n)
+        n = max(16, int(np.ceil(2*np.pi*rad_deg/(pixsize/64))))
+        dists.append(np.ones(n)*rad_deg)
+        bearings.append(np.arange(n)*360/n)
+
+        ra, dec = offset_positions(ra_deg, dec_deg, np.hstack(dists),
+                                   np.hstack(bearings))
+
+        return np.unique(healpix_ang2pix(self.nside, ra, dec))
+
+    def tile_in_cone(self, pix, ra_deg, dec_deg, rad_deg):
+        """check whether a tile lies completely inside a cone"""
+        ra, dec = healpix_boundaries(self.nside, pix)
+        return np.all(angular_separation(ra_deg, dec_deg, ra, dec) <=
+                      rad_deg)
+
+    def missing_tiles(self, catalogname, tiles, max_mag=None):
+        """
+        identify tiles that are not (completely) covered
+        input: catalogname, tiles, max_mag (required depth, None: any)
+        return: array of tile indices that are missing or incomplete
+        """
+        db_conn = self.connect()
+        coverage = {pix: (complete, c_max_mag) for pix, complete, c_max_mag
+                    in db_conn.execute(
+                        ('SELECT pix, complete, max_mag FROM tiles WHERE '
+                         'catalogname=? AND nside=?'),
+                        (catalogname, self.nside)).fetchall()}
+        db_conn.close()
+
+        missing = []
+        for pix in tiles:
+            if pix not in coverage or not coverage[pix][0]:
+                missing.append(pix)
+            # max_mag == None: tile depth is unknown
+            elif (max_mag is not None and coverage[pix][1] is not None and
+                  coverage[pix][1] < max_mag):
+                missing.append(pix)
+
+        return np.array(missing, dtype=np.int64)
+
+    def read_tile(self, catalogname, pix):
+        filename = self.tile_filename(catalogname, pix)
+        if not os.path.exists(filename):
+            return None
+        return Table.read(filename, format='fits')
+
+    def assemble(self, catalogname, ra_deg, dec_deg, rad_deg,
+                 max_sources=None, max_mag=None, mag_key=None, tiles=None):
+        """
+        assemble a cone from tiles
+        input: catalogname, ra_deg, dec_deg, rad_deg, max_sources (None:
+               no limit), max_mag (None: no limit), mag_key (field the
+               magnitude limit applies to), tiles (tiles overlapping the
+               cone, derived if None)
+        return: astropy table (None, if no data available), completeness
+                flag (False, if tiles are missing or incomplete, or if
+                the data are truncated by the row limit)
+        """
+
+        if tiles is None:
+            tiles = self.cone_tiles(ra_deg, dec_deg, rad_deg)
+        complete = len(self.missing_tiles(catalogname, tiles,
+                                          max_mag)) == 0
+
+        data = [self.read_tile(catalogname, pix) for pix in tiles]
+        data = [dat for dat in data if dat is not None and len(dat) > 0]
+        if len(data) == 0:
+            return None, False
+        data = vstack(data, join_type='outer', metadata_conflicts='silent')
+
+        dist = angular_separation(ra_deg, dec_deg, data['ra_deg'].data,
+                                  data['dec_deg'].data)
+        sel = dist <= rad_deg
+        if (mag_key is not None and max_mag is not None and
+                mag_key in data.columns):
+            sel &= np.less(np.ma.filled(data[mag_key].data, np.nan),
+                           max_mag)
+        idc = np.where(sel)[0]
+        # enforce row limit, keep sources closest to the center
+        if max_sources is not None and len(idc) > max_sources:
+            idc = np.sort(idc[np.argsort(dist[idc])[:int(max_sources)]])
+            complete = False
+
+        logging.info(('{:d} {:s} sources assembled from {:d} tiles').format(
+            len(idc), catalogname, len(tiles)))
+
+        return data[idc], complete
+
+    def ingest(self, catalogname, data, ra_deg, dec_deg, rad_deg,
+               max_mag=None, complete=True):
+        """
+        add catalog data covering a cone to the tile store
+        input: catalogname, data (astropy table using PP column names),
+               ra_deg, dec_deg, rad_deg (cone covered by data),
+               max_mag (depth of data, None: unknown), complete (False,
+               if data are known to be incomplete, e.g., truncated)
+        return: number of tiles updated
+        """
+
+        data = data.copy()
+        data.meta = {}
+        pix = healpix_ang2pix(self.nside, data['ra_deg'].data,
+                              data['dec_deg'].data)
+
+        db_conn = self.connect()
+        n_tiles = 0
+        for tile in self.cone_tiles(ra_deg, dec_deg, rad_deg):
+            tile_data = data[pix == tile]
+            tile_complete = (complete and
+                             self.tile_in_cone(tile, ra_deg, dec_deg,
+                                               rad_deg))
+
+            record = db_conn.execute(
+                ('SELECT complete, max_mag FROM tiles WHERE '
+                 'catalogname=? AND nside=? AND pix=?'),
+                (catalogname, self.nside, int(tile))).fetchone()
+            if record is None and len(tile_data) == 0 and not tile_complete:
+                continue
+
+            # merge with existing tile data
+            existing = self.read_tile(catalogname, tile)
+            if existing is not None and len(existing) > 0:
+                tile_data = vstack([existing, tile_data], join_type='outer',
+                                   metadata_conflicts='silent')
+                if 'ident' in tile_data.columns:
+                    tile_data = unique(tile_data, keys='ident',
+                                       keep='first')
+                else:
+                    tile_data['_ra'] = np.round(tile_data['ra_deg'].data, 6)
+                    tile_data['_dec'] = np.round(tile_data['dec_deg'].data,
+                                                 6)
+                    tile_data = unique(tile_data, keys=['_ra', '_dec'],
+                                       keep='first')
+                    tile_data.remove_columns(['_ra', '_dec'])
+
+            # update coverage information
+            if record is not None and record[0]:
+                if tile_complete:
+                    tile_max_mag = (None if max_mag is None or
+                                    record[1] is None
+                                    else max(max_mag, record[1]))
+                else:
+                    tile_max_mag = record[1]
+                tile_complete = True
+            else:
+                tile_max_mag = max_mag
+
+            filename = self.tile_filename(catalogname, tile)
+            if not os.path.exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            tile_data.write(filename+'.tmp', format='fits', overwrite=True)
+            os.replace(filename+'.tmp', filename)
+
+            db_conn.execute(('INSERT OR REPLACE INTO tiles VALUES '
+                             '(?, ?, ?, ?, ?, ?, ?)'),
+                            (catalogname, self.nside, int(tile),
+                             len(tile_data), int(tile_complete),
+                             tile_max_mag, time.time()))
+            n_tiles += 1
+
+        db_conn.commit()
+        db_conn.close()
+
+        logging.info('{:d} {:s} sources ingested into {:d} tiles'.format(
+            len(data), catalogname, n_tiles))
+
+        return n_tiles
+
+
+def read_catalog_file(filename, catalogname):
+    """
+    read a reference catalog file for ingestion into the tile store;
+    supports FITS_LDAC files as written by `catalog.write_ldac` (*.cat)
+    and any table format readable by astropy using PP column names
+    return: astropy table
+    """
+
+    hdulist = fits.open(filename, ignore_missing_end=True)
+    if (len(hdulist) > 2 and
+            hdulist[2].header.get('EXTNAME') == 'LDAC_OBJECTS'):
+        data = Table(hdulist[2].data)
+        hdulist.close()
+        for ldac_key, key in [('XWIN_WORLD', 'ra_deg'),
+                              ('YWIN_WORLD', 'dec_deg'),
+                              ('ERRAWIN_WORLD', 'e_ra_deg'),
+                              ('ERRBWIN_WORLD', 'e_dec_deg'),
+                              ('MAG', 'mag')]:
+            if ldac_key in data.columns:
+                data.rename_column(ldac_key, key)
+        # MAGERR and OBSDATE are placeholders in write_ldac
+        for key in ['MAGERR', 'OBSDATE']:
+            if key in data.columns:
+                data.remove_column(key)
+        # recover primary magnitude for astrometric catalogs
+        if catalogname in ['GAIA', '2MASS'] and 'mag' in data.columns:
+            data[{'GAIA': 'Gmag', '2MASS': 'Jmag'}[catalogname]] = \
+                data['mag']
+    else:
+        hdulist.close()
+        data = Table.read(filename)
+
+    for key in ['e_ra_deg', 'e_dec_deg']:
+        if key not in data.columns:
+            continue
+        if data[key].unit is None:
+            data[key].unit = u.deg
+        else:
+            data[key] = data[key].to(u.deg)
+
+    data['ra_deg'] = np.mod(data['ra_deg'], 360)
+
+    return data
+
+
+store = Tile_Store()
@@ -0,0 +1,268 @@
+""" CATALOG_TRANSFORM - photometric transformations between filter systems
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import hashlib
+import operator
+import numpy as np
+
+# Each transformation derives magnitudes in a set of bands from the
+# magnitudes of one catalog:
+#   catalogs: substrings of catalog names the transformation applies to
+#   magsystem: required magnitude system of the catalog (None: any)
+#   select: criteria (term, operator, value) sources have to meet;
+#           terms are fields or differences of fields ('gmag-rmag')
+#   clip: (x term, y term, nsigma); reject sources that deviate by more
+#         than nsigma from a linear fit of y as a function of x
+#   bands: for each band
+#          mag: (base field, color term, polynomial coefficients in the
+#                color, lowest order first)
+#          err: ([(field, factor), ...], color scatter, systematic
+#                uncertainty); added in quadrature, the color scatter
+#                is multiplied with the color term
+#          select: additional criteria for this band (optional)
+#   magsystem_out: magnitude system after transformation ({:s}: bands)
+# Only sources that meet the criteria of the transformation and of all
+# requested bands are kept.
+
+transformations = [
+    # SDSS to BVRI; Chonis & Gaskell 2008, AJ, 135
+    {'catalogs': ('SDSS', 'SkyMapper'),
+     'magsystem': None,
+     'select': [('rmag-imag', '>', 0.08), ('rmag-imag', '<', 0.5),
+                ('gmag-rmag', '>', 0.2), ('gmag-rmag', '<', 1.4),
+                ('gmag', '>=', 14.5), ('gmag', '<', 19.5),
+                ('rmag', '>=', 14.5), ('rmag', '<', 19.5),
+                ('imag', '>=', 14.5), ('imag', '<', 19.5)],
+     'clip': ('rmag-imag', 'gmag-rmag', 3),
+     'bands': {
+         'B': {'mag': ('gmag', 'gmag-rmag', [0.216, 0.327]),
+               'err': ([('e_gmag', 1.327), ('e_rmag', 0.327)],
+                       0.047, 0.027)},
+         'V': {'mag': ('gmag', 'gmag-rmag', [-0.011, -0.587]),
+               'err': ([('e_gmag', 1.587), ('e_rmag', 0.587)],
+                       0.022, 0.011)},
+         'R': {'mag': ('rmag', 'rmag-imag', [-0.159, -0.272]),
+               'err': ([('e_rmag', 0.728), ('e_imag', 0.272)],
+                       0.092, 0.022)},
+         'I': {'mag': ('imag', 'rmag-imag', [-0.370, -0.337]),
+               'err': ([('e_imag', 1.337), ('e_rmag', 0.337)],
+                       0.191, 0.041)}},
+     'magsystem_out': 'AB (ugriz), Vega ({:s})'},
+
+    # APASS (and URAT) to RI; Chonis & Gaskell 2008, AJ, 135
+    {'catalogs': ('APASS', 'URAT'),
+     'magsystem': 'Vega',
+     'select': [('rmag-imag', '>', 0.08), ('rmag-imag', '<', 0.5)],
+     'bands': {
+         'R': {'mag': ('rmag', 'rmag-imag', [-0.159, -0.272]),
+               'err': ([('e_rmag', 0.728), ('e_imag', 0.272)],
+                       0.092, 0.022)},
+         'I': {'mag': ('imag', 'rmag-imag', [-0.370, -0.337]),
+               'err': ([('e_imag', 1.337), ('e_rmag', 0.337)],
+                       0.191, 0.041)}},
+     'magsystem_out': 'Vega'},
+
+    # 2MASS to UKIRT YZJHK; Hodgkin et al. 2009, MNRAS; faint stars are
+    # rejected based on their Figure 6; 0.064 (sig: 0.035) is a
+    # systematic offset between UKIRT Z and SDSS z
+    {'catalogs': ('2MASS',),
+     'magsystem': 'Vega',
+     'select': [('Jmag-Hmag', '>=', -0.1), ('Jmag-Hmag', '<=', 1.0),
+                ('Jmag', '<=', 18), ('Hmag', '<=', 17)],
+     'bands': {
+         'Y': {'mag': ('Jmag', 'Jmag-Hmag', [0.08, 0.5]),
+               'err': ([('e_Jmag', 1)], 0, 0)},
+         'Z': {'mag': ('Jmag', 'Jmag-Hmag', [0.064, 0.95]),
+               'err': ([('e_Jmag', 1)], 0, 0.035)},
+         'J': {'mag': ('Jmag', 'Jmag-Hmag', [0, -0.065]),
+               'err': ([('e_Jmag', 1)], 0, 0)},
+         'H': {'mag': ('Hmag', 'Jmag-Ksmag', [-0.03, 0.07]),
+               'err': ([('e_Hmag', 1)], 0, 0)},
+         'K': {'mag': ('Ksmag', 'Jmag-Ksmag', [0, 0.01]),
+               'err': ([('e_Ksmag', 1)], 0, 0)}},
+     'magsystem_out': 'Vega'},
+
+    # PANSTARRS to BVRI; Tonry et al. 2012, ApJ 750
+    {'catalogs': ('PANSTARRS',),
+     'magsystem': None,
+     'select': [],
+     'bands': {
+         'B': {'mag': ('gp1mag', 'gp1mag-rp1mag', [0.212, 0.556, 0.034]),
+               'err': ([('e_gp1mag', 1)], 0, 0.032)},
+         'V': {'mag': ('gp1mag', 'gp1mag-rp1mag', [0.005, -0.536, 0.011]),
+               'err': ([('e_gp1mag', 1)], 0, 0.012)},
+         'R': {'mag': ('rp1mag', 'gp1mag-rp1mag', [-0.137, -0.108, -0.029]),
+               'err': ([('e_rp1mag', 1)], 0, 0.015)},
+         'I': {'mag': ('ip1mag', 'gp1mag-rp1mag', [-0.366, -0.136, -0.018]),
+               'err': ([('e_ip1mag', 1)], 0, 0.017)}},
+     'magsystem_out': 'Vega'},
+
+    # PANSTARRS to SDSS griz; Tonry et al. 2012, ApJ 750
+    {'catalogs': ('PANSTARRS',),
+     'magsystem': None,
+     'select': [],
+     'bands': {
+         'g': {'mag': ('gp1mag', 'gp1mag-rp1mag', [0.013, 0.145, 0.019]),
+               'err': ([('e_gp1mag', 1)], 0, 0.008)},
+         'r': {'mag': ('rp1mag', 'gp1mag-rp1mag', [-0.001, 0.004, 0.007]),
+               'err': ([('e_rp1mag', 1)], 0, 0.004)},
+         'i': {'mag': ('ip1mag', 'gp1mag-rp1mag', [-0.005, 0.011, 0.010]),
+               'err': ([('e_ip1mag', 1)], 0, 0.004)},
+         'z': {'mag': ('zp1mag', 'gp1mag-rp1mag', [0.013, -0.039, -0.012]),
+               'err': ([('e_zp1mag', 1)], 0, 0.01)}},
+     'magsystem_out': 'AB'},
+
+    # SDSS to UKIRT Z; Hewett et al. 2006, MNRAS (slope is average of
+    # III and V classes)
+    {'catalogs': ('SDSS',),
+     'magsystem': 'AB',
+     'select': [],
+     'bands': {
+         'Z': {'mag': ('zmag', 'imag-zmag', [-0.538, 0.06]),
+               'err': ([('e_zmag', 1)], 0, 0)}},
+     'magsystem_out': 'AB (ugriz), Z_UKIRT (Vega)'},
+
+    # Gaia DR2+ to Johnson-Cousins VRI; Gaia DR2 documentation, 5.3.7
+    {'catalogs': ('GAIA',),
+     'magsystem': None,
+     'select': [('BPmag-RPmag', '>', -0.5), ('BPmag-RPmag', '<', 2.75)],
+     'bands': {
+         'V': {'mag': ('Gmag', 'BPmag-RPmag', [0.0176, 0.00686, 0.1732]),
+               'err': ([('e_Gmag', 1)], 0, 0.045858)},
+         'R': {'mag': ('Gmag', 'BPmag-RPmag', [0.003226, -0.3833, 0.1345]),
+               'err': ([('e_Gmag', 1)], 0, 0.04840)},
+         'I': {'mag': ('Gmag', 'BPmag-RPmag', [-0.02085, -0.7419, 0.09531]),
+               'err': ([('e_Gmag', 1)], 0, 0.04956)}},
+     'magsystem_out': 'Vega'},
+
+    # Gaia DR2+ to SDSS gri; Gaia DR2 documentation, 5.3.7
+    {'catalogs': ('GAIA',),
+     'magsystem': None,
+     'select': [],
+     'bands': {
+         'g': {'mag': ('Gmag', 'BPmag-RPmag',
+                       [-0.13518, 0.46245, 0.25171, -0.021349]),
+               'err': ([('e_Gmag', 1)], 0, 0.16497),
+               'select': [('BPmag-RPmag', '>', -0.5),
+                          ('BPmag-RPmag', '<', 2.0)]},
+         'r': {'mag': ('Gmag', 'BPmag-RPmag',
+                       [0.12879, -0.24662, 0.027464, 0.049465]),
+               'err': ([('e_Gmag', 1)], 0, 0.066739),
+               'select': [('BPmag-RPmag', '>', 0.2),
+                          ('BPmag-RPmag', '<', 2.7)]},
+         'i': {'mag': ('Gmag', 'BPmag-RPmag', [0.29676, -0.64728, 0.10141]),
+               'err': ([('e_Gmag', 1)], 0, 0.098957),
+               'select': [('BPmag-RPmag', '>', 0),
+                          ('BPmag-RPmag', '<', 4.5)]}},
+     'magsystem_out': 'AB'},
+]
+
+# version of the transformation registry; cached transformed catalogs
+# are invalidated when the registry changes
+version = hashlib.md5(repr(transformations).encode('utf-8')).hexdigest()[:8]
+
+operators = {'<': operator.lt, '<=': operator.le,
+             '>': operator.gt, '>=': operator.ge}
+
+
+def find_transformations(catalogname, magsystem, bands):
+    """
+    identify transformations that provide the requested bands
+    input: catalogname, magsystem (of the catalog), bands (list)
+    return: list of (transformation, bands provided by it); bands that
+            are not available are not included
+    """
+    found = []
+    for band in bands:
+        for trans in transformations:
+            if (band in trans['bands'] and
+                    any([name in catalogname for name in trans['catalogs']])
+                    and trans['magsystem'] in (None, magsystem)):
+                for other, other_bands in found:
+                    if other is trans:
+                        other_bands.append(band)
+                        break
+                else:
+                    found.append((trans, [band]))
+                break
+    return found
+
+
+def values(data, field):
+    """field values as float array (masked array for masked columns)"""
+    if hasattr(data[field], 'mask'):
+        return np.ma.asarray(data[field], dtype=float)
+    return np.asarray(data[field], dtype=float)
+
+
+def evaluate(data, term):
+    """evaluate a term (field or difference of fields) on data"""
+    fields = term.split('-')
+    value = values(data, fields[0])
+    for field in fields[1:]:
+        value = value - values(data, field)
+    return value
+
+
+def selection(data, criteria):
+    """boolean array: sources that meet all criteria"""
+    sel = np.ones(len(data), dtype=bool)
+    for term, op, value in criteria:
+        sel &= np.ma.filled(operators[op](evaluate(data, term), value),
+                            False)
+    return sel
+
+
+def derive_magnitudes(data, trans, bands):
+    """
+    apply transformation to data (astropy table)
+    input: data, trans (transformation), bands (requested bands)
+    return: boolean array of sources that meet the criteria of the
+            transformation and the requested bands; dictionary of
+            magnitudes and uncertainties in all bands
+            provided by the transformation
+    """
+    criteria = list(trans['select'])
+    for band in bands:
+        criteria += trans['bands'][band].get('select', [])
+    keep = selection(data, criteria)
+
+    # reject outliers from the color-color locus
+    if trans.get('clip') is not None and np.sum(keep) > 1:
+        x_term, y_term, nsigma = trans['clip']
+        x = np.ma.filled(evaluate(data, x_term)[keep], np.nan)
+        y = np.ma.filled(evaluate(data, y_term)[keep], np.nan)
+        slope, offset = np.polyfit(x, y, 1)
+        dist = (y - slope*x - offset)/np.sqrt(slope**2+1)
+        keep[np.where(keep)[0][np.abs(dist) > nsigma*np.std(dist)]] = False
+
+    mags = {}
+    for band, coeff in trans['bands'].items():
+        base, color_term, poly = coeff['mag']
+        color = evaluate(data, color_term)
+        mags[band] = (values(data, base) +
+                      np.polynomial.polynomial.polyval(color, poly))
+        err_fields, color_scatter, sys = coeff['err']
+        var = (color*color_scatter)**2 + sys**2
+        for field, factor in err_fields:
+            var = var + (factor*values(data, field))**2
+        mags['e_'+band] = np.sqrt(var)
+
+    return keep, mags
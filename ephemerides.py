@@ -0,0 +1,321 @@
+""" EPHEMERIDES - batched and cached JPL Horizons ephemerides
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import logging
+import threading
+import sqlite3 as sql
+
+import numpy as np
+from numpy.polynomial import Chebyshev
+from astropy.table import Table
+
+# pipeline-specific modules
+import _pp_conf
+from pp_setup import confephemerides as conf
+from services import Horizons
+from catalog_cache import angular_separation
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+# ephemeris properties kept in the cache
+fields = ['targetname', 'datetime_jd', 'RA', 'DEC', 'RA_rate', 'DEC_rate',
+          'V', 'r', 'delta', 'alpha']
+
+
+class Ephemerides():
+    """JPL Horizons ephemerides
+
+    All epochs of a target are requested from Horizons at once. Results
+    are kept in memory and, optionally, in a persistent sqlite cache
+    (`conf.cache_path`) keyed by target, id type, location, and epoch.
+    """
+
+    index_filename = 'ephemerides.db'
+
+    def __init__(self, path=None):
+        self._path = path
+        self.memory = {}
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self._path is not None:
+            return self._path
+        return conf.cache_path
+
+    def connect(self):
+        """open cache database (create it, if necessary)"""
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        db_conn = sql.connect(os.path.join(self.path, self.index_filename),
+                              timeout=60)
+        db_conn.execute(('CREATE TABLE IF NOT EXISTS ephemerides ('
+                         'target TEXT, id_type TEXT, location TEXT, '
+                         'epoch INTEGER, targetname TEXT, '
+                         'datetime_jd REAL, RA REAL, DEC REAL, '
+                         'RA_rate REAL, DEC_rate REAL, V REAL, r REAL, '
+                         'delta REAL, alpha REAL, retrieved REAL, '
+                         'PRIMARY KEY (target, id_type, location, epoch))'))
+        return db_conn
+
+    @staticmethod
+    def epoch_key(epoch):
+        """integer epoch key (1e-7 d resolution)"""
+        return int(round(epoch*1e7))
+
+    def query(self, targetname, epochs, location, id_type):
+        """
+        query Horizons for all epochs
+        return: list of ephemeris rows (dictionaries) or None
+        """
+
+        rows = []
+        for i in range(0, len(epochs), conf.max_epochs_per_query):
+            chunk = list(epochs[i:i+conf.max_epochs_per_query])
+            obj = Horizons(targetname, id_type=id_type, epochs=chunk,
+                           location=location)
+            try:
+                eph = obj.ephemerides()
+            except ValueError as e:
+                logging.warning('no Horizons ephemerides for {:s}: {:s}'.
+                                format(targetname, str(e)))
+                logging.warning('HORIZONS call: {:s}'.format(str(obj.uri)))
+                return None
+            logging.info(('{:d} ephemerides for {:s} pulled from '
+                          'Horizons').format(len(eph), targetname))
+            logging.info('HORIZONS call: {:s}'.format(str(obj.uri)))
+            if len(eph) != len(chunk):
+                logging.warning(('Horizons returned {:d} ephemerides for {:d} '
+                                 'epochs').format(len(eph), len(chunk)))
+                return None
+            for epoch, ephrow in zip(chunk, eph):
+                row = {}
+                for field in fields:
+                    if field in eph.columns and not np.ma.is_masked(
+                            ephrow[field]):
+                        row[field] = (str(ephrow[field])
+                                      if field == 'targetname'
+                                      else float(ephrow[field]))
+                    else:
+                        row[field] = None
+                # keep requested epoch to avoid rounding issues
+                row['datetime_jd'] = float(epoch)
+                rows.append(row)
+
+        return rows
+
+    def get(self, targetname, epochs, location, id_type=None):
+        """
+        obtain ephemerides for a target at a number of epochs
+        input: targetname, epochs (JD), location (observatory code),
+               id_type (as used by astroquery.jplhorizons)
+        return: astropy table (one row per epoch, same order as epochs)
+                or None, if no ephemerides are available
+        """
+
+        epochs = np.atleast_1d(np.array(epochs, dtype=float))
+        location = str(location)
+        key = (targetname, str(id_type), location)
+
+        found = {}
+        with self.lock:
+            memory = self.memory.setdefault(key, {})
+            for epoch in epochs:
+                if self.epoch_key(epoch) in memory:
+                    found[self.epoch_key(epoch)] = \
+                        memory[self.epoch_key(epoch)]
+
+        # check persistent cache
+        missing = [epoch for epoch in np.unique(epochs)
+                   if self.epoch_key(epoch) not in found]
+        if len(missing) > 0 and conf.cache_ephemerides:
+            try:
+                db_conn = self.connect()
+                min_retrieved = time.time() - conf.max_age*86400
+                for epoch in missing:
+                    entry = db_conn.execute(
+                        ('SELECT {:s} FROM ephemerides WHERE target=? AND '
+                         'id_type=? AND location=? AND epoch=? AND '
+                         'retrieved>?').format(', '.join(fields)),
+                        key + (self.epoch_key(epoch),
+                               min_retrieved)).fetchone()
+                    if entry is not None:
+                        found[self.epoch_key(epoch)] = dict(zip(fields,
+                                                                entry))
+                db_conn.close()
+            except sql.Error as e:
+                logging.warning('cannot access ephemerides cache: {:s}'.
+                                format(str(e)))
+
+        # query remaining epochs at once
+        missing = [epoch for epoch in np.unique(epochs)
+                   if self.epoch_key(epoch) not in found]
+        if len(missing) > 0:
+            rows = self.query(targetname, missing, location, id_type)
+            if rows is None:
+                return None
+            for epoch, row in zip(missing, rows):
+                found[self.epoch_key(epoch)] = row
+
+            if conf.cache_ephemerides:
+                try:
+                    db_conn = self.connect()
+                    db_conn.executemany(
+                        ('INSERT OR REPLACE INTO ephemerides VALUES '
+                         '(?, ?, ?, ?, {:s}, ?)').format(
+                             ', '.join(['?']*len(fields))),
+                        [key + (self.epoch_key(epoch),) +
+                         tuple(row[field] for field in fields) +
+                         (time.time(),)
+                         for epoch, row in zip(missing, rows)])
+                    db_conn.commit()
+                    db_conn.close()
+                except sql.Error as e:
+                    logging.warning('cannot write ephemerides cache: {:s}'.
+                                    format(str(e)))
+
+        with self.lock:
+            memory.update(found)
+
+        rows = [found[self.epoch_key(epoch)] for epoch in epochs]
+        eph = Table(rows=[[row[field] if row[field] is not None else
+                           (np.nan if field != 'targetname' else '')
+                           for field in fields] for row in rows],
+                    names=fields)
+        for field, unit in [('RA', 'deg'), ('DEC', 'deg'),
+                            ('RA_rate', 'arcsec/h'), ('DEC_rate', 'arcsec/h'),
+                            ('V', 'mag'), ('r', 'AU'), ('delta', 'AU'),
+                            ('alpha', 'deg'), ('datetime_jd', 'd')]:
+            eph[field].unit = unit
+
+        return eph
+
+    def interpolate(self, targetname, epochs, location, id_type=None,
+                    max_splits=4):
+        """
+        obtain ephemerides for a large number of epochs by interpolating
+        Chebyshev polynomials fitted to a sparse set of Horizons
+        positions; segments are split until the interpolation error
+        (estimated at points between the nodes) is below
+        `conf.max_interpolation_error`
+        input: targetname, epochs (JD), location (observatory code),
+               id_type, max_splits (maximum number of segment splits)
+        return: astropy table (one row per epoch, same order as epochs)
+                or None, if no ephemerides are available
+        """
+
+        epochs = np.atleast_1d(np.array(epochs, dtype=float))
+        n_nodes = conf.interpolation_nodes
+        # Chebyshev nodes and points in between on [-1, 1]
+        x_nodes = np.cos(np.pi*(np.arange(n_nodes)+0.5)/n_nodes)[::-1]
+        x_check = (x_nodes[1:]+x_nodes[:-1])/2
+
+        segments = [(epochs.min(), epochs.max())]
+        fits = []
+        for split in range(max_splits+1):
+            if len(segments) == 0:
+                break
+
+            # query nodes and check points of all segments at once
+            grid = [(a+b)/2 + (b-a)/2*np.hstack([x_nodes, x_check])
+                    for a, b in segments]
+            eph = self.get(targetname, np.hstack(grid), location, id_type)
+            if eph is None:
+                return None
+            resolved = eph['targetname'][0]
+
+            remaining = []
+            for i, (a, b) in enumerate(segments):
+                seg = eph[i*len(grid[0]):(i+1)*len(grid[0])]
+                nodes, check = seg[:n_nodes], seg[n_nodes:]
+                fit = {}
+                for field in fields[2:]:
+                    values = np.array(nodes[field], dtype=float)
+                    if field == 'RA':
+                        values = np.rad2deg(np.unwrap(np.deg2rad(values)))
+                    if np.any(np.isnan(values)):
+                        continue
+                    fit[field] = Chebyshev.fit(
+                        grid[i][:n_nodes], values, n_nodes-1,
+                        domain=[a, b] if b > a else [a-1e-3, a+1e-3])
+                error = np.max(angular_separation(
+                    fit['RA'](grid[i][n_nodes:]) % 360,
+                    fit['DEC'](grid[i][n_nodes:]),
+                    np.array(check['RA']), np.array(check['DEC'])))*3600
+                if (error <= conf.max_interpolation_error or
+                        split == max_splits):
+                    fits.append((a, b, fit, error))
+                else:
+                    remaining += [(a, (a+b)/2), ((a+b)/2, b)]
+            segments = remaining
+
+        max_error = max([error for a, b, fit, error in fits])
+        if max_error > conf.max_interpolation_error:
+            logging.warning(('interpolation error for {:s} too large ({:.3f} '
+                             'arcsec); use exact ephemerides').format(
+                                 targetname, max_error))
+            return self.get(targetname, epochs, location, id_type)
+
+        logging.info(('ephemerides for {:s} interpolated at {:d} epochs '
+                      'using {:d} segments; max. error {:.3f} arcsec').format(
+                          targetname, len(epochs), len(fits), max_error))
+
+        eph = Table()
+        eph['targetname'] = [resolved]*len(epochs)
+        eph['datetime_jd'] = epochs
+        for field in fields[2:]:
+            values = np.ones(len(epochs))*np.nan
+            for a, b, fit, error in fits:
+                sel = (epochs >= a) & (epochs <= b)
+                if field in fit:
+                    values[sel] = fit[field](epochs[sel])
+            eph[field] = values
+        eph['RA'] = eph['RA'] % 360
+        for field, unit in [('RA', 'deg'), ('DEC', 'deg'),
+                            ('RA_rate', 'arcsec/h'), ('DEC_rate', 'arcsec/h'),
+                            ('V', 'mag'), ('r', 'AU'), ('delta', 'AU'),
+                            ('alpha', 'deg'), ('datetime_jd', 'd')]:
+            eph[field].unit = unit
+
+        return eph
+
+
+ephemerides = Ephemerides()
+
+
+def get_ephemerides(targetname, epochs, location, id_type=None):
+    """
+    obtain ephemerides for a target at a number of epochs using a single
+    Horizons query; long sequences are interpolated, if
+    `conf.interpolate` is set; see `Ephemerides.get` and
+    `Ephemerides.interpolate`
+    """
+    if (conf.interpolate and len(np.unique(epochs)) >=
+            max(conf.interpolation_min_epochs,
+                2*conf.interpolation_nodes)):
+        return ephemerides.interpolate(targetname, epochs, location,
+                                       id_type)
+    return ephemerides.get(targetname, epochs, location, id_type)
@@ -25,6 +25,7 @@
 
 from copy import deepcopy
 import sys
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import argparse
 import logging
@@ -40,9 +41,15 @@ if sys.version_info > (3, 0):
 # pipeline-specific modules
 import _pp_conf
 from pp_setup import confcalibrate as conf
+from pp_setup import confcatalog
 import diagnostics as diag
 from catalog import *
 from toolbox import *
+import catalog_cache
+from catalog_store import Catalog_Store
+from catalog_stack import Catalog_Stack
+import catalog_transform
+from catalog_cache import angular_separation
 
 # setup logging
 logging.basicConfig(filename=_pp_conf.log_filename,
@@ -54,24 +61,219 @@ logging.basicConfig(filename=_pp_conf.log_filename,
 
 from diagnostics import calibration as diag
 
+# concurrent catalog downloads: {catalogname: (query, future)}
+prefetched = {}
+
+
+def _download_photometrycatalog(catalogname, ra_deg, dec_deg, rad_deg,
+                                max_sources):
+    """download a photometric catalog (used in prefetch threads)"""
+    cat = catalog(catalogname, display=False)
+    n_sources = cat.download_catalog(ra_deg, dec_deg, rad_deg, max_sources)
+    return cat, n_sources
+
+
+def prefetch_photometrycatalogs(ra_deg, dec_deg, rad_deg, catalognames,
+                                max_sources=1e4):
+    """
+    start concurrent downloads of photometric catalogs; results are
+    picked up by create_photometrycatalog if the prefetched cone covers
+    the requested one
+    input: ra_deg, dec_deg, rad_deg, catalognames, max_sources
+    return: number of downloads started
+    """
+
+    executor = ThreadPoolExecutor(max_workers=conf.prefetch_threads)
+    for catalogname in catalognames:
+        prefetched[catalogname] = (
+            (ra_deg, dec_deg, rad_deg, max_sources),
+            executor.submit(_download_photometrycatalog, catalogname,
+                            ra_deg, dec_deg, rad_deg, max_sources))
+        logging.info(('prefetch {:s} at {:.7f}/{:+.7f} in a {:.2f} deg '
+                      'radius').format(catalogname, ra_deg, dec_deg,
+                                       rad_deg))
+    # downloads continue in the background
+    executor.shutdown(wait=False)
+
+    return len(catalognames)
+
+
+def _prefetch_covers(catalogname, ra_deg, dec_deg, rad_deg, max_sources):
+    """check whether a prefetched download covers a query"""
+    if catalogname not in prefetched:
+        return False
+    (p_ra, p_dec, p_rad, p_max_sources), future = prefetched[catalogname]
+    if (np.allclose([p_ra, p_dec, p_rad], [ra_deg, dec_deg, rad_deg],
+                    rtol=0, atol=1e-7) and p_max_sources == max_sources):
+        return True
+    # larger cone: result must not have been truncated by the row limit,
+    # which is only known after the download finished (see
+    # get_photometrycatalog)
+    if (angular_separation(p_ra, p_dec, ra_deg, dec_deg) + rad_deg >
+            p_rad + 1e-9 or p_max_sources < max_sources):
+        return False
+    return True
+
+
+def get_photometrycatalog(catalogname, ra_deg, dec_deg, rad_deg,
+                          max_sources, display=False):
+    """
+    obtain a photometric catalog from prefetched downloads, if possible,
+    or by downloading it
+    return: catalog, number of sources
+    """
+
+    if _prefetch_covers(catalogname, ra_deg, dec_deg, rad_deg, max_sources):
+        query, future = prefetched[catalogname]
+        try:
+            p_cat, n_sources = future.result()
+        except Exception as e:
+            logging.warning('prefetching {:s} failed: {:s}'.format(
+                catalogname, str(e)))
+            n_sources = None
+        identical = np.allclose(query[:3], [ra_deg, dec_deg, rad_deg],
+                                rtol=0, atol=1e-7)
+        if n_sources is not None and (identical or p_cat.query_complete()):
+            # work on a copy, prefetched data may be used again
+            cat = deepcopy(p_cat)
+            cat.display = display
+            if n_sources > 0:
+                n_sources = cat.reject_sources_other_than(
+                    angular_separation(ra_deg, dec_deg, cat['ra_deg'],
+                                       cat['dec_deg']) <= rad_deg)
+                cat.write_ldac(catalogname+'.cat')
+            logging.info('{:d} {:s} sources obtained from prefetch'.format(
+                n_sources, catalogname))
+            return cat, n_sources
+
+    cat = catalog(catalogname, display)
+    n_sources = cat.download_catalog(ra_deg, dec_deg, rad_deg,
+                                     max_sources,
+                                     save_catalog=True)
+    return cat, n_sources
+
+
+def requires_transformation(catalogname, filtername):
+    """check whether a catalog has to be transformed to filtername"""
+    return (('SDSS' in catalogname and
+             filtername not in {'u', 'g', 'r', 'i', 'z'}) or
+            ('URAT' in catalogname and
+             filtername not in {'B', 'V', 'g', 'r', 'i'}) or
+            ('APASS' in catalogname and
+             filtername not in {'B', 'V', 'g', 'r', 'i'}) or
+            ('2MASS' in catalogname and
+             filtername not in {'J', 'H', 'K', 'Ks'}) or
+            ('PANSTARRS' in catalogname and
+             filtername not in {'gp1', 'rp1', 'ip1', 'zp1', 'yp1'}) or
+            ('SkyMapper' in catalogname and
+             filtername not in {'g', 'r', 'i', 'z'}) or
+            ('GAIA' in catalogname and
+             filtername not in {'G', 'RP', 'BP'}))
+
+
+def transformed_catalog_key(catalogname, filtername, solar):
+    """catalog cache key of a transformed photometric catalog; includes
+    the version of the transformation registry"""
+    key = '{:s}_transformed_{:s}'.format(catalogname, filtername)
+    if solar:
+        key += '_solar{:.3f}'.format(_pp_conf.solcol)
+    return key + '_' + catalog_transform.version
+
+
+def get_transformed_catalog(catalogname, ra_deg, dec_deg, rad_deg,
+                            filtername, max_sources, solar, display=False):
+    """
+    retrieve a transformed photometric catalog from the catalog cache
+    return: catalog or None (if not available)
+    """
+    data, complete = catalog_cache.cache.retrieve(
+        transformed_catalog_key(catalogname, filtername, solar),
+        ra_deg, dec_deg, rad_deg, max_sources, exact=True)
+    if data is None:
+        return None
+
+    cat = catalog(data.meta.get('PPNAME', catalogname), display)
+    cat.history = data.meta.get('PPHIST', '')
+    cat.magsystem = data.meta.get('PPMAGSYS', '')
+    data.meta = {}
+    cat.data = data
+    logging.info('transformed {:s} catalog ({:s}) retrieved from cache'.format(
+        catalogname, filtername))
+    return cat
+
+
+def store_transformed_catalog(cat, catalogname, ra_deg, dec_deg, rad_deg,
+                              filtername, max_sources, solar):
+    """add a transformed photometric catalog to the catalog cache"""
+    return catalog_cache.cache.store(
+        transformed_catalog_key(catalogname, filtername, solar),
+        ra_deg, dec_deg, rad_deg, max_sources, None, cat.data,
+        meta={'PPNAME': cat.catalogname, 'PPHIST': cat.history,
+              'PPMAGSYS': str(getattr(cat, 'magsystem', ''))})
+
 
 def create_photometrycatalog(ra_deg, dec_deg, rad_deg, filtername,
                              preferred_catalogs,
                              min_sources=_pp_conf.min_sources_photometric_catalog,
                              max_sources=1e4, mag_accuracy=0.1,
                              solar=False, display=False):
+    """create a photometric catalog of the field of view; prefetched
+    downloads are released afterwards"""
+    try:
+        return _create_photometrycatalog(ra_deg, dec_deg, rad_deg,
+                                         filtername, preferred_catalogs,
+                                         min_sources, max_sources,
+                                         mag_accuracy, solar, display)
+    finally:
+        prefetched.clear()
+
+
+def _create_photometrycatalog(ra_deg, dec_deg, rad_deg, filtername,
+                              preferred_catalogs, min_sources, max_sources,
+                              mag_accuracy, solar, display):
     """create a photometric catalog of the field of view"""
 
+    # transformed catalogs are taken from the cache; catalogs with lower
+    # preference than the first cached one are not needed
+    cache_transformed = conf.cache_transformed and confcatalog.cache_catalogs
+    transformed, candidates = {}, []
     for catalogname in preferred_catalogs:
-        cat = catalog(catalogname, display)
+        if cache_transformed and requires_transformation(catalogname,
+                                                         filtername):
+            cat = get_transformed_catalog(catalogname, ra_deg, dec_deg,
+                                          rad_deg, filtername, max_sources,
+                                          solar, display)
+            if cat is not None:
+                transformed[catalogname] = cat
+                break
+        candidates.append(catalogname)
+
+    # download all candidate catalogs concurrently; catalogs are still
+    # selected in the order of preference
+    if conf.prefetch_catalogs:
+        prefetch_photometrycatalogs(
+            ra_deg, dec_deg, rad_deg,
+            [catalogname for catalogname in candidates
+             if not _prefetch_covers(catalogname, ra_deg, dec_deg,
+                                     rad_deg, max_sources)],
+            max_sources)
 
-        # load catalog
-        n_sources = cat.download_catalog(ra_deg, dec_deg, rad_deg,
-                                         max_sources,
-                                         save_catalog=True)
+    for catalogname in preferred_catalogs:
 
-        if display:
-            print(n_sources, 'sources downloaded from', catalogname)
+        # load catalog
+        cat = transformed.get(catalogname)
+        cached = cat is not None
+        if cached:
+            n_sources = cat.shape[0]
+            if display:
+                print(n_sources, 'transformed', catalogname,
+                      'sources retrieved from cache')
+        else:
+            cat, n_sources = get_photometrycatalog(catalogname, ra_deg,
+                                                   dec_deg, rad_deg,
+                                                   max_sources, display)
+            if display:
+                print(n_sources, 'sources downloaded from', catalogname)
         if n_sources < min_sources:
             continue
 
@@ -83,7 +285,7 @@ def create_photometrycatalog(ra_deg, dec_deg, rad_deg, filtername,
             return None
 
         # reject non-solar colors, if requested by user
-        if solar:
+        if solar and not cached:
             sol_gr = 0.44  # g-r
             sol_ri = 0.11  # r-i
             n_rejected = 0
@@ -135,28 +337,18 @@ def create_photometrycatalog(ra_deg, dec_deg, rad_deg, filtername,
             cat.catalogname += '_solar'
 
         # transform catalog to requested filtername, if necessesary
-        if (n_sources > 0 and
-            ('SDSS' in catalogname and
-             filtername not in {'u', 'g', 'r', 'i', 'z'}) or
-            ('URAT' in catalogname and
-             filtername not in {'B', 'V', 'g', 'r', 'i'}) or
-            ('APASS' in catalogname and
-             filtername not in {'B', 'V', 'g', 'r', 'i'}) or
-            ('2MASS' in catalogname and
-             filtername not in {'J', 'H', 'K', 'Ks'}) or
-            ('PANSTARRS' in catalogname and
-             filtername not in {'gp1', 'rp1', 'ip1', 'zp1', 'yp1'}) or
-            ('SkyMapper' in catalogname and
-             filtername not in {'g', 'r', 'i', 'z'}) or
-
-            ('GAIA' in catalogname and
-             filtername not in {'G', 'RP', 'BP'})):
+        if n_sources > 0 and requires_transformation(catalogname,
+                                                     filtername):
 
             n_transformed = cat.transform_filters(filtername)
             if n_transformed == 0:
                 raise ValueError(('unable to transform {:s} to {:s}'.format(
                     cat.catalogname, filtername) +
                     '; refer to LOG file for details'))
+            if cache_transformed and not cached:
+                store_transformed_catalog(cat, catalogname, ra_deg, dec_deg,
+                                          rad_deg, filtername, max_sources,
+                                          solar)
             n_transformed -= cat.reject_sources_with(
                 cat['_e_'+filtername+'mag'] > mag_accuracy)
 
@@ -208,8 +400,32 @@ def derive_zeropoints(ref_cat, catalogs, filtername, minstars_external,
     output = {'filtername': filtername, 'minstars': minstars_external,
               'zeropoints': [], 'clipping_steps': []}
 
+    # reject sources with MAG_APER/MAGERR_APER = 99 or nan in all
+    # catalogs at once
+
+    # read this: if there is a
+    # ValueError: boolean index array should have 1 dimension
+    # or
+    # IndexError: too many indices for array
+    # pointing here, the problem is that pp_extract has not been
+    # properly run using a single aperture
+    # currently it seems like pp_photometry (maybe callhorizons)
+    # has not finished properly
+
+    mag_key = 'MAG_'+_pp_conf.photmode
+    magerr_key = 'MAGERR_'+_pp_conf.photmode
+    stack = Catalog_Stack(catalogs, fields=[mag_key, magerr_key])
+    stack.reject_sources_with((stack[mag_key] == 99) |
+                              (stack[magerr_key] == 99) |
+                              np.isnan(stack[mag_key]) |
+                              np.isnan(stack[magerr_key]))
+    stack.unstack()
+
+    # catalogs (indices) and zeropoints of calibrated frames
+    calibrated, calibrated_zp = [], []
+
     # match catalogs based on coordinates
-    for cat in catalogs:
+    for cat_idx, cat in enumerate(catalogs):
 
         logging.info('derive zeropoint for catalog: %s based on %s' %
                      (" | ".join([cat.catalogname, cat.origin, cat.history]),
@@ -224,25 +440,6 @@ def derive_zeropoints(ref_cat, catalogs, filtername, minstars_external,
         efilterkey = 'e_'+filtername+'mag' if 'e_'+filtername+'mag' \
                      in ref_cat.fields else '_e_'+filtername+'mag'
 
-        # reject sources with MAG_APER/MAGERR_APER = 99 or nan
-
-        # read this: if there is a
-        # ValueError: boolean index array should have 1 dimension
-        # or
-        # IndexError: too many indices for array
-        # pointing here, the problem is that pp_extract has not been
-        # properly run using a single aperture
-        # currently it seems like pp_photometry (maybe callhorizons)
-        # has not finished properly
-
-        cat.reject_sources_other_than(cat.data['MAG_'+_pp_conf.photmode] != 99)
-        cat.reject_sources_other_than(cat.data['MAGERR_'
-                                               + _pp_conf.photmode] != 99)
-        cat.reject_sources_with(np.isnan(
-            cat.data['MAG_'+_pp_conf.photmode]))
-        cat.reject_sources_with(np.isnan(cat.data['MAGERR_' +
-                                                  _pp_conf.photmode]))
-
         # add idx columns to both catalogs
         if 'idx' not in ref_cat.fields:
             ref_cat.add_field('idx',
@@ -252,6 +449,7 @@ def derive_zeropoints(ref_cat, catalogs, filtername, minstars_external,
             cat.add_field('idx', list(range(cat.shape[0])),
                           field_type=np.int)
 
+        # the spatial index of ref_cat is built only once for all frames
         match = ref_cat.match_with(
             cat,
             match_keys_this_catalog=[
@@ -391,10 +589,10 @@ def derive_zeropoints(ref_cat, catalogs, filtername, minstars_external,
             matched_ref_cat.add_column(Column(used_in_fit, 'fit'))
             matched_ref_cat.remove_column('idx')
             # add instrumental magnitudes
-            matched_ref_cat.add_column(
-                cat['MAG_'+_pp_conf.photmode][match[1][2]])
-            matched_ref_cat.add_column(
-                cat['MAGERR_'+_pp_conf.photmode][match[1][2]])
+            for key in ['MAG_'+_pp_conf.photmode,
+                        'MAGERR_'+_pp_conf.photmode]:
+                matched_ref_cat.add_column(cat[key][match[1][2]],
+                                           name=key)
 
             if conf.save_caldata_usedonly:
                 matched_ref_cat = matched_ref_cat[used_in_fit == 1]
@@ -413,8 +611,7 @@ def derive_zeropoints(ref_cat, catalogs, filtername, minstars_external,
             # replace `idx` column in ref_cat with one that points to cat
             db_ref_cat.data.remove_column('idx')
             cat_idc = np.ones(ref_cat.shape[0], dtype=int)*-1
-            for i in range(len(match[0][0])):
-                cat_idc[match[0][5][i]] = match[1][2][i]
+            cat_idc[np.asarray(match[0][5], dtype=int)] = match[1][2]
             db_ref_cat.add_field('idx', cat_idc)
             cat.data = join(cat.data, db_ref_cat.data,
                             keys='idx',
@@ -424,23 +621,26 @@ def derive_zeropoints(ref_cat, catalogs, filtername, minstars_external,
             cat.data.rename_column('ra_deg_1', 'ra_deg')
             cat.data.rename_column('dec_deg_1', 'dec_deg')
 
-        # remove columns for filterkey for matched sources
-        if filterkey in cat.fields:
-            cat.data.remove_column(filterkey)
-            cat.data.remove_column(efilterkey)
-
-        cat.add_fields([filterkey, efilterkey],
-                       [cat['MAG_'+_pp_conf.photmode] +
-                        clipping_steps[idx][0],
-                        np.sqrt(cat['MAGERR_'+_pp_conf.photmode]**2 +
-                                clipping_steps[idx][1]**2)],
-                       ['F', 'F'])
+        # calibrated magnitudes are added after all frames are done
+        calibrated.append(cat_idx)
+        calibrated_zp.append(clipping_steps[idx][:2])
+        cal_keys = [filterkey, efilterkey]
 
         # add ref_cat identifier to catalog
         cat.origin = cat.origin.strip() + ";" + ref_cat.catalogname + ";"\
             + filtername
         cat.history += 'calibrated using ' + ref_cat.history
 
+    # add calibrated magnitudes to all calibrated catalogs at once;
+    # columns for filterkey from the reference catalog are replaced
+    if len(calibrated) > 0:
+        stack = Catalog_Stack([catalogs[i] for i in calibrated],
+                              fields=[mag_key, magerr_key])
+        stack.apply_zeropoints([zp[0] for zp in calibrated_zp],
+                               [zp[1] for zp in calibrated_zp],
+                               mag_key, magerr_key, *cal_keys)
+        stack.unstack()
+
     output['catalogs'] = catalogs
     output['ref_cat'] = ref_cat
 
@@ -467,6 +667,28 @@ def derive_zeropoints(ref_cat, catalogs, filtername, minstars_external,
     return output
 
 
+def write_databases(catalogs, display=False):
+    """
+    write calibrated catalogs into the photometry store and/or into one
+    database file per frame
+    """
+
+    if confcatalog.photometry_store is not None:
+        logging.info('write calibrated data into {:s}'.format(
+            confcatalog.photometry_store))
+        if display:
+            print('write calibrated data into {:s}'.format(
+                confcatalog.photometry_store))
+        Catalog_Store().write_catalogs(catalogs)
+
+    if confcatalog.photometry_store is None or confcatalog.frame_databases:
+        logging.info('write calibrated data into database files')
+        if display:
+            print('write calibrated data into database files')
+        for cat in catalogs:
+            cat.write_database(cat.catalogname+'.db')
+
+
 def calibrate(filenames, minstars, manfilter, manualcatalog,
               obsparam, maxflag=3,
               magzp=None, solar=False,
@@ -570,22 +792,21 @@ def calibrate(filenames, minstars, manfilter, manualcatalog,
             # manually add catalog fields and apply magnitude zeropoint
             filterkey = filtername+'mag'
             efilterkey = 'e_' + filtername + 'mag'
+            stack = Catalog_Stack(catalogs,
+                                  fields=['MAG_'+_pp_conf.photmode,
+                                          'MAGERR_'+_pp_conf.photmode])
+            stack.apply_zeropoints(magzp[0], magzp[1],
+                                   'MAG_'+_pp_conf.photmode,
+                                   'MAGERR_'+_pp_conf.photmode,
+                                   filterkey, efilterkey)
+            stack.unstack()
             for cat in catalogs:
-                cat.add_fields([filterkey, efilterkey],
-                               [cat['MAG_'+_pp_conf.photmode] + magzp[0],
-                                np.sqrt(cat['MAGERR_'+_pp_conf.photmode]**2 +
-                                        magzp[1]**2)],
-                               ['F', 'F'])
                 cat.origin = (cat.origin.strip() +
                               ';'+filtername+'_manual_zp;')
                 cat.history += 'calibrated using manual zeropoint'
 
         # write calibrated database files
-        logging.info('write calibrated data into database files')
-        if display:
-            print('write calibrated data into database files')
-        for cat in catalogs:
-            cat.write_database(cat.catalogname+'.db')
+        write_databases(catalogs, display=display)
 
         logging.info('Done! ------------------------------------------------')
 
@@ -647,11 +868,7 @@ def calibrate(filenames, minstars, manfilter, manualcatalog,
     diag.add_calibration(zp_data)
 
     # write calibrated database files
-    logging.info('write calibrated data into database files')
-    if display:
-        print('write calibrated data into database files')
-    for cat in catalogs:
-        cat.write_database(cat.catalogname+'.db')
+    write_databases(catalogs, display=display)
 
     logging.info('Done! -----------------------------------------------------')
 
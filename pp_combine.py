@@ -34,11 +34,11 @@ import shlex
 import time
 from astropy.io import fits
 from past.utils import old_div
-from astroquery.jplhorizons import Horizons
 
 # pipeline-specific modules
 import _pp_conf
 import toolbox
+from ephemerides import get_ephemerides
 
 # create a portable DEVNULL
 # necessary to prevent subprocess.PIPE and STDOUT from clogging if
@@ -127,7 +127,21 @@ def combine(filenames, obsparam, comoving, targetname,
             mjds.append(float(hdulist[0].header['MIDTIMJD']))
         filenames = [filenames[i] for i in numpy.argsort(mjds)]
 
-        for filename in filenames:
+        # use ephemerides from Horizons if no manual rates are provided;
+        # all frames are covered by a single query
+        if manual_rates is None:
+            eph = get_ephemerides(targetname.replace('_', ' '),
+                                  numpy.sort(mjds),
+                                  obsparam['observatory_code'])
+            if eph is None:
+                print('Target (%s) not an asteroid' % targetname)
+                logging.warning('WARNING: No position from Horizons!' +
+                                'Name (%s) correct?' % targetname)
+                raise ValueError('no Horizons ephemerides available')
+            logging.info('ephemerides for %s pulled from Horizons' %
+                         targetname)
+
+        for frame_idx, filename in enumerate(filenames):
             movingfilename = filename[:filename.find('.fits')]+'_moving.fits'
             print('shifting %s -> %s' % (filename, movingfilename))
             logging.info('shifting %s -> %s' % (filename, movingfilename))
@@ -141,29 +155,8 @@ def combine(filenames, obsparam, comoving, targetname,
 
             # use ephemerides from Horizons if no manual rates are provided
             if manual_rates is None:
-                # call HORIZONS to get target coordinates
-                obj = Horizons(targetname.replace('_', ' '), epochs=date,
-                               location=str(obsparam['observatory_code']))
-                try:
-                    eph = obj.ephemerides()
-                    n = len(eph)
-                except ValueError:
-                    print('Target (%s) not an asteroid' % targetname)
-                    logging.warning('Target (%s) not an asteroid' % targetname)
-                    n = None
-
-                if n is None or n == 0:
-                    logging.warning('WARNING: No position from Horizons!' +
-                                    'Name (%s) correct?' % targetname)
-                    logging.warning('HORIZONS call: %s' % eph.url)
-                    raise(ValueError, 'no Horizons ephemerides available')
-                else:
-                    logging.info('ephemerides for %s pulled from Horizons' %
-                                 targetname)
-                    logging.info('Horizons call: %s' %
-                                 obj.uri)
-
-                    target_ra, target_dec = eph[0]['RA'], eph[0]['DEC']
+                target_ra = eph[frame_idx]['RA']
+                target_dec = eph[frame_idx]['DEC']
 
                 # get image pointing from header
                 if obsparam['radec_separator'] == 'XXX':
@@ -27,16 +27,10 @@ import os
 import sys
 import logging
 import argparse
-import sqlite3
-from astroquery.jplhorizons import Horizons
+import astropy.units as u
 from astropy.io import ascii
-
-try:
-    from astroquery.vizier import Vizier
-except ImportError:
-    print('Module astroquery not found. Please install with: pip install '
-          'astroquery')
-    sys.exit()
+from astropy.table import Table, vstack
+from astropy.coordinates import SkyCoord
 
 # only import if Python3 is used
 if sys.version_info > (3, 0):
@@ -48,6 +42,11 @@ if sys.version_info > (3, 0):
 import _pp_conf
 from pp_setup import confdistill as conf
 from catalog import *
+from catalog_stack import Catalog_Stack
+from catalog_store import read_catalogs
+import services
+from ephemerides import get_ephemerides
+from catalog_cache import angular_separation
 from toolbox import *
 from diagnostics import distill as diag
 
@@ -58,6 +57,14 @@ logging.basicConfig(filename=_pp_conf.log_filename,
                     datefmt=_pp_conf.log_datefmt)
 
 
+def distill_fields(cat, key):
+    """select fields of calibrated catalogs that are used in distill:
+    positions, flags, FWHM, instrumental and calibrated magnitudes"""
+    return (key in ['ra_deg', 'dec_deg', 'XWIN_IMAGE', 'YWIN_IMAGE',
+                    'FLAGS', 'FWHM_WORLD', 'MAG_APER', 'MAGERR_APER'] or
+            (cat.filtername is not None and cat.filtername+'mag' in key))
+
+
 def manual_positions(posfile, catalogs, display=True):
     """create targets for manually provided positions (using -positions
     option)"""
@@ -107,13 +114,13 @@ def manual_positions(posfile, catalogs, display=True):
     for cat_idx, cat in enumerate(catalogs):
         try:
             objects.append({'ident': positions[cat_idx]['name'].decode('utf-8'),
-                            'obsdate.jd':  cat.obstime,
+                            'obsdate.jd':  cat.obstime[0],
                             'cat_idx':  cat_idx,
                             'ra_deg':  positions[cat_idx]['ra'],
                             'dec_deg':  positions[cat_idx]['dec']})
         except:
             objects.append({'ident': 'manual_target',
-                            'obsdate.jd':  cat.obstime,
+                            'obsdate.jd':  cat.obstime[0],
                             'cat_idx':  cat_idx,
                             'ra_deg':  positions[cat_idx]['ra'],
                             'dec_deg':  positions[cat_idx]['dec']})
@@ -182,88 +189,78 @@ def moving_primary_target(catalogs, man_targetname, offset, is_asteroid=None,
 
     objects = []
 
-    # check for target nature, if unknown
-    if is_asteroid is None:
-        cat = catalogs[0]
+    targetnames = []
+    for cat in catalogs:
         targetname = cat.obj.replace('_', ' ')
         if man_targetname is not None:
             targetname = man_targetname.replace('_', ' ')
+            cat.obj = targetname
+        targetnames.append(targetname)
+    epochs = [cat.obstime[0] for cat in catalogs]
+    id_types = {True: 'smallbody', False: 'majorbody'}
+
+    # ephemerides for each frame; all frames of one target are covered
+    # by a single Horizons query
+    ephs = {}
+
+    def query_target(targetname, smallbody):
+        idc = [idx for idx, name in enumerate(targetnames)
+               if name == targetname and idx not in ephs]
+        if len(idc) == 0:
+            return True
+        eph = get_ephemerides(targetname, [epochs[idx] for idx in idc],
+                              obsparam['observatory_code'],
+                              id_types[smallbody])
+        if eph is None:
+            return False
+        for idx, ephrow in zip(idc, eph):
+            ephs[idx] = ephrow
+        return True
+
+    # check for target nature, if unknown
+    if is_asteroid is None:
+        targetname = targetnames[0]
         for smallbody in [True, False]:
-            obj = Horizons(targetname.replace('_', ' '),
-                           id_type={True: 'smallbody',
-                                    False: 'majorbody'}[smallbody],
-                           epochs=cat.obstime[0],
-                           location=obsparam['observatory_code'])
-            n = 0
-            try:
-                eph = obj.ephemerides()
-                n = len(eph)
-            except ValueError:
-                if display and smallbody is True:
-                    print("'%s' is not a small body" % targetname)
-                    logging.warning("'%s' is not a small body" %
-                                    targetname)
-                if display and smallbody is False:
-                    print("'%s' is not a Solar System object" % targetname)
-                    logging.warning("'%s' is not a Solar System object" %
-                                    targetname)
-                pass
-            if n > 0:
+            if query_target(targetname, smallbody):
                 is_asteroid = smallbody
                 break
+            if display and smallbody is True:
+                print("'%s' is not a small body" % targetname)
+                logging.warning("'%s' is not a small body" %
+                                targetname)
+            if display and smallbody is False:
+                print("'%s' is not a Solar System object" % targetname)
+                logging.warning("'%s' is not a Solar System object" %
+                                targetname)
 
     # if is_asteroid is still None, this object is not in the Horizons db
     if is_asteroid is None:
         return objects
 
+    for targetname in set(targetnames):
+        query_target(targetname, is_asteroid)
+
     message_shown = False
 
     # query information for each image
     for cat_idx, cat in enumerate(catalogs):
-        targetname = cat.obj.replace('_', ' ')
-        if man_targetname is not None:
-            targetname = man_targetname.replace('_', ' ')
-            cat.obj = targetname
-        obj = Horizons(targetname.replace('_', ' '),
-                       id_type={True: 'smallbody',
-                                False: 'majorbody'}[is_asteroid],
-                       epochs=cat.obstime[0],
-                       location=obsparam['observatory_code'])
-        try:
-            eph = obj.ephemerides()
-            n = len(eph)
-        except ValueError:
-            # if is_asteroid:
-            #     if display and not message_shown:
-            #         print 'is \'%s\' an asteroid?' % targetname
-            #     logging.warning('Target (%s) is not an asteroid' % targetname)
-
-            # else:
-            #     if display and not message_shown:
-            #         print ('is \'%s\' a different Solar System object?' %
-            #                )targetname
-            #     logging.warning('Target (%s) is not a Solar System object' %
-            #                     targetname)
-            #     n = None
-            pass
-
-        if n is None or n == 0:
+
+        if cat_idx not in ephs:
             logging.warning('WARNING: No position from Horizons! ' +
                             'Name (%s) correct?' % cat.obj.replace('_', ' '))
-            logging.warning('HORIZONS call: %s' % obj.uri)
             if display and not message_shown:
                 print('  no Horizons data for %s ' % cat.obj.replace('_', ' '))
                 message_shown = True
 
         else:
-            objects.append({'ident': eph[0]['targetname'].replace(" ", "_"),
+            eph = ephs[cat_idx]
+            objects.append({'ident': eph['targetname'].replace(" ", "_"),
                             'obsdate.jd': cat.obstime[0],
                             'cat_idx': cat_idx,
-                            'ra_deg': eph[0]['RA']-offset[0]/3600,
-                            'dec_deg': eph[0]['DEC']-offset[1]/3600})
+                            'ra_deg': eph['RA']-offset[0]/3600,
+                            'dec_deg': eph['DEC']-offset[1]/3600})
             logging.info('Successfully grabbed Horizons position for %s ' %
                          cat.obj.replace('_', ' '))
-            logging.info('HORIZONS call: %s' % obj.uri)
             if display and not message_shown:
                 print(cat.obj.replace('_', ' '), "identified")
                 message_shown = True
@@ -306,7 +303,10 @@ def fixed_targets(fixed_targets_file, catalogs, display=True):
 # ---- search for serendipitous targets
 
 def serendipitous_variablestars(catalogs, display=True):
-    """match catalogs with VSX catalog using astroquery.Vizier
+    """match catalogs with VSX catalog using astroquery.Vizier;
+    VSX queries are cached (see `ConfCatalog.cache_catalogs`)
+    return: astropy table of targets (ident, obsdate.jd, cat_idx, ra_deg,
+            dec_deg); each frame includes only stars within its footprint
     """
 
     if display:
@@ -319,50 +319,72 @@ def serendipitous_variablestars(catalogs, display=True):
     logging.info('FoV center (%.7f/%+.7f) and radius (%.2f deg) derived' %
                  (ra_deg, dec_deg, rad_deg))
 
-    # derive observation midtime of sequence
-    midtime = np.average([cat.obstime[0] for cat in catalogs])
-
-    # setup Vizier query
-    # note: column filters uses original Vizier column names
-    # -> green column names in Vizier
-
-    logging.info(('query Vizier for VSX at %7.3f/%+8.3f in '
-                  + 'a %.2f deg radius') %
-                 (ra_deg, dec_deg, rad_deg))
-
-    field = coord.SkyCoord(ra=ra_deg, dec=dec_deg, unit=(u.deg, u.deg),
-                           frame='icrs')
-
-    vquery = Vizier(columns=['Name', 'RAJ2000', 'DEJ2000'])
-    try:
-        data = vquery.query_region(field,
-                                   width=("%fd" % rad_deg),
-                                   catalog="B/vsx/vsx")[0]
-    except IndexError:
+    vsx = catalog('VSX')
+    if vsx.download_catalog(ra_deg, dec_deg, rad_deg,
+                            conf.vsx_max_sources) == 0:
         if display:
             print('no data available from VSX')
-            logging.error('no data available from VSX')
-            return []
+        logging.error('no data available from VSX')
+        return []
 
-    objects = []
+    # identify stars within the footprint of each frame
+    star_ra, star_dec = vsx['ra_deg'].data, vsx['dec_deg'].data
+    cat_idc, star_idc = [], []
     for cat_idx, cat in enumerate(catalogs):
-        for star in data:
-            objects.append({'ident': star['Name'],
-                            'obsdate.jd': cat.obstime[0],
-                            'cat_idx': cat_idx,
-                            'ra_deg': star['RAJ2000'],
-                            'dec_deg': star['DEJ2000']})
+        frame_ra, frame_dec, frame_rad = skycenter([cat])
+        idc = np.where(angular_separation(frame_ra, frame_dec, star_ra,
+                                          star_dec) <= frame_rad)[0]
+        cat_idc.append(np.ones(len(idc), dtype=int)*cat_idx)
+        star_idc.append(idc)
+    cat_idc, star_idc = np.hstack(cat_idc), np.hstack(star_idc)
+
+    objects = Table([vsx['ident'].data[star_idc].astype(str),
+                     np.array([cat.obstime[0] for cat in catalogs])[cat_idc],
+                     cat_idc, star_ra[star_idc], star_dec[star_idc]],
+                    names=['ident', 'obsdate.jd', 'cat_idx', 'ra_deg',
+                           'dec_deg'])
 
     if display:
-        print(len(objects)/len(catalogs), 'variable stars found')
+        print(len(vsx.data), 'variable stars found')
 
     return objects
 
 
+def read_skybot(text):
+    """
+    read IMCCE SkyBoT cone search results (text output)
+    return: astropy table (number, name, ra, dec [deg], type, V, posunc,
+            d [arcsec], ra_rate, dec_rate [arcsec/hr; RA rate includes
+            cos(dec)]; rates are nan if not provided)
+    """
+    header = [line for line in text.split('\n')
+              if line.startswith('# Num')][0]
+    columns = [col.strip() for col in header[1:].split('|')]
+    names = {'Num': 'number', 'Name': 'name', 'RA(h)': 'ra',
+             'DE(deg)': 'dec', 'Class': 'type', 'Mv': 'V',
+             'Err(arcsec)': 'posunc', 'd(arcsec)': 'd',
+             'dRA(arcsec/h)': 'ra_rate', 'dDEC(arcsec/h)': 'dec_rate'}
+    results = ascii.read(text, delimiter='|', format='no_header',
+                         names=[names.get(col, col) for col in columns])
+    results['name'] = [str(name) for name in results['name']]
+    # positions are sexagesimal (RA in hours)
+    positions = SkyCoord([str(ra) for ra in results['ra']],
+                         [str(dec) for dec in results['dec']],
+                         unit=(u.hourangle, u.deg))
+    results['ra'] = positions.ra.deg
+    results['dec'] = positions.dec.deg
+    for col in ['ra_rate', 'dec_rate']:
+        if col not in results.columns:
+            results[col] = np.nan
+        results[col] = np.array(results[col], dtype=float)
+
+    return results
+
+
 def serendipitous_asteroids(catalogs, display=True):
 
     import requests
-    server = 'http://vo.imcce.fr/webservices/skybot/skybotconesearch_query.php'
+    server = services.skybot_server()
 
     if display:
         print('# check frames with IMCCE SkyBoT... ', end=' ')
@@ -404,7 +426,7 @@ def serendipitous_asteroids(catalogs, display=True):
     r = requests.get(server,
                      params={'RA': ra_deg, 'DEC': dec_deg,
                              'SR': rad_deg, 'EPOCH': str(midtime),
-                             '-output': 'object',
+                             '-output': 'obs',
                              '-mime': 'text'},
                      timeout=180)
 
@@ -413,30 +435,73 @@ def serendipitous_asteroids(catalogs, display=True):
         logging.warning('SkyBot failed: ' + r.text)
         return []
 
-    results = ascii.read(r.text, delimiter='|',
-                         names=('number', 'name', 'ra', 'dec', 'type',
-                                'V', 'posunc', 'd'))
+    results = read_skybot(r.text)
 
-    objects = []
-    for obj in results:
+    sel = np.ones(len(results), dtype=bool)
+    for idx, obj in enumerate(results):
         if obj['posunc'] > max_posunc:
             logging.warning(('asteroid {:s} rejected due to large '
                              'pos. unc ({:f} > {:f} arcsec)').format(
                                  obj['name'],
                                  obj['posunc'],
                                  max_posunc))
-            continue
-        if obj['V'] > max(maglims):
+            sel[idx] = False
+        elif obj['V'] > max(maglims):
             logging.warning(('asteroid {:s} rejected; too faint '
                              '({:f} mag)').format(obj['name'],
                                                   obj['V']))
+            sel[idx] = False
+    results = results[sel]
+
+    # place all asteroids in all frames
+    epochs = np.array([cat.obstime[0] for cat in catalogs])
+    ra = np.empty((len(results), len(catalogs)))
+    dec = np.empty((len(results), len(catalogs)))
+    extrapolate = (conf.asteroid_positions == 'skybot' and
+                   np.max(np.abs(epochs-midtime))*24 <=
+                   conf.skybot_max_timespan)
+    if extrapolate:
+        # linear motion based on SkyBoT positions and rates
+        extrapolate = ~(np.isnan(results['ra_rate']) |
+                        np.isnan(results['dec_rate']))
+    else:
+        extrapolate = np.zeros(len(results), dtype=bool)
+
+    dt = (epochs[np.newaxis, :]-midtime)*24  # hr
+    dec[extrapolate] = (results['dec'][extrapolate, np.newaxis] +
+                        results['dec_rate'][extrapolate, np.newaxis] *
+                        dt/3600)
+    ra[extrapolate] = np.mod(
+        results['ra'][extrapolate, np.newaxis] +
+        results['ra_rate'][extrapolate, np.newaxis]*dt/3600 /
+        np.cos(np.deg2rad(dec[extrapolate])), 360)
+
+    # Horizons ephemerides for all frames (one query per asteroid);
+    # targets are identified by their Horizons target names, SkyBoT
+    # names are used for extrapolated positions
+    valid = np.ones(len(results), dtype=bool)
+    idents = [str(name) for name in results['name']]
+    for idx in np.where(~extrapolate)[0]:
+        eph = get_ephemerides(results['name'][idx], epochs,
+                              obsparam['observatory_code'], 'smallbody')
+        if eph is None:
+            valid[idx] = False
             continue
+        ra[idx], dec[idx] = eph['RA'], eph['DEC']
+        idents[idx] = str(eph['targetname'][0])
 
-        objects += moving_primary_target(catalogs, obj['name'], (0, 0),
-                                         display=False)
+    objects = []
+    for idx in np.where(valid)[0]:
+        ident = idents[idx].replace(' ', '_')
+        objects += [{'ident': ident,
+                     'obsdate.jd': epochs[cat_idx],
+                     'cat_idx': cat_idx,
+                     'ra_deg': ra[idx, cat_idx],
+                     'dec_deg': dec[idx, cat_idx]}
+                    for cat_idx in range(len(catalogs))]
 
         logging.info(('asteroid {:s} added to '
-                      'target pool').format(obj['name']))
+                      'target pool').format(results['name'][idx]))
 
     if display:
         print(len(objects)/len(catalogs), 'asteroids found')
@@ -447,6 +512,26 @@ def serendipitous_asteroids(catalogs, display=True):
 # -------------------
 
 
+def target_table(objects):
+    """turn a list of target dictionaries into a target table
+    input: list of dictionaries (ident, obsdate.jd, cat_idx, ra_deg,
+           dec_deg)
+    return: astropy table with one row per target and frame
+    """
+    object_keys = ['ident', 'obsdate.jd', 'cat_idx', 'ra_deg', 'dec_deg']
+    return Table([np.array([str(obj['ident']) for obj in objects],
+                           dtype=str),
+                  np.array([obj['obsdate.jd'] for obj in objects],
+                           dtype=float),
+                  np.array([obj['cat_idx'] for obj in objects],
+                           dtype=int),
+                  np.array([obj['ra_deg'] for obj in objects],
+                           dtype=float),
+                  np.array([obj['dec_deg'] for obj in objects],
+                           dtype=float)],
+                 names=object_keys)
+
+
 def distill(catalogs, man_targetname, offset, fixed_targets_file, posfile,
             rejectionfilter='pos', display=False, diagnostics=False,
             variable_stars=False, asteroids=False):
@@ -461,24 +546,9 @@ def distill(catalogs, man_targetname, offset, fixed_targets_file, posfile,
 
     output = {}
 
-    # read in database files (if necessary)
+    # read in calibrated catalogs (if necessary)
     if isinstance(catalogs[0], str):
-        filenames = catalogs[:]
-        catalogs = []
-        for filename in filenames:
-            filename = filename[:filename.find('.fit')]+'.ldac.db'
-            cat = catalog(filename)
-            try:
-                cat.read_database(filename)
-            except IOError:
-                logging.error('Cannot find database', filename)
-                print('Cannot find database', filename)
-                continue
-            except sqlite3.OperationalError:
-                logging.error('File %s is not a database file' % filename)
-                print('File %s is not a database file' % filename)
-                continue
-            catalogs.append(cat)
+        catalogs = read_catalogs(catalogs, fields=distill_fields)
 
     # identify target names and types
 
@@ -504,12 +574,21 @@ def distill(catalogs, man_targetname, offset, fixed_targets_file, posfile,
     if asteroids:
         objects += serendipitous_asteroids(catalogs, display=display)
 
+    objects = [target_table(objects)]
+
     # serendipitous variable stars
     if variable_stars:
-        objects += serendipitous_variablestars(catalogs, display=display)
+        objects.append(serendipitous_variablestars(catalogs,
+                                                   display=display))
 
     # select a sufficiently bright star as control star
-    objects += pick_controlstar(catalogs, display=display)
+    objects.append(target_table(pick_controlstar(catalogs,
+                                                 display=display)))
+
+    # the (possibly empty) target table comes first
+    objects = vstack([objects[0]] + [obj for obj in objects[1:]
+                                     if len(obj) > 0],
+                     metadata_conflicts='silent')
 
     if display:
         print('#-----------------------')
@@ -518,46 +597,19 @@ def distill(catalogs, man_targetname, offset, fixed_targets_file, posfile,
         print('{:d} potential target(s) per frame identified.'.format(
             int(len(objects)/len(catalogs))))
 
-    # extract source data for identified targets
+    # extract source data for identified targets; catalogs with the same
+    # fields are stacked and matched with their targets at once
 
     data = []
     targetnames = {}
+    target_data = {}  # data for each target
 
     # sort objects by catalog idx
-    for cat_idx, cat in enumerate(catalogs):
+    objects = objects[np.argsort(objects['cat_idx'], kind='stable')]
 
-        # check for each target if it is within the image boundaries
-        min_ra = np.min(cat['ra_deg'])
-        max_ra = np.max(cat['ra_deg'])
-        min_dec = np.min(cat['dec_deg'])
-        max_dec = np.max(cat['dec_deg'])
-        objects_thiscat = []
-        for obj in objects:
-            if obj['cat_idx'] != cat_idx:
-                continue
-            # # not required since there is exactly one entry per catalog
-            # if (obj['ra_deg'] > max_ra or obj['ra_deg'] < min_ra or
-            #         obj['dec_deg'] > max_dec or obj['dec_deg'] < min_dec):
-            #     if display:
-            #         print('\"%s\" not in image %s' % (obj['ident'],
-            #                                           cat.catalogname))
-            #         logging.info('\"%s\" not in image %s' % (obj['ident'],
-            #                                                  cat.catalogname))
-
-            #     continue
-            objects_thiscat.append(obj)
-
-        if len(objects_thiscat) == 0:
-            continue
-
-        # create a new catalog
-        target_cat = catalog('targetlist:_'+cat.catalogname)
-
-        target_cat.add_fields(['ident', 'ra_deg', 'dec_deg'],
-                              [[obj['ident'] for obj in objects_thiscat],
-                               [obj['ra_deg']
-                                for obj in objects_thiscat],
-                               [obj['dec_deg'] for obj in objects_thiscat]])
+    # group catalogs by fields to be extracted
+    catalog_groups = {}
+    for cat_idx, cat in enumerate(catalogs):
 
         # identify filtername
         filtername = cat.filtername
@@ -579,45 +631,61 @@ def distill(catalogs, man_targetname, offset, fixed_targets_file, posfile,
                 fixed_mag_keys.append(band)
         mag_keys = fixed_mag_keys
 
-        match_keys_other_catalog, extract_other_catalog = [], []
+        extract_other_catalog = []
 
         for key in ['ra_deg', 'dec_deg', 'XWIN_IMAGE', 'YWIN_IMAGE',
                     'FLAGS', 'FWHM_WORLD']:
             if key in cat.fields:
-                match_keys_other_catalog.append(key)
                 extract_other_catalog.append(key)
 
-        match = target_cat.match_with(
-            cat,
-            match_keys_this_catalog=('ra_deg', 'dec_deg'),
-            match_keys_other_catalog=match_keys_other_catalog,
-            extract_this_catalog=['ra_deg', 'dec_deg', 'ident'],
-            extract_other_catalog=extract_other_catalog+mag_keys,
-            tolerance=None)
+        catalog_groups.setdefault((tuple(extract_other_catalog),
+                                   tuple(mag_keys)), []).append(cat_idx)
 
-        for i in range(len(match[0][0])):
-            # derive calibrated magnitudes, if available
-            try:
-                cal_mag = match[1][len(extract_other_catalog)+2][i]
-                cal_magerr = match[1][len(extract_other_catalog)+3][i]
-            except IndexError:
-                # use instrumental magnitudes
-                cal_mag = match[1][len(extract_other_catalog)][i]
-                cal_magerr = match[1][len(extract_other_catalog)+1][i]
-
-            data.append([match[0][2][i], match[0][0][i], match[0][1][i],
-                         match[1][0][i], match[1][1][i],
-                         match[1][len(extract_other_catalog)][i],
-                         match[1][len(extract_other_catalog)+1][i],
-                         cal_mag, cal_magerr,
-                         cat.obstime, cat.catalogname,
-                         match[1][2][i], match[1][3][i],
-                         cat.origin, match[1][4][i], match[1][5][i]])
+    matched = []  # [object index, data] for each matched target
+    for (extract_other_catalog, mag_keys), cat_idc in catalog_groups.items():
+
+        stack = Catalog_Stack([catalogs[cat_idx] for cat_idx in cat_idc],
+                              fields=list(extract_other_catalog+mag_keys))
+
+        # targets in these catalogs and their frame index in the stack
+        obj_idc = np.where(np.isin(objects['cat_idx'], cat_idc))[0]
+        if len(obj_idc) == 0:
+            continue
+        frames = np.searchsorted(cat_idc, objects['cat_idx'][obj_idc])
+
+        match_obj, match_src = stack.match_nearest(
+            np.array(objects['ra_deg'][obj_idc], dtype=float),
+            np.array(objects['dec_deg'][obj_idc], dtype=float),
+            frames, extract=stack.fields)
+        obj_idc = obj_idc[match_obj]
+
+        # derive calibrated magnitudes, if available; use instrumental
+        # magnitudes otherwise
+        cal_keys = mag_keys[2:4] if len(mag_keys) > 3 else mag_keys[:2]
+
+        other = [stack[key][match_src] for key in extract_other_catalog]
+        mag = [stack[key][match_src] for key in mag_keys[:2]+cal_keys]
+        for i, obj_idx in enumerate(obj_idc):
+            cat = catalogs[objects['cat_idx'][obj_idx]]
+            matched.append([obj_idx,
+                            [objects['ident'][obj_idx],
+                             objects['ra_deg'][obj_idx],
+                             objects['dec_deg'][obj_idx],
+                             other[0][i], other[1][i],
+                             mag[0][i], mag[1][i], mag[2][i], mag[3][i],
+                             cat.obstime, cat.catalogname,
+                             other[2][i], other[3][i],
+                             cat.origin, other[4][i], other[5][i]]])
             # format: ident, RA_exp, Dec_exp, RA_img, Dec_img,
             #         mag_inst, sigmag_instr, mag_cal, sigmag_cal
             #         obstime, filename, img_x, img_y, origin, flags
             #         fwhm
-            targetnames[match[0][2][i]] = 1
+
+    # keep order of frames and targets
+    for obj_idx, dat in sorted(matched, key=lambda m: m[0]):
+        data.append(dat)
+        targetnames[dat[0]] = 1
+        target_data.setdefault(dat[0], []).append(dat)
 
     # list of targets
     output['targetnames'] = targetnames
@@ -646,66 +714,65 @@ def distill(catalogs, man_targetname, offset, fixed_targets_file, posfile,
                    'in_sig               [6] [7] [8]    [9]          [10] ' +
                    'FWHM"\n')
 
-        for dat in data:
-            # sort measured magnitudes by target
-            if dat[0] == target:
-                reject_this_target = False
-                try:
-                    filtername = dat[13].split(';')[3]
-                    if 'manual_zp' in dat[13].split(';')[2]:
-                        filtername = dat[13].split(';')[2][0]
-                except IndexError:
-                    filtername = '-'
-                    if (len(dat[13].split(';')) > 2 and
-                            'manual_zp' in dat[13].split(';')[2]):
-                        filtername = dat[13].split(';')[2][0]
-                try:
-                    catalogname = dat[13].split(';')[2]
-                    if 'manual_zp' in catalogname:
-                        catalogname = 'manual_zp'
-                except IndexError:
-                    catalogname = dat[13].split(';')[1]
-                    if 'manual_zp' in catalogname:
-                        catalogname = 'manual_zp'
-
-                # apply rejectionfilter
-                for reject in rejectionfilter.split(','):
-                    if conf.rejection[reject](dat):
-                        logging.info(('reject photometry for target {:s} '
-                                      'from frame {:s} due to rejection '
-                                      'schema {:s}').format(
-                                          dat[0],
-                                          dat[10].replace(' ', '_'),
-                                          reject))
-                        reject_this_target = True
-
-                if reject_this_target:
-                    outf.write('#')
-                else:
-                    outf.write(' ')
-                    output[target].append(dat)
-                outf.write(('%35.35s ' % dat[10].replace(' ', '_')) +
-                           ('%15.7f ' % dat[9][0]) +
-                           ('%8.4f ' % dat[7]) +
-                           ('%6.4f ' % dat[8]) +
-                           ('%13.8f ' % dat[3]) +
-                           ('%+13.8f ' % dat[4]) +
-                           ('%5.2f ' % ((dat[1] - dat[3]) * 3600.)) +
-                           ('%5.2f ' % ((dat[2] - dat[4]) * 3600.)) +
-                           ('%5.2f ' % offset[0]) +
-                           ('%5.2f ' % offset[1]) +
-                           ('%5.2f ' % dat[9][1]) +
-                           ('%8.4f ' % (dat[7] - dat[5])) +
-                           ('%6.4f ' % np.sqrt(dat[8]**2 - dat[6]**2)) +
-                           ('%8.4f ' % dat[5]) +
-                           ('%6.4f ' % dat[6]) +
-                           ('%s ' % catalogname) +
-                           ('%s ' % filtername) +
-                           ('%3d ' % dat[14]) +
-                           ('%s' % dat[13].split(';')[0]) +
-                           ('%10s ' % _pp_conf.photmode) +
-                           ('%4.2f\n' % (dat[15]*3600)))
-                output['targetframes'][target].append(dat[10][:-4]+'fits')
+        # measured magnitudes of this target
+        for dat in target_data[target]:
+            reject_this_target = False
+            try:
+                filtername = dat[13].split(';')[3]
+                if 'manual_zp' in dat[13].split(';')[2]:
+                    filtername = dat[13].split(';')[2][0]
+            except IndexError:
+                filtername = '-'
+                if (len(dat[13].split(';')) > 2 and
+                        'manual_zp' in dat[13].split(';')[2]):
+                    filtername = dat[13].split(';')[2][0]
+            try:
+                catalogname = dat[13].split(';')[2]
+                if 'manual_zp' in catalogname:
+                    catalogname = 'manual_zp'
+            except IndexError:
+                catalogname = dat[13].split(';')[1]
+                if 'manual_zp' in catalogname:
+                    catalogname = 'manual_zp'
+
+            # apply rejectionfilter
+            for reject in rejectionfilter.split(','):
+                if conf.rejection[reject](dat):
+                    logging.info(('reject photometry for target {:s} '
+                                  'from frame {:s} due to rejection '
+                                  'schema {:s}').format(
+                                      dat[0],
+                                      dat[10].replace(' ', '_'),
+                                      reject))
+                    reject_this_target = True
+
+            if reject_this_target:
+                outf.write('#')
+            else:
+                outf.write(' ')
+                output[target].append(dat)
+            outf.write(('%35.35s ' % dat[10].replace(' ', '_')) +
+                       ('%15.7f ' % dat[9][0]) +
+                       ('%8.4f ' % dat[7]) +
+                       ('%6.4f ' % dat[8]) +
+                       ('%13.8f ' % dat[3]) +
+                       ('%+13.8f ' % dat[4]) +
+                       ('%5.2f ' % ((dat[1] - dat[3]) * 3600.)) +
+                       ('%5.2f ' % ((dat[2] - dat[4]) * 3600.)) +
+                       ('%5.2f ' % offset[0]) +
+                       ('%5.2f ' % offset[1]) +
+                       ('%5.2f ' % dat[9][1]) +
+                       ('%8.4f ' % (dat[7] - dat[5])) +
+                       ('%6.4f ' % np.sqrt(dat[8]**2 - dat[6]**2)) +
+                       ('%8.4f ' % dat[5]) +
+                       ('%6.4f ' % dat[6]) +
+                       ('%s ' % catalogname) +
+                       ('%s ' % filtername) +
+                       ('%3d ' % dat[14]) +
+                       ('%s' % dat[13].split(';')[0]) +
+                       ('%10s ' % _pp_conf.photmode) +
+                       ('%4.2f\n' % (dat[15]*3600)))
+            output['targetframes'][target].append(dat[10][:-4]+'fits')
 
         outf.writelines('#\n# [1]: predicted_RA - source_RA [arcsec]\n' +
                         '# [2]: predicted_Dec - source_Dec [arcsec]\n' +
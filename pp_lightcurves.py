@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+""" PP_LIGHTCURVES - cross-match all sources in calibrated image
+                     databases into a master source table with
+                     light curves
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import logging
+import argparse
+import warnings
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+# pipeline-specific modules
+import _pp_conf
+from pp_setup import conflightcurves as conf
+from catalog import *
+import catalog_match
+from catalog_store import read_catalogs
+from catalog_cache import angular_separation
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+
+def frame_photometry(cat):
+    """
+    extract positions and magnitudes from a frame catalog; calibrated
+    magnitudes are used if available (transformed magnitudes are
+    preferred), instrumental magnitudes otherwise
+    return: dictionary of arrays, magnitude key
+    """
+    mag_key = 'MAG_'+_pp_conf.photmode
+    magerr_key = 'MAGERR_'+_pp_conf.photmode
+    if cat.filtername is not None:
+        for prefix in ['_', '']:
+            if (prefix+cat.filtername+'mag' in cat.fields and
+                    prefix+'e_'+cat.filtername+'mag' in cat.fields):
+                mag_key = prefix+cat.filtername+'mag'
+                magerr_key = prefix+'e_'+cat.filtername+'mag'
+                break
+
+    phot = {}
+    for key, field in [('ra', 'ra_deg'), ('dec', 'dec_deg'),
+                       ('mag', mag_key), ('magerr', magerr_key)]:
+        phot[key] = np.ma.filled(np.ma.asarray(cat[field], dtype=float),
+                                 np.nan)
+    if 'FLAGS' in cat.fields:
+        phot['flags'] = np.ma.filled(np.ma.asarray(cat['FLAGS'], dtype=int),
+                                     0)
+    else:
+        phot['flags'] = np.zeros(len(phot['ra']), dtype=int)
+
+    return phot, mag_key
+
+
+class SourceTable():
+    """master source list of a field and its light curves
+
+    Frames are added one at a time: the sources of each frame are
+    matched against the running master list (each master source is
+    assigned the closest frame source within `tolerance`) and
+    unmatched sources are appended as new master sources. Source ids
+    are indices into the master list and never change once assigned.
+    Master positions are the mean positions of all detections.
+    """
+
+    def __init__(self, tolerance=None):
+        if tolerance is None:
+            tolerance = conf.match_tolerance/3600
+        self.tolerance = tolerance  # deg
+        self.vectors = np.zeros((0, 3))  # sum of unit vectors per source
+        self.n_detections = np.zeros(0, dtype=int)
+        self.frames = []  # properties of each frame
+        self.detections = []  # source ids and photometry for each frame
+        self._tree = None
+
+    @property
+    def n_sources(self):
+        return len(self.n_detections)
+
+    def positions(self):
+        """mean positions (deg) of all master sources"""
+        norm = np.sqrt(np.sum(self.vectors**2, axis=1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ra = np.rad2deg(np.arctan2(self.vectors[:, 1],
+                                       self.vectors[:, 0])) % 360
+            dec = np.rad2deg(np.arcsin(self.vectors[:, 2]/norm))
+        ra[norm == 0] = np.nan
+        return ra, dec
+
+    def add_frame(self, cat):
+        """
+        match sources in frame catalog `cat` against the master list
+        return: source ids of the frame sources (-1 for invalid positions)
+        """
+        phot, mag_key = frame_photometry(cat)
+        n = len(phot['ra'])
+        source_id = -np.ones(n, dtype=int)
+
+        if self.n_sources > 0 and n > 0:
+            ra, dec = self.positions()
+            if self._tree is None:
+                self._tree = catalog_match.build_tree(ra, dec)
+            idx_master, idx_frame = catalog_match.match_nearest(
+                ra, dec, phot['ra'], phot['dec'], tree1=self._tree)
+            close = angular_separation(
+                ra[idx_master], dec[idx_master], phot['ra'][idx_frame],
+                phot['dec'][idx_frame]) <= self.tolerance
+            source_id[idx_frame[close]] = idx_master[close]
+
+        # unmatched sources become new master sources
+        new = np.where((source_id < 0) & np.isfinite(phot['ra']) &
+                       np.isfinite(phot['dec']))[0]
+        source_id[new] = self.n_sources + np.arange(len(new))
+        self.vectors = np.vstack([self.vectors, np.zeros((len(new), 3))])
+        self.n_detections = np.hstack([self.n_detections,
+                                       np.zeros(len(new), dtype=int)])
+
+        # update master positions; source ids are unique within a frame
+        valid = source_id >= 0
+        self.vectors[source_id[valid]] += catalog_match.unit_vectors(
+            phot['ra'][valid], phot['dec'][valid])
+        self.n_detections[source_id[valid]] += 1
+        self._tree = None
+
+        self.frames.append({'filename': cat.catalogname,
+                            'obstime_jd': cat.obstime[0],
+                            'exptime': cat.obstime[1],
+                            'filtername': str(cat.filtername),
+                            'mag_key': mag_key})
+        self.detections.append((source_id[valid],
+                                phot['mag'][valid],
+                                phot['magerr'][valid],
+                                phot['flags'][valid]))
+
+        logging.info(('{:s}: {:d} sources matched, {:d} new sources; '
+                      '{:d} master sources').format(
+                          cat.catalogname, np.sum(valid)-len(new),
+                          len(new), self.n_sources))
+
+        return source_id
+
+    def matrices(self):
+        """
+        light curves of all master sources
+        return: magnitude, magnitude uncertainty, and flag arrays of
+                shape (frames, sources); nan or -1, if not detected
+        """
+        shape = (len(self.frames), self.n_sources)
+        mag = np.full(shape, np.nan, dtype=np.float32)
+        magerr = np.full(shape, np.nan, dtype=np.float32)
+        flags = np.full(shape, -1, dtype=np.int16)
+        for i, (ids, m, e, f) in enumerate(self.detections):
+            mag[i, ids] = m
+            magerr[i, ids] = e
+            flags[i, ids] = f
+        return mag, magerr, flags
+
+    def write(self, filename, min_detections=None):
+        """
+        write master source table to a FITS file: SOURCES (master list),
+        FRAMES (frame properties), and MAG, MAGERR, FLAGS images
+        (frames x sources); all master sources are written, so that the
+        table can be extended (see `read`), sources detected in at least
+        `min_detections` frames are marked as `selected` in SOURCES
+        """
+        if min_detections is None:
+            min_detections = conf.min_detections
+        selected = self.n_detections >= max(min_detections, 1)
+        ra, dec = self.positions()
+        mag, magerr, flags = self.matrices()
+
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean_mag = np.nanmean(mag, axis=0)
+            std_mag = np.nanstd(mag, axis=0)
+
+        # sums of unit vectors of all detections allow for an exact
+        # update of mean positions
+        sources = Table([np.arange(self.n_sources), ra, dec,
+                         self.n_detections, mean_mag, std_mag, selected,
+                         self.vectors],
+                        names=['source_id', 'ra_deg', 'dec_deg',
+                               'n_detections', 'mean_mag', 'std_mag',
+                               'selected', 'vector_sum'])
+        frames = Table(rows=[[frame[key] for key in
+                              ['filename', 'obstime_jd', 'exptime',
+                               'filtername', 'mag_key']]
+                             for frame in self.frames],
+                       names=['filename', 'obstime_jd', 'exptime',
+                              'filtername', 'mag_key'],
+                       dtype=[str, float, float, str, str])
+
+        primary = fits.PrimaryHDU()
+        primary.header['NFRAMES'] = (len(self.frames), 'number of frames')
+        primary.header['NSOURCES'] = (self.n_sources, 'number of sources')
+        primary.header['NSELECT'] = (int(np.sum(selected)),
+                                     'number of selected sources')
+        primary.header['MINDETEC'] = (min_detections,
+                                      'minimum detections of selected sources')
+        primary.header['TOLERANC'] = (self.tolerance*3600,
+                                      'match tolerance (arcsec)')
+        hdus = fits.HDUList([primary,
+                             fits.table_to_hdu(sources),
+                             fits.table_to_hdu(frames),
+                             fits.ImageHDU(mag),
+                             fits.ImageHDU(magerr),
+                             fits.ImageHDU(flags)])
+        for hdu, name in zip(hdus[1:], ['SOURCES', 'FRAMES', 'MAG',
+                                        'MAGERR', 'FLAGS']):
+            hdu.name = name
+        hdus.writeto(filename, overwrite=True)
+
+        logging.info(('master source table with {:d} sources ({:d} '
+                      'selected) and {:d} frames written to {:s}').format(
+                          self.n_sources, int(np.sum(selected)),
+                          len(self.frames), filename))
+
+    @classmethod
+    def read(cls, filename):
+        """read master source table from FITS file written by `write`"""
+        hdus = fits.open(filename)
+        table = cls(tolerance=hdus[0].header['TOLERANC']/3600)
+        sources = Table(hdus['SOURCES'].data)
+        frames = Table(hdus['FRAMES'].data)
+        mag, magerr, flags = (hdus['MAG'].data, hdus['MAGERR'].data,
+                              hdus['FLAGS'].data)
+
+        ids = np.array(sources['source_id'], dtype=int)
+        table.n_detections = np.array(sources['n_detections'], dtype=int)
+        table.vectors = np.array(sources['vector_sum'], dtype=float)
+
+        for i, frame in enumerate(frames):
+            table.frames.append({key: frame[key] for key in frames.columns})
+            detected = flags[i] >= 0
+            table.detections.append((ids[detected],
+                                     np.array(mag[i][detected], dtype=float),
+                                     np.array(magerr[i][detected],
+                                              dtype=float),
+                                     np.array(flags[i][detected],
+                                              dtype=int)))
+        hdus.close()
+
+        return table
+
+
+def lightcurves(catalogs, outfilename=None, update=False, display=False):
+    """
+    lightcurves wrapper: build master source table from calibrated
+    frame catalogs (or image filenames) and write it to `outfilename`;
+    if `update` is set, frames are added to an existing table
+    """
+
+    # start logging
+    logging.info('starting lightcurves with parameters: %s' %
+                 (', '.join([('%s: %s' % (var, str(val))) for
+                             var, val in list(locals().items())])))
+
+    if outfilename is None:
+        outfilename = conf.output_filename
+
+    # read in calibrated catalogs (if necessary)
+    if isinstance(catalogs[0], str):
+        catalogs = read_catalogs(catalogs)
+
+    if update and os.path.exists(outfilename):
+        table = SourceTable.read(outfilename)
+        known = set([frame['filename'] for frame in table.frames])
+        if display:
+            print('{:d} frames and {:d} sources read from {:s}'.format(
+                len(table.frames), table.n_sources, outfilename))
+    else:
+        table = SourceTable()
+        known = set()
+
+    # frames are added in temporal order
+    catalogs = sorted([cat for cat in catalogs
+                       if cat.catalogname not in known],
+                      key=lambda cat: cat.obstime[0])
+
+    for cat in catalogs:
+        table.add_frame(cat)
+        if display:
+            print('{:s}: {:d} sources, {:d} master sources'.format(
+                cat.catalogname, cat.shape[0], table.n_sources))
+
+    table.write(outfilename)
+
+    if display:
+        print('master source table with {:d} frames written to {:s}'.format(
+            len(table.frames), outfilename))
+
+    logging.info('Done! ------------------------------------------------')
+
+    return table
+
+
+if __name__ == '__main__':
+
+    # command line arguments
+    parser = argparse.ArgumentParser(
+        description='build master source table and light curves')
+    parser.add_argument('-output', help='output filename',
+                        default=conf.output_filename)
+    parser.add_argument('-update', help='add frames to existing table',
+                        action="store_true")
+    parser.add_argument('-tolerance', help='match tolerance (arcsec)',
+                        type=float, default=None)
+    parser.add_argument('-min_detections', help=('minimum number of '
+                                                 'detections per source'),
+                        type=int, default=None)
+    parser.add_argument('images', help='images to process', nargs='+')
+    args = parser.parse_args()
+    filenames = args.images
+
+    if args.tolerance is not None:
+        conf.match_tolerance = args.tolerance
+    if args.min_detections is not None:
+        conf.min_detections = args.min_detections
+
+    # check if input filenames is actually a list
+    if len(filenames) == 1:
+        if filenames[0].find('.lst') > -1 or filenames[0].find('.list') > -1:
+            filenames = [filename[:-1] for filename in
+                         open(filenames[0], 'r').readlines()]
+
+    lightcurves(filenames, args.output, update=args.update, display=True)
@@ -104,10 +104,11 @@ class Clicker(object):
 
         # find source closest to click position in ldac, identify
         # source index
-        residuals = numpy.sqrt((self.ldac[self.index]['XWIN_IMAGE']-x)**2 +
-                               (self.ldac[self.index]['YWIN_IMAGE']-y)**2)
-        closest_idx = numpy.argmin(residuals)
-        self.target_index[self.index] = closest_idx
+        closest_idx, residual = self.ldac[self.index].nearest(x, y,
+                                                              pixel=True)
+        if len(closest_idx) == 0:
+            return
+        self.target_index[self.index] = closest_idx[0]
         self.nextframe(0)
 
     def right_click(self, event):
@@ -276,11 +277,11 @@ class Clicker(object):
                                               k=k)
 
             # identify closest source
-            residuals = numpy.sqrt((self.ldac[self.index]['XWIN_IMAGE'] -
-                                    fx(time))**2 +
-                                   (self.ldac[self.index]['YWIN_IMAGE'] -
-                                    fy(time))**2)
-            return numpy.argmin(residuals)
+            closest_idx, residual = self.ldac[self.index].nearest(
+                float(fx(time)), float(fy(time)), pixel=True)
+            if len(closest_idx) == 0:
+                return None
+            return closest_idx[0]
         else:
             return None
 
@@ -31,7 +31,6 @@ import argparse
 from astropy.io import fits
 import matplotlib
 matplotlib.use('Agg')
-from astroquery.jplhorizons import Horizons
 
 # only import if Python3 is used
 if sys.version_info > (3, 0):
@@ -42,6 +41,7 @@ if sys.version_info > (3, 0):
 import _pp_conf
 import pp_extract
 from catalog import *
+from ephemerides import get_ephemerides
 from toolbox import *
 from diagnostics import photometry as diag
 
@@ -91,23 +91,18 @@ def curve_of_growth_analysis(filenames, parameters,
     background_snr = []  # numpy.zeros(len(aprads))
     target_snr = []  # numpy.zeros(len(aprads))
 
-    for filename in filenames:
-
-        if display:
-            print('processing curve-of-growth for frame %s' % filename)
-
-        if not parameters['background_only']:
-
+    # obtain target positions for all frames at once
+    target_positions = {}
+    if not parameters['background_only']:
+        frame_epochs = {}
+        for filename in filenames:
             hdu = fits.open(filename, ignore_missing_end=True)
 
-            # pull target coordinates from Horizons
             targetname = hdu[0].header[obsparam['object']]
             if parameters['manobjectname'] is not None:
                 targetname = parameters['manobjectname'].translate(
                     _pp_conf.target2filename)
 
-            image = hdu[0].data
-
             # derive MIDTIMJD, if not yet in the FITS header
             obsparam = parameters['obsparam']
             if not 'MIDTIMJD' in hdu[0].header:
@@ -123,34 +118,43 @@ def curve_of_growth_analysis(filenames, parameters,
                     date = dateobs_to_jd(date) + exptime/2./86400.
             else:
                 date = hdu[0].header['MIDTIMJD']
+            hdu.close()
 
-            # call HORIZONS to get target coordinates
-            obj = Horizons(targetname.replace('_', ' '),
-                           epochs=date,
-                           location=str(obsparam['observatory_code']))
-            try:
-                eph = obj.ephemerides()
-                n = len(eph)
-            except ValueError:
-                print('Target (%s) not a small body' % targetname)
-                logging.warning('Target (%s) not a small body' % targetname)
-                n = None
+            frame_epochs.setdefault(targetname, []).append((filename, date))
 
-            if n is None or n == 0:
+        # call HORIZONS to get target coordinates
+        for targetname, frames in frame_epochs.items():
+            eph = get_ephemerides(targetname.replace('_', ' '),
+                                  [date for filename, date in frames],
+                                  obsparam['observatory_code'])
+            if eph is None:
+                print('Target (%s) not a small body' % targetname)
                 logging.warning('WARNING: No position from Horizons!' +
                                 'Name (%s) correct?' % targetname)
-                logging.warning('HORIZONS call: %s' % obj.uri)
-                logging.info('proceeding with background sources analysis')
-                parameters['background_only'] = True
-            else:
-                logging.info('ephemerides for %s pulled from Horizons' %
-                             targetname)
-                target_ra, target_dec = eph[0]['RA'], eph[0]['DEC']
+                continue
+            for (filename, date), ephrow in zip(frames, eph):
+                target_positions[filename] = (targetname, ephrow['RA'],
+                                              ephrow['DEC'])
+
+        if len(target_positions) < len(filenames):
+            logging.info('proceeding with background sources analysis')
+            parameters['background_only'] = True
+
+    for filename in filenames:
+
+        if display:
+            print('processing curve-of-growth for frame %s' % filename)
+
+        if not parameters['background_only']:
+            targetname, target_ra, target_dec = target_positions[filename]
 
         # pull data from LDAC file
         ldac_filename = filename[:filename.find('.fit')]+'.ldac'
         data = catalog('Sextractor_LDAC')
-        data.read_ldac(ldac_filename, maxflag=3)
+        data.read_ldac(ldac_filename, maxflag=3,
+                       fields=['ra_deg', 'dec_deg', 'FLAGS',
+                               'FLUX_'+_pp_conf.photmode,
+                               'FLUXERR_'+_pp_conf.photmode])
 
         if data.shape[0] == 0:
             continue
@@ -158,25 +162,22 @@ def curve_of_growth_analysis(filenames, parameters,
         # identify target and extract its curve-of-growth
         n_target_identified = 0
         if not parameters['background_only']:
-            residuals = numpy.sqrt((data['ra_deg']-target_ra)**2 +
-                                   (data['dec_deg']-target_dec)**2)
+            target_idx, residual = data.nearest(target_ra, target_dec)
 
-            target_idx = numpy.argmin(residuals)
-            if residuals[target_idx] > _pp_conf.pos_epsilon/3600:
+            if (len(target_idx) == 0 or
+                    residual[0] > _pp_conf.pos_epsilon/3600):
                 logging.warning(('WARNING: frame %s, large residual to ' +
                                  'HORIZONS position of %s: %f arcsec; ' +
                                  'ignore this frame') %
                                 (filename, targetname,
-                                 residuals[numpy.argmin(residuals)]*3600.))
+                                 (residual[0] if len(residual) > 0
+                                  else numpy.nan)*3600.))
             else:
-                target_flux.append(data[target_idx]['FLUX_'+_pp_conf.photmode] /
-                                   max(data[target_idx][
-                                       'FLUX_'+_pp_conf.photmode]))
-                target_snr.append(
-                    data[target_idx]['FLUX_'+_pp_conf.photmode] /
-                    data[target_idx]['FLUXERR_'+_pp_conf.photmode] /
-                    max(data[target_idx]['FLUX_'+_pp_conf.photmode] /
-                        data[target_idx]['FLUXERR_'+_pp_conf.photmode]))
+                target_idx = target_idx[0]
+                flux = data['FLUX_'+_pp_conf.photmode][target_idx]
+                fluxerr = data['FLUXERR_'+_pp_conf.photmode][target_idx]
+                target_flux.append(flux/max(flux))
+                target_snr.append(flux/fluxerr/max(flux/fluxerr))
                 n_target_identified += 1
 
         # extract background source fluxes and snrs
@@ -184,19 +185,16 @@ def curve_of_growth_analysis(filenames, parameters,
         if not parameters['target_only']:
             # n_src = data.shape[0] # use all sources
             n_src = 50  # use only 50 sources
-            for idx, src in enumerate(data.data[:n_src]):
-                if (numpy.any(numpy.isnan(src['FLUX_'+_pp_conf.photmode])) or
-                    numpy.any(numpy.isnan(src['FLUXERR_'+_pp_conf.photmode]))
-                        or src['FLAGS'] > 3):
-                    continue
-
-                # create growth curve
-                background_flux.append(src['FLUX_'+_pp_conf.photmode] /
-                                       max(src['FLUX_'+_pp_conf.photmode]))
-                background_snr.append(src['FLUX_'+_pp_conf.photmode] /
-                                      src['FLUXERR_'+_pp_conf.photmode] /
-                                      max(src['FLUX_'+_pp_conf.photmode] /
-                                          src['FLUXERR_'+_pp_conf.photmode]))
+            flux = numpy.array(data['FLUX_'+_pp_conf.photmode][:n_src])
+            fluxerr = numpy.array(data['FLUXERR_'+_pp_conf.photmode][:n_src])
+            use = (~numpy.any(numpy.isnan(flux), axis=1) &
+                   ~numpy.any(numpy.isnan(fluxerr), axis=1) &
+                   (numpy.array(data['FLAGS'][:n_src]) <= 3))
+            flux, snr = flux[use], flux[use]/fluxerr[use]
+
+            # create growth curves
+            background_flux += list(flux/numpy.max(flux, axis=1)[:, None])
+            background_snr += list(snr/numpy.max(snr, axis=1)[:, None])
 
     # investigate curve-of-growth
 
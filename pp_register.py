@@ -36,6 +36,7 @@ from astropy.io import fits
 
 # pipeline-specific modules
 import _pp_conf
+from pp_setup import confregister as conf
 from catalog import *
 import pp_extract
 import toolbox
@@ -124,7 +125,7 @@ def register(filenames, telescope, sex_snr, source_minarea, aprad,
                               frame['fits_filename'],
                               object_keyword=obsparam['object'],
                               exptime_keyword=obsparam['exptime'],
-                              maxflag=0)
+                              maxflag=0, fields=['ra_deg', 'dec_deg'])
                 ldac_catalogs.append(cat)
 
         if len(ldac_files) == 0:
@@ -190,13 +191,26 @@ def register(filenames, telescope, sex_snr, source_minarea, aprad,
 
         fileline = " ".join(ldac_files)
 
-        del(ldac_catalogs)
+        # download catalog once; the number of sources retrieved decides
+        # whether the catalog is sufficient for SCAMP
+        astcat = catalog(refcat, display=True)
+        n_sources = astcat.download_catalog(ra, dec,
+                                            rad+obsparam['reg_search_radius'],
+                                            100000,
+                                            max_mag=obsparam['reg_max_mag'],
+                                            save_catalog=False)
+
+        # only keep reference sources within the frame footprints
+        if conf.trim_reference and n_sources > 0:
+            n_sources = astcat.reject_sources_other_than(
+                toolbox.footprint_mask(ldac_catalogs,
+                                       astcat['ra_deg'].data,
+                                       astcat['dec_deg'].data,
+                                       margin=obsparam['reg_search_radius']))
+            logging.info(('{:d} {:s} sources within frame '
+                          'footprints').format(n_sources, refcat))
 
-        checkrefcat = catalog(refcat, display=False)
-        n_sources = checkrefcat.download_catalog(ra, dec,
-                                                 rad +
-                                                 obsparam['reg_search_radius'],
-                                                 100, save_catalog=False)
+        del(ldac_catalogs)
         if n_sources < _pp_conf.min_sources_astrometric_catalog:
             logging.info(('Only %d sources in astrometric reference catalog; '
                           + 'try other catalog') % n_sources)
@@ -213,13 +227,8 @@ def register(filenames, telescope, sex_snr, source_minarea, aprad,
         logging.info('run SCAMP on %d image files, match with catalog %s ' %
                      (len(filenames), refcat))
 
-        # download catalog and write to ldac file for SCAMP
-        astcat = catalog(refcat, display=True)
-        n_sources = astcat.download_catalog(ra, dec,
-                                            rad+obsparam['reg_search_radius'],
-                                            100000,
-                                            max_mag=obsparam['reg_max_mag'],
-                                            save_catalog=True)
+        # write catalog to ldac file for SCAMP
+        astcat.write_ldac(refcat+'.cat')
 
         # translate source_tolerance into SCAMP properties
         #   code      SCAMP_code   keep
@@ -46,6 +46,8 @@ if sys.version_info > (3, 0):
 
 # pipeline-specific modules
 import _pp_conf
+import toolbox
+from pp_setup import confcalibrate
 from catalog import *
 import pp_prepare
 import pp_extract
@@ -230,6 +232,23 @@ def run_the_pipeline(filenames, man_targetname, man_filtername,
         diag.abort('pp_registration')
         return None
 
+    # start downloading photometric catalogs while photometry is running
+    if confcalibrate.prefetch_catalogs:
+        ldac_catalogs = []
+        for filename in filenames:
+            ldac_cat = catalog(filename)
+            ldac_cat.read_ldac(filename[:filename.find('.fit')]+'.ldac',
+                               filename, maxflag=3,
+                               fields=['ra_deg', 'dec_deg'])
+            if ldac_cat.shape[0] > 0:
+                ldac_catalogs.append(ldac_cat)
+        if len(ldac_catalogs) > 0:
+            ra_deg, dec_deg, rad_deg = toolbox.skycenter(ldac_catalogs)
+            pp_calibrate.prefetch_photometrycatalogs(
+                ra_deg, dec_deg, rad_deg*(1+confcalibrate.prefetch_margin),
+                obsparam['photometry_catalogs'], max_sources=2e4)
+        del(ldac_catalogs)
+
     # run photometry (curve-of-growth analysis)
     snr, source_minarea = 1.5, obsparam['source_minarea']
     background_only = False
@@ -27,6 +27,7 @@ will override the definitions in this class. Definitions below are
 group into different class based on their pp function association.
 """
 
+import os
 from numpy import sqrt
 
 
@@ -36,6 +37,67 @@ class Conf():
     diagnostics = True  # produce diagnostic files and website?
 
 
+class ConfCatalog(Conf):
+    """configuration setup for catalog access"""
+
+    # local cache for catalog queries
+    cache_catalogs = True  # keep downloaded catalogs in a local cache?
+    cache_path = os.path.join(os.path.expanduser('~'), '.pp_cache')
+    # directory for cached catalogs; shared by all pipeline runs
+    cache_max_size = 2000  # maximum cache size (MB); least recently
+    # used catalogs are removed first
+
+    # HEALPix-tiled local reference catalog store (see pptool_tilestore)
+    use_tile_store = False  # serve catalog queries from local tiles?
+    tile_store_path = os.path.join(os.path.expanduser('~'), '.pp_tiles')
+    tile_nside = 32  # HEALPix resolution of tiles (32: ~1.8 deg)
+    fill_tile_store = False  # add downloaded catalogs to the tile store?
+
+    # never contact remote servers; only use local data
+    offline = False
+
+    # accumulate source rejections in a mask that is applied to the
+    # catalog table only when the full table is accessed
+    lazy_rejection = True
+
+    # per-run database of calibrated frame catalogs in the working
+    # directory (see catalog_store); None: one database file per frame
+    photometry_store = 'photometry.db'
+    frame_databases = False  # also write one database file per frame?
+
+
+class ConfServices(Conf):
+    """configuration setup for remote services"""
+
+    # redirect queries to Vizier, SDSS, JPL Horizons, and IMCCE SkyBoT
+    # to a local stand-in server (see pptool_standin), e.g.,
+    # 'http://localhost:8765'; None: use the actual services
+    standin_url = os.environ.get('PP_STANDIN_URL')
+
+    # IMCCE SkyBoT cone search service
+    skybot_server = ('http://vo.imcce.fr/webservices/skybot/'
+                     'skybotconesearch_query.php')
+
+
+class ConfEphemerides(Conf):
+    """configuration setup for JPL Horizons ephemerides"""
+
+    # cache for ephemerides
+    cache_ephemerides = True  # keep ephemerides in a persistent cache?
+    cache_path = os.path.join(os.path.expanduser('~'), '.pp_cache')
+    # directory for the ephemerides cache
+    max_age = 30  # age (days) after which cached ephemerides are renewed
+
+    max_epochs_per_query = 200  # maximum number of epochs per query
+
+    # interpolation of ephemerides for long sequences
+    interpolate = True  # interpolate ephemerides for long sequences?
+    interpolation_min_epochs = 50  # minimum number of epochs
+    interpolation_nodes = 9  # Horizons positions per interpolation segment
+    max_interpolation_error = 0.1  # maximum interpolation error (arcsec);
+    # segments with larger errors are split, if possible
+
+
 class ConfPrepare(Conf):
     """configuration setup for pp_prepare"""
     pass
@@ -43,7 +105,10 @@ class ConfPrepare(Conf):
 
 class ConfRegister(Conf):
     """configuration setup for pp_register"""
-    pass
+
+    # restrict astrometric reference catalog to the frame footprints
+    # (widened by `reg_search_radius`) before running SCAMP
+    trim_reference = True
 
 
 class ConfPhotometry(Conf):
@@ -63,6 +128,17 @@ class ConfCalibrate(Conf):
     # add photometric calibration raw data to frame database
     caldata_in_db = True  # add calibration data to database file?
 
+    # download candidate photometric catalogs concurrently
+    prefetch_catalogs = True  # request all catalogs at once?
+    prefetch_threads = 4  # number of concurrent downloads
+    prefetch_margin = 0.2  # fractional radius margin for prefetches
+    # started after registration (pp_run)
+
+    # keep transformed photometric catalogs in the catalog cache (see
+    # ConfCatalog.cache_path); entries are keyed by catalog, field,
+    # filter, and version of the transformations
+    cache_transformed = True  # reuse transformed catalogs?
+
 
 class ConfDistill(Conf):
     """configuration setup for pp_distill"""
@@ -76,6 +152,16 @@ class ConfDistill(Conf):
                                  (dat[2]-dat[4])**2)*3600 > 10),
     }
 
+    # serendipitous variable stars
+    vsx_max_sources = 100000  # maximum number of VSX entries per field
+
+    # serendipitous asteroids
+    asteroid_positions = 'skybot'  # 'skybot': extrapolate positions and
+    # rates from the SkyBoT query (no additional queries), 'horizons': one
+    # batched Horizons query per asteroid
+    skybot_max_timespan = 12  # maximum extrapolation time (hr) for
+    # 'skybot'; Horizons is used for longer sequences
+
 
 class ConfDiagnostics(Conf):
     """configuration setup for diagnostics"""
@@ -125,6 +211,16 @@ class ConfDiagnostics(Conf):
     thumb_predicted_pos_color = 'cornflowerblue'  # marker color
 
 
+class ConfLightcurves(Conf):
+    """configuration setup for pp_lightcurves"""
+
+    match_tolerance = 1.0  # maximum separation (arcsec) of a frame source
+    # from its master source
+    min_detections = 2  # minimum number of detections for a source to be
+    # selected in the master source table
+    output_filename = 'lightcurves.fits'  # master source table file
+
+
 class ConfCombine(Conf):
     """configuration setup for pp_combine"""
     pass
@@ -135,7 +231,12 @@ class ConfMPCReport(Conf):
     pass
 
 
+confcatalog = ConfCatalog()
+confservices = ConfServices()
+confephemerides = ConfEphemerides()
 confprepare = ConfPrepare()
+confregister = ConfRegister()
 confcalibrate = ConfCalibrate()
 confdistill = ConfDistill()
+conflightcurves = ConfLightcurves()
 confdiagnostics = ConfDiagnostics()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+
+""" PPTOOL_STANDIN - local stand-in server for Vizier, SDSS, JPL Horizons,
+                     and IMCCE SkyBoT
+
+    v1.0: 2026-10-16
+
+The stand-in server answers requests from the pipeline if
+`ConfServices.standin_url` in pp_setup.py (or the environment variable
+PP_STANDIN_URL) points to it. Each request is answered with (1) a
+previously recorded response, or (2) a synthesized response (Vizier
+catalogs, Horizons ephemerides, SkyBoT cone searches), or, in recording
+mode, (3) by forwarding it to the actual service and recording the
+response.
+"""
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from io import BytesIO
+from urllib.parse import urlparse, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+from astropy.table import Table
+from astropy.io.votable import from_table, writeto
+from astropy.time import Time
+from astropy.coordinates import Angle
+
+# pipeline-specific modules
+import _pp_conf
+import services
+from catalog_cache import angular_separation
+from catalog_tiles import offset_positions
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+
+class StandIn():
+    """stand-in service state and response synthesis"""
+
+    def __init__(self, path, record=False, synthesize=True, latency=0,
+                 density=5000, n_asteroids=3, target=None, verbose=False):
+        self.path = path
+        self.record = record
+        self.synthesize = synthesize
+        self.latency = latency
+        self.density = density  # synthetic catalog sources per sq deg
+        self.n_asteroids = n_asteroids  # synthetic SkyBoT objects
+        # synthetic primary target: ra_deg, dec_deg, RA/Dec rates
+        # ("/hr) at epoch_jd
+        self.target = target
+        self.verbose = verbose
+
+        # field center and epoch seen last; synthetic ephemerides are
+        # placed in this field
+        self.field = (180., 0., 0.1)
+        self.epoch = None
+
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    # recorded responses
+
+    def request_key(self, method, path, query, body):
+        key = hashlib.sha1()
+        for item in (method, path, '&'.join(sorted(query.split('&'))),
+                     body):
+            key.update(item if isinstance(item, bytes)
+                       else item.encode('utf-8'))
+            key.update(b'|')
+        return key.hexdigest()
+
+    def response_filename(self, service, key):
+        return os.path.join(self.path, service, key)
+
+    def replay(self, service, key):
+        """return recorded response (status, content type, body) or None"""
+        filename = self.response_filename(service, key)
+        if not os.path.exists(filename+'.json'):
+            return None
+        meta = json.load(open(filename+'.json', 'r'))
+        with open(filename+'.dat', 'rb') as f:
+            body = f.read()
+        return meta['status'], meta['content_type'], body
+
+    def forward(self, service, key, method, path, query, body, headers):
+        """forward request to actual service and record the response"""
+        url = services.upstream[service] + path
+        if query:
+            url += '?' + query
+        r = requests.request(method, url, data=body if body else None,
+                             headers={key: val for key, val in
+                                      headers.items() if key.lower() in
+                                      ('content-type', 'accept')},
+                             timeout=600)
+        content_type = r.headers.get('Content-Type', 'text/plain')
+
+        filename = self.response_filename(service, key)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename+'.dat', 'wb') as f:
+            f.write(r.content)
+        json.dump({'status': r.status_code, 'content_type': content_type,
+                   'method': method, 'url': url},
+                  open(filename+'.json', 'w'))
+
+        return r.status_code, content_type, r.content
+
+    # synthesized responses
+
+    def magnitudes(self, rng, n, max_mag):
+        """magnitudes following a simple N(m) ~ 10**(0.3 m) law"""
+        lo, hi = 10**(0.3*10), 10**(0.3*max_mag)
+        return np.log10(rng.uniform(lo, hi, n))/0.3
+
+    def synthesize_vizier(self, body):
+        """synthesize a Vizier VOTable response"""
+
+        script = {}
+        for line in body.decode('utf-8').split('\n'):
+            if '=' in line:
+                key, val = line.split('=', 1)
+                script[key.strip()] = val.strip()
+            elif line.strip():
+                script[line.strip()] = ''
+
+        source = script.get('-source', 'unknown')
+        columns = [col for col in script.get('-out', '').split(',') if col]
+        max_rows = int(float(script.get('-out.max', 50)))
+
+        # field center and radius or box size
+        center = re.match(r'\s*([0-9.]+)\s*([+-][0-9.]+)',
+                          script.get('-c', '180+0'))
+        ra_deg, dec_deg = float(center.group(1)), float(center.group(2))
+        rad_deg, box = None, None
+        for unit, factor in [('d', 1), ('m', 1/60), ('s', 1/3600)]:
+            if '-c.r'+unit in script:
+                rad_deg = float(script['-c.r'+unit])*factor
+            if '-c.b'+unit in script:
+                box = [float(x)*factor for x in
+                       script['-c.b'+unit].split('x')]
+        if rad_deg is None:
+            rad_deg = 0.5 if box is None else np.hypot(*box)/2
+        with self.lock:
+            self.field = (ra_deg, dec_deg, rad_deg)
+
+        # magnitude limit from column filters
+        max_mag = 21.
+        for key, val in script.items():
+            if key.endswith('mag') and val.startswith('<'):
+                max_mag = float(val[1:])
+
+        seed = int(hashlib.md5(body).hexdigest()[:8], 16)
+        rng = np.random.default_rng(seed)
+        area = np.pi*rad_deg**2 if box is None else box[0]*box[1]
+        n = min(max_rows, rng.poisson(self.density*area))
+        dist = rad_deg*np.sqrt(rng.uniform(0, 1, n))
+        ra, dec = offset_positions(ra_deg, dec_deg, dist,
+                                   rng.uniform(0, 360, n))
+        mag = self.magnitudes(rng, n, max_mag)
+
+        data = Table()
+        for col in columns:
+            if col in ('RAJ2000', 'RA_ICRS', 'RAdeg', '_RAJ2000'):
+                data[col] = ra
+                data[col].unit = 'deg'
+            elif col in ('DEJ2000', 'DE_ICRS', 'DEdeg', '_DEJ2000'):
+                data[col] = dec
+                data[col].unit = 'deg'
+            elif col.startswith('e_RA') or col.startswith('e_DE'):
+                data[col] = rng.uniform(10, 50, n)
+                data[col].unit = 'mas'
+            elif col in ('errMaj', 'errMin'):
+                data[col] = rng.uniform(0.06, 0.1, n)
+                data[col].unit = 'arcsec'
+            elif col == 'errPA':
+                data[col] = rng.uniform(1, 180, n)
+                data[col].unit = 'deg'
+            elif col == 'sigm':
+                data[col] = rng.uniform(5, 20, n)
+                data[col].unit = 'mas'
+            elif col in ('pmRA', 'pmDE'):
+                data[col] = rng.normal(0, 5, n)
+                data[col].unit = 'mas/yr'
+            elif col == 'Epoch':
+                data[col] = np.ones(n)*2015.5
+            elif col in ('Qflg', 'Rflg'):
+                data[col] = np.array([{'Qflg': 'AAA', 'Rflg': '222'}[col]]*n)
+            elif col == 'q_mode':
+                data[col] = np.array(['+']*n)
+            elif col == 'mode':
+                data[col] = np.ones(n, dtype=int)
+            elif col.startswith('e_') or col.startswith('eRP'):
+                data[col] = np.clip(0.005+0.02*10**(0.4*(mag-19)), 0, 0.5)
+                data[col].unit = 'mag'
+            elif 'mag' in col:
+                # band-dependent color offset
+                offset = (int(hashlib.md5(col.encode()).hexdigest()[:2], 16)
+                          / 255 - 0.5)
+                data[col] = mag + offset + rng.normal(0, 0.01, n)
+                data[col].unit = 'mag'
+            elif col == 'Name':
+                data[col] = np.array(['SYN V{:d}'.format(i+1)
+                                      for i in range(n)])
+            else:
+                # identifiers and anything else
+                data[col] = np.arange(1, n+1, dtype=np.int64) + seed
+
+            # naming conventions of Vizier VOTables
+            name = col
+            if source.startswith('I/337') and col == 'phot_g_mean_mag':
+                name = '<Gmag>'
+            name = re.sub(r"['<>]", '_', name)
+            if not name[0].isalpha():
+                name = '_' + name
+            if name != col:
+                data.rename_column(col, name)
+
+        output = BytesIO()
+        votable = from_table(data)
+        votable.resources[0].name = source
+        votable.resources[0].tables[0].name = source
+        writeto(votable, output)
+
+        return 200, 'text/xml', output.getvalue()
+
+    def ephemeris(self, targetname, epochs):
+        """synthetic linear ephemeris: ra_deg, dec_deg, rates ("/hr)"""
+        epochs = np.array(epochs)
+        with self.lock:
+            if self.epoch is None:
+                self.epoch = epochs[0]
+            epoch0 = self.epoch
+            field = self.field
+
+        if self.target is not None and not targetname.startswith('SYN'):
+            ra0, dec0, dra, ddec, epoch0 = self.target
+        else:
+            seed = int(hashlib.md5(targetname.encode('utf-8')).hexdigest()
+                       [:8], 16)
+            rng = np.random.default_rng(seed)
+            # SkyBoT objects are spread over the field, any other
+            # target is placed close to the field center
+            if targetname.startswith('SYN'):
+                dist = field[2]*np.sqrt(rng.uniform(0, 0.8))
+            else:
+                dist = min(field[2], 0.02)*rng.uniform(0, 1)
+            ra0, dec0 = offset_positions(field[0], field[1], dist,
+                                         rng.uniform(0, 360))
+            dra, ddec = rng.uniform(-60, 60, 2)
+
+        dt = (epochs-epoch0)*24  # hr
+        dec = dec0 + ddec*dt/3600
+        ra = (ra0 + dra*dt/3600/np.cos(np.deg2rad(dec))) % 360
+        return ra, dec, dra, ddec
+
+    def synthesize_horizons(self, params):
+        """synthesize a JPL Horizons ephemerides text response"""
+
+        targetname = params.get('COMMAND', '').strip('"\'').rstrip(';')
+        if 'TLIST' in params:
+            epochs = [float(epoch.strip('\'"'))
+                      for epoch in params['TLIST'].split()]
+        elif 'START_TIME' in params:
+            start, stop = [params[key].strip('\'"') for key
+                           in ('START_TIME', 'STOP_TIME')]
+            start, stop = [float(t[2:]) if t.startswith('JD')
+                           else Time(t.replace('_', ' ')).jd
+                           for t in (start, stop)]
+            step = params.get('STEP_SIZE', '1d').strip('\'"')
+            if step[-1].isdigit():
+                epochs = np.linspace(start, stop, int(step)+1)
+            else:
+                step = float(step[:-1])*{'m': 1/1440, 'h': 1/24,
+                                         'd': 1}[step[-1]]
+                epochs = np.arange(start, stop+step/2, step)
+        else:
+            return (200, 'text/plain',
+                    b'Cannot interpret date. Type "?!" or try YYYY-MMM-DD\n')
+
+        ra, dec, dra, ddec = self.ephemeris(targetname, epochs)
+
+        lines = ['*'*79,
+                 ' Target body name: {:31s} {{source: standin}}'.format(
+                     targetname),
+                 ' Center body name: Earth (399)                '
+                 '   {source: standin}',
+                 '*'*79,
+                 (' Date__(UT)__HR:MN, Date_________JDUT, , , R.A._(ICRF), '
+                  'DEC_(ICRF), dRA*cosD, d(DEC)/dt, APmag, S-brt, r, '
+                  'rdot, delta, deldot, S-O-T, /r, S-T-O,'),
+                 '*'*79,
+                 '$$SOE']
+        for epoch, ra_deg, dec_deg in zip(epochs, np.atleast_1d(ra),
+                                          np.atleast_1d(dec)):
+            lines.append(
+                (' {:s}, {:.9f}, , , {:.5f}, {:.5f}, {:.4f}, {:.4f}, '
+                 '18.000, n.a., 2.5, 0.0, 1.5, 0.0, 170.0, /L, 5.0,').format(
+                     Time(epoch, format='jd').strftime('%Y-%b-%d %H:%M'),
+                     epoch, ra_deg, dec_deg, dra, ddec))
+        lines += ['$$EOE', '*'*79]
+
+        return 200, 'text/plain', '\n'.join(lines).encode('utf-8')
+
+    def synthesize_skybot(self, params):
+        """synthesize an IMCCE SkyBoT cone search text response"""
+
+        ra_deg, dec_deg = float(params['RA']), float(params['DEC'])
+        rad_deg = float(params['SR'])
+        epoch = float(params['EPOCH'])
+        with self.lock:
+            self.field = (ra_deg, dec_deg, rad_deg)
+            if self.epoch is None:
+                self.epoch = epoch
+
+        if self.n_asteroids == 0:
+            return (200, 'text/plain',
+                    b'# Flag: 0\n# Ticket: 0\n'
+                    b'No solar system object was found in the requested '
+                    b'FOV\n')
+
+        # observer-related parameters, including rates
+        obs = params.get('-output', 'object') in ('obs', 'all')
+
+        lines = ['# Flag: 1', '# Ticket: 0',
+                 '# Num | Name | RA(h) | DE(deg) | Class | Mv | '
+                 'Err(arcsec) | d(arcsec)' +
+                 (' | dRA(arcsec/h) | dDEC(arcsec/h) | Dg(ua) | Dh(ua) | '
+                  'Phase(deg) | SunElong(deg)' if obs else '')]
+        for i in range(self.n_asteroids):
+            name = 'SYN{:d}'.format(i+1)
+            ra, dec, dra, ddec = self.ephemeris(name, [epoch])
+            # positions are sexagesimal, as provided by SkyBoT
+            lines.append(('{:d} | {:s} | {:s} | {:s} | MB>Middle | '
+                          '{:.1f} | 0.050 | {:.2f}').format(
+                              i+1, name,
+                              Angle(ra[0], 'deg').to_string(
+                                  unit='hourangle', sep=' ', precision=4,
+                                  pad=True),
+                              Angle(dec[0], 'deg').to_string(
+                                  unit='deg', sep=' ', precision=3,
+                                  alwayssign=True, pad=True),
+                              17+i*0.5,
+                              angular_separation(ra_deg, dec_deg, ra[0],
+                                                 dec[0])*3600) +
+                         (' | {:.4f} | {:.4f} | 1.5 | 2.5 | 5.0 | 170.0'.
+                          format(dra, ddec) if obs else ''))
+
+        return 200, 'text/plain', '\n'.join(lines).encode('utf-8')
+
+    def respond(self, method, path, query, body, headers):
+        """
+        answer a request
+        return: service, mode, status, content type, body
+        """
+
+        service = None
+        for name, service_path in services.service_paths.items():
+            if path.startswith(service_path):
+                service = name
+        if service is None:
+            return 'unknown', 'none', 404, 'text/plain', b'unknown service'
+
+        key = self.request_key(method, path, query, body)
+        response = self.replay(service, key)
+        if response is not None:
+            return (service, 'replay') + response
+
+        if self.record:
+            return ((service, 'record') +
+                    self.forward(service, key, method, path, query, body,
+                                 headers))
+
+        if self.synthesize:
+            params = dict(parse_qsl(query))
+            if method == 'POST' and service != 'vizier':
+                params.update(dict(parse_qsl(body.decode('utf-8'))))
+            if service == 'vizier':
+                return (service, 'synth') + self.synthesize_vizier(body)
+            elif service == 'horizons':
+                return (service, 'synth') + self.synthesize_horizons(params)
+            elif service == 'skybot':
+                return (service, 'synth') + self.synthesize_skybot(params)
+
+        return (service, 'none', 404, 'text/plain',
+                b'no recorded response available')
+
+    def add_stats(self, service, mode, duration):
+        with self.lock:
+            n, total = self.stats.get((service, mode), (0, 0))
+            self.stats[(service, mode)] = (n+1, total+duration)
+
+    def print_stats(self):
+        print('\nservice   mode     requests  time (s)')
+        for (service, mode), (n, total) in sorted(self.stats.items()):
+            print('{:9s} {:8s} {:8d} {:9.3f}'.format(service, mode, n, total))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """HTTP request handler for the stand-in server"""
+
+    standin = None
+
+    def handle_request(self, method):
+        start = time.time()
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length > 0 else b''
+
+        try:
+            service, mode, status, content_type, content = \
+                self.standin.respond(method, url.path, url.query, body,
+                                     dict(self.headers))
+        except Exception as e:
+            logging.error('stand-in request failed: {:s}'.format(str(e)))
+            service, mode, status, content_type, content = (
+                'error', 'none', 500, 'text/plain', str(e).encode('utf-8'))
+
+        if self.standin.latency > 0:
+            time.sleep(self.standin.latency)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+        duration = time.time()-start
+        self.standin.add_stats(service, mode, duration)
+        logging.info('stand-in {:s} {:s} ({:s}): {:d}, {:.3f} s'.format(
+            service, method, mode, status, duration))
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def log_message(self, format, *args):
+        if self.standin.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+if __name__ == '__main__':
+
+    # command line arguments
+    parser = argparse.ArgumentParser(
+        description='local stand-in server for remote services')
+    parser.add_argument('-port', help='server port', default=8765,
+                        type=int)
+    parser.add_argument('-responses', help='directory of recorded '
+                        'responses', default='standin_responses')
+    parser.add_argument('-record', action='store_true',
+                        help='forward unknown requests to the actual '
+                        'services and record responses')
+    parser.add_argument('-replay_only', action='store_true',
+                        help='do not synthesize responses')
+    parser.add_argument('-latency', help='artificial latency per request '
+                        '(s)', default=0, type=float)
+    parser.add_argument('-density', help='synthetic catalog source '
+                        'density (per sq deg)', default=5000, type=float)
+    parser.add_argument('-asteroids', help='number of synthetic SkyBoT '
+                        'objects', default=3, type=int)
+    parser.add_argument('-target', nargs=5, type=float, default=None,
+                        metavar=('RA', 'DEC', 'RA_RATE', 'DEC_RATE', 'JD'),
+                        help='synthetic target position (deg), rates '
+                        '("/hr), and epoch')
+    parser.add_argument('-verbose', action='store_true',
+                        help='print every request')
+
+    args = parser.parse_args()
+
+    StandInHandler.standin = StandIn(args.responses, record=args.record,
+                                     synthesize=not args.replay_only,
+                                     latency=args.latency,
+                                     density=args.density,
+                                     n_asteroids=args.asteroids,
+                                     target=args.target,
+                                     verbose=args.verbose)
+
+    server = ThreadingHTTPServer(('localhost', args.port), StandInHandler)
+    print(('stand-in server running at http://localhost:{:d}; set '
+           'PP_STANDIN_URL=http://localhost:{:d} to use it').format(
+               args.port, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        StandInHandler.standin.print_stats()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+""" PPTOOL_TILESTORE - manage the local HEALPix-tiled reference catalog store
+    v1.0: 2026-10-16
+"""
+from __future__ import print_function
+
+import argparse
+import numpy as np
+
+# pipeline-specific modules
+import _pp_conf
+from catalog import *
+import catalog_tiles
+from pp_setup import confcatalog
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+
+def file_cone(data):
+    """derive a cone that contains all sources in data"""
+    ra, dec = np.deg2rad(data['ra_deg'].data), np.deg2rad(data['dec_deg'].data)
+    x, y, z = (np.mean(np.cos(dec)*np.cos(ra)), np.mean(np.cos(dec)*np.sin(ra)),
+               np.mean(np.sin(dec)))
+    ra_deg = np.rad2deg(np.arctan2(y, x)) % 360
+    dec_deg = np.rad2deg(np.arctan2(z, np.sqrt(x**2+y**2)))
+    rad_deg = np.max(catalog_tiles.angular_separation(
+        ra_deg, dec_deg, data['ra_deg'].data, data['dec_deg'].data))
+    return ra_deg, dec_deg, rad_deg
+
+
+if __name__ == '__main__':
+
+    # command line arguments
+    parser = argparse.ArgumentParser(
+        description='manage local reference catalog tile store')
+    parser.add_argument('-cat', help='reference catalog',
+                        choices=catalog_tiles.tile_catalogs, required=True)
+    parser.add_argument('-download', nargs=3, metavar=('RA', 'DEC', 'RAD'),
+                        help='download cone (deg) into tile store',
+                        default=None)
+    parser.add_argument('-coverage', nargs=3, metavar=('RA', 'DEC', 'RAD'),
+                        help='report tile store coverage of cone (deg)',
+                        default=None)
+    parser.add_argument('-cone', nargs=3, metavar=('RA', 'DEC', 'RAD'),
+                        help='cone (deg) covered by ingested files; '
+                        'derived from the data if not provided',
+                        default=None)
+    parser.add_argument('-max_mag', help='magnitude limit', default=None)
+    parser.add_argument('-max_sources', help='maximum number of sources '
+                        'per download', default=1e6)
+    parser.add_argument('-partial', action='store_true',
+                        help='ingested files are incomplete (e.g., '
+                        'truncated by a row limit)')
+    parser.add_argument('files', help='catalog files to ingest (FITS_LDAC '
+                        '*.cat files or tables using PP column names)',
+                        nargs='*')
+
+    args = parser.parse_args()
+    max_mag = float(args.max_mag) if args.max_mag is not None else None
+    store = catalog_tiles.store
+
+    # ingest catalog files
+    for filename in args.files:
+        data = catalog_tiles.read_catalog_file(filename, args.cat)
+        if args.cone is not None:
+            ra_deg, dec_deg, rad_deg = [float(x) for x in args.cone]
+        else:
+            ra_deg, dec_deg, rad_deg = file_cone(data)
+        n_tiles = store.ingest(args.cat, data, ra_deg, dec_deg, rad_deg,
+                               max_mag=max_mag, complete=not args.partial)
+        print('{:s}: {:d} sources ingested into {:d} tiles'.format(
+            filename, len(data), n_tiles))
+
+    # download cone from remote server into tile store
+    if args.download is not None:
+        ra_deg, dec_deg, rad_deg = [float(x) for x in args.download]
+        confcatalog.use_tile_store = True
+        confcatalog.fill_tile_store = True
+        confcatalog.cache_catalogs = False
+        cat = catalog(args.cat, display=True)
+        if max_mag is None:
+            cat.download_catalog(ra_deg, dec_deg, rad_deg,
+                                 int(float(args.max_sources)))
+        else:
+            cat.download_catalog(ra_deg, dec_deg, rad_deg,
+                                 int(float(args.max_sources)),
+                                 max_mag=max_mag)
+
+    # report coverage
+    if args.coverage is not None:
+        ra_deg, dec_deg, rad_deg = [float(x) for x in args.coverage]
+        tiles = store.cone_tiles(ra_deg, dec_deg, rad_deg)
+        missing = store.missing_tiles(args.cat, tiles, max_mag)
+        print('{:s}: {:d} of {:d} tiles covered (nside {:d})'.format(
+            args.cat, len(tiles)-len(missing), len(tiles), store.nside))
+        if len(missing) > 0:
+            print('missing tiles:', ' '.join([str(pix) for pix in missing]))
@@ -0,0 +1,109 @@
+""" SERVICES - access to remote services (Vizier, SDSS, JPL Horizons,
+               IMCCE SkyBoT) and redirection to a local stand-in server
+    v1.0: 2026-10-16
+"""
+# Photometry Pipeline
+# Copyright (C) 2016-2018  Michael Mommert, mommermiscience@gmail.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import sys
+import logging
+from urllib.parse import urlparse
+
+try:
+    from astroquery.vizier import VizierClass
+    from astroquery.vizier import conf as vizier_conf
+    from astroquery.sdss import SDSSClass
+    from astroquery.sdss import conf as sdss_conf
+    from astroquery.jplhorizons import HorizonsClass
+    from astroquery.jplhorizons import conf as horizons_conf
+except ImportError:
+    print('Module astroquery not found. Please install with: pip install '
+          'astroquery')
+    sys.exit()
+
+# pipeline-specific modules
+import _pp_conf
+from pp_setup import confservices as conf
+
+# setup logging
+logging.basicConfig(filename=_pp_conf.log_filename,
+                    level=_pp_conf.log_level,
+                    format=_pp_conf.log_formatline,
+                    datefmt=_pp_conf.log_datefmt)
+
+# actual service base URLs; requests to the stand-in server are
+# forwarded to these in recording mode (see pptool_standin)
+upstream = {'vizier': 'https://' + vizier_conf.server,
+            'sdss': sdss_conf.skyserver_baseurl,
+            'horizons': horizons_conf.horizons_server[
+                :horizons_conf.horizons_server.find('/api/')],
+            'skybot': conf.skybot_server[
+                :conf.skybot_server.find('/webservices/')]}
+
+# request paths that identify each service on the stand-in server
+service_paths = {'vizier': '/viz-bin/',
+                 'horizons': '/api/horizons',
+                 'skybot': '/webservices/skybot/',
+                 'sdss': '/dr'}
+
+
+def standin_url():
+    """base URL of the stand-in server or None"""
+    if conf.standin_url is None:
+        return None
+    return conf.standin_url.rstrip('/')
+
+
+def redirect(url):
+    """redirect a service URL to the stand-in server, if requested"""
+    if standin_url() is None:
+        return url
+    parsed = urlparse(url)
+    return (standin_url() + parsed.path +
+            ('?' + parsed.query if parsed.query else ''))
+
+
+class StandInQuery():
+    """mixin for astroquery classes that sends all requests to the
+    stand-in server, if requested"""
+
+    def _request(self, method, url, *args, **kwargs):
+        return super(StandInQuery, self)._request(method, redirect(url),
+                                                  *args, **kwargs)
+
+
+class Vizier(StandInQuery, VizierClass):
+    """Vizier queries"""
+    pass
+
+
+class Horizons(StandInQuery, HorizonsClass):
+    """JPL Horizons queries"""
+    pass
+
+
+class SDSSQuery(StandInQuery, SDSSClass):
+    """SDSS queries"""
+    pass
+
+
+SDSS = SDSSQuery()
+
+
+def skybot_server():
+    """URL of the IMCCE SkyBoT cone search service"""
+    return redirect(conf.skybot_server)
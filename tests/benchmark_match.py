@@ -0,0 +1,103 @@
+""" BENCHMARK_MATCH - scaling of catalog.match_with(tolerance=None)
+
+Compares the nearest-unique-match path of catalog.match_with against the
+previous implementation (kd-tree query followed by a loop over all
+targets) for an increasing number of targets and sources, and checks
+that both produce the same matches.
+
+usage: python benchmark_match.py [-sources N [N ...]] [-targets N [N ...]]
+                                 [-legacy_max N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from scipy import spatial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from catalog import catalog
+
+
+def legacy_nearest(targets, sources):
+    """previous implementation of match_with(tolerance=None)"""
+    this_tree = spatial.KDTree(list(zip(targets['ra_deg'].data,
+                                        targets['dec_deg'].data)))
+    other_cat = list(zip(sources['ra_deg'].data, sources['dec_deg'].data))
+    match = this_tree.query(other_cat)
+
+    indices_this_catalog, indices_other_catalog = [], []
+    for target_idx in range(targets.shape[0]):
+        other_cat_indices = np.where(match[1] == target_idx)[0]
+        if len(other_cat_indices) > 0:
+            min_idx = other_cat_indices[np.argmin(
+                [match[0][i] for i in other_cat_indices])]
+            indices_this_catalog.append(target_idx)
+            indices_other_catalog.append(min_idx)
+
+    return indices_this_catalog, indices_other_catalog
+
+
+def frame(n_sources, n_targets, rng):
+    """synthetic frame (0.2 deg wide, close to the equator) and targets"""
+    sources = catalog('sources')
+    sources.add_fields(['ident', 'ra_deg', 'dec_deg'],
+                       [np.arange(n_sources),
+                        rng.uniform(100, 100.2, n_sources),
+                        rng.uniform(-0.1, 0.1, n_sources)])
+    idc = rng.choice(n_sources, n_targets, replace=False)
+    targets = catalog('targets')
+    targets.add_fields(['ident', 'ra_deg', 'dec_deg'],
+                       [np.arange(n_targets),
+                        sources['ra_deg'][idc] +
+                        rng.normal(0, 1e-4, n_targets),
+                        sources['dec_deg'][idc] +
+                        rng.normal(0, 1e-4, n_targets)])
+    return sources, targets
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='benchmark match_with(tolerance=None)')
+    parser.add_argument('-sources', nargs='+', type=int,
+                        default=[10000, 100000],
+                        help='number of sources per frame')
+    parser.add_argument('-targets', nargs='+', type=int,
+                        default=[100, 1000, 10000, 50000],
+                        help='number of targets')
+    parser.add_argument('-legacy_max', type=int, default=50000,
+                        help='skip legacy implementation for larger '
+                        'numbers of targets')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+
+    print('  sources  targets   matched  match_with (s)  legacy (s)  same')
+    for n_sources in args.sources:
+        for n_targets in args.targets:
+            if n_targets > n_sources:
+                continue
+            sources, targets = frame(n_sources, n_targets, rng)
+
+            start = time.time()
+            match = targets.match_with(
+                sources, extract_this_catalog=['ident'],
+                extract_other_catalog=['ident'], tolerance=None)
+            duration = time.time()-start
+
+            legacy_duration, same = np.nan, '-'
+            if n_targets <= args.legacy_max:
+                start = time.time()
+                legacy = legacy_nearest(targets, sources)
+                legacy_duration = time.time()-start
+                same = ('yes' if (
+                    list(match[0][0]) == list(legacy[0]) and
+                    list(match[1][0]) == list(legacy[1])) else 'NO')
+
+            print('{:9d} {:8d} {:9d} {:15.3f} {:11.3f}  {:s}'.format(
+                n_sources, n_targets, len(match[0][0]), duration,
+                legacy_duration, same))
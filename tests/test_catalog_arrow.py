@@ -0,0 +1,141 @@
+""" TEST_CATALOG_ARROW - tests for the catalog Arrow/Parquet interface
+
+Offline round-trip tests of catalog.to_arrow, catalog.from_arrow,
+catalog.write_arrow, and catalog.read_arrow.
+
+usage: python -m pytest tests/test_catalog_arrow.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import astropy.units as u
+from astropy.io import fits
+from astropy.table import MaskedColumn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from catalog import catalog
+
+pyarrow = pytest.importorskip('pyarrow')
+
+
+def frame(n_sources=500, seed=0):
+    """frame catalog with float, integer, boolean, string, masked,
+    vector, big-endian, and unit-carrying fields"""
+    rng = np.random.default_rng(seed)
+    cat = catalog('frame.ldac')
+    cat.add_fields(['ident', 'ra_deg', 'dec_deg', 'FLAGS', 'selected',
+                    'Vmag', 'FLUX_APER', 'MAG_APER'],
+                   [np.array(['src{:d}'.format(i)
+                              for i in range(n_sources)]),
+                    rng.uniform(0, 360, n_sources),
+                    rng.uniform(-90, 90, n_sources),
+                    rng.integers(0, 8, n_sources).astype(np.int16),
+                    rng.uniform(0, 1, n_sources) < 0.5,
+                    rng.uniform(12, 18, n_sources),
+                    rng.uniform(0, 1000, (n_sources, 3)),
+                    rng.uniform(-12, -6, n_sources).astype('>f8')])
+    cat.data['Vmag'] = MaskedColumn(cat['Vmag'], mask=rng.uniform(
+        0, 1, n_sources) < 0.1)
+    cat.data['Vmag'][3] = np.nan
+    cat.data['FLAGS'] = MaskedColumn(cat['FLAGS'], mask=rng.uniform(
+        0, 1, n_sources) < 0.1)
+    cat.data['ra_deg'].unit = u.deg
+    cat.data['dec_deg'].unit = u.deg
+    cat.obstime = [2460000.5, 30.]
+    cat.origin = 'test;GAIA'
+    cat.history = 'calibrated'
+    cat.magsys = 'Vega'
+    cat.obj = 'target'
+    cat.filtername = 'V'
+    return cat
+
+
+def assert_catalogs_equal(cat1, cat2, fields=None):
+    if fields is None:
+        fields = cat1.fields
+    assert list(cat2.fields) == list(fields)
+    for attr in ['catalogname', 'origin', 'history', 'magsys', 'obj',
+                 'filtername']:
+        assert getattr(cat1, attr) == getattr(cat2, attr)
+    assert list(cat1.obstime) == list(cat2.obstime)
+    for key in fields:
+        values1, values2 = cat1[key], cat2[key]
+        assert values2.shape == values1.shape
+        assert values2.dtype.kind == values1.dtype.kind
+        assert values2.unit == values1.unit
+        assert np.array_equal(np.ma.getmaskarray(values1),
+                              np.ma.getmaskarray(values2))
+        assert np.array_equal(np.ma.filled(values1, 0),
+                              np.ma.filled(values2, 0),
+                              equal_nan=values1.dtype.kind == 'f')
+
+
+def test_to_from_arrow():
+    cat = frame()
+    table = cat.to_arrow()
+    assert table.num_rows == 500
+    for key in ['Vmag', 'FLAGS']:
+        assert table.column(key).null_count == np.sum(cat[key].mask) > 0
+    assert pyarrow.types.is_fixed_size_list(table.schema.field(
+        'FLUX_APER').type)
+
+    read = catalog('read')
+    assert read.from_arrow(table) == 500
+    assert_catalogs_equal(cat, read)
+
+    # fields can be modified without affecting the Arrow table
+    read['MAG_APER'][0] = 99
+    assert table.column('MAG_APER')[0].as_py() == cat['MAG_APER'][0]
+
+
+def test_from_plain_arrow():
+    # Arrow tables without header information
+    table = pyarrow.table({'ra_deg': [1., 2.], 'dec_deg': [3., None],
+                           'name': ['a', None]})
+    cat = catalog('plain')
+    assert cat.from_arrow(table) == 2
+    assert cat.catalogname == 'plain'
+    assert list(cat['ra_deg']) == [1., 2.]
+    assert list(np.ma.getmaskarray(cat['dec_deg'])) == [False, True]
+    assert list(np.ma.getmaskarray(cat['name'])) == [False, True]
+    assert cat['name'][0] == 'a'
+
+
+@pytest.mark.parametrize('format', ['parquet', 'ipc'])
+def test_write_read_arrow(tmp_path, format):
+    cat = frame()
+    filename = str(tmp_path/'frame.{:s}'.format(format))
+    assert cat.write_arrow(filename, format=format) == 500
+
+    read = catalog('read')
+    assert read.read_arrow(filename, format=format) == 500
+    assert_catalogs_equal(cat, read)
+
+    # only requested fields are read; unknown fields are ignored
+    read = catalog('read')
+    read.read_arrow(filename, fields=['Vmag', 'ra_deg', 'unknown'],
+                    format=format)
+    assert_catalogs_equal(cat, read, ['ra_deg', 'Vmag'])
+
+
+def test_read_ldac_arrow(tmp_path):
+    # catalogs read from FITS files (big-endian data) survive the round
+    # trip
+    cat = frame(n_sources=100)
+    filename = str(tmp_path/'frame.fits')
+    fits.BinTableHDU(cat.data.filled()).writeto(filename)
+    data = fits.open(filename)[1].data
+    assert not data['ra_deg'].dtype.isnative
+
+    fits_cat = catalog('fits')
+    fits_cat.add_fields(['ra_deg', 'FLUX_APER'],
+                        [data['ra_deg'], data['FLUX_APER']])
+    fits_cat.write_arrow(str(tmp_path/'frame.parquet'))
+    read = catalog('read')
+    read.read_arrow(str(tmp_path/'frame.parquet'))
+    assert np.array_equal(read['ra_deg'], cat['ra_deg'])
+    assert np.array_equal(read['FLUX_APER'], cat['FLUX_APER'])
@@ -0,0 +1,201 @@
+""" TEST_CATALOG_CACHE - tests for catalog_cache
+
+Offline tests of the local catalog query cache and of catalog queries
+served from it.
+
+usage: python -m pytest tests/test_catalog_cache.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import catalog_cache
+from catalog_cache import Catalog_Cache
+from pp_setup import confcatalog
+from catalog import catalog
+
+
+def cone_data(ra_deg, dec_deg, rad_deg, n_sources, seed=0):
+    """sources distributed uniformly within a cone"""
+    rng = np.random.default_rng(seed)
+    dist = rad_deg*np.sqrt(rng.uniform(0, 1, n_sources))
+    bearing = rng.uniform(0, 2*np.pi, n_sources)
+    dec = dec_deg + dist*np.cos(bearing)
+    ra = ra_deg + dist*np.sin(bearing)/np.cos(np.deg2rad(dec))
+    return Table({'ident': np.arange(n_sources).astype(str),
+                  'ra_deg': np.mod(ra, 360), 'dec_deg': dec,
+                  'Gmag': rng.uniform(10, 20, n_sources)})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """empty cache used by catalog queries; no remote servers"""
+    cache = Catalog_Cache(path=str(tmp_path/'cache'), max_size=10*1024**2)
+    monkeypatch.setattr(catalog_cache, 'cache', cache)
+    monkeypatch.setattr(confcatalog, 'offline', True)
+    monkeypatch.setattr(confcatalog, 'use_tile_store', False)
+    return cache
+
+
+# completeness of cached queries
+
+def test_download_complete_from_cache(cache):
+    data = cone_data(10, 20, 0.5, 200)
+    cache.store('GAIA', 10, 20, 0.5, 1000, 21, data)
+
+    cat = catalog('GAIA')
+    n_sources = cat.download_catalog(10, 20, 0.2, 1000)
+    assert 0 < n_sources < 200
+    assert cat.query_complete()
+
+
+def test_download_truncated_from_cache(cache):
+    # the server returned as many rows as allowed: truncated query
+    data = cone_data(10, 20, 0.5, 200)
+    cache.store('GAIA', 10, 20, 0.5, 250, 21, data[:150], n_queried=250)
+
+    # identical query is served, but known to be truncated
+    cat = catalog('GAIA')
+    assert cat.download_catalog(10, 20, 0.5, 250) == 150
+    assert not cat.query_complete()
+
+    # smaller cones are not served from truncated queries
+    cat = catalog('GAIA')
+    assert cat.download_catalog(10, 20, 0.2, 250) == 0
+
+
+def test_download_truncated_by_row_limit(cache):
+    # complete cached query, but the smaller query has a lower row limit
+    data = cone_data(10, 20, 0.5, 200)
+    cache.store('GAIA', 10, 20, 0.5, 1000, 21, data)
+
+    cat = catalog('GAIA')
+    assert cat.download_catalog(10, 20, 0.5, 50) == 50
+    assert not cat.query_complete()
+
+
+# cache hits and misses
+
+def test_retrieve_miss(cache):
+    assert cache.retrieve('GAIA', 10, 20, 0.1, None) == (None, False)
+
+    cache.store('GAIA', 10, 20, 0.5, None, None, cone_data(10, 20, 0.5, 100))
+    # different catalog
+    assert cache.retrieve('2MASS', 10, 20, 0.1, None) == (None, False)
+    # cone not contained in cached cone
+    assert cache.retrieve('GAIA', 10, 20.4, 0.2, None) == (None, False)
+    assert cache.retrieve('GAIA', 10, 20, 0.6, None) == (None, False)
+
+
+def test_retrieve_identical(cache):
+    data = cone_data(10, 20, 0.5, 100)
+    cache.store('GAIA', 10, 20, 0.5, 1000, 19, data)
+
+    cached, complete = cache.retrieve('GAIA', 10, 20, 0.5, 1000, 19)
+    assert complete
+    assert list(cached['ident']) == list(data['ident'])
+    assert np.allclose(cached['Gmag'], data['Gmag'])
+
+
+def test_retrieve_contained(cache):
+    data = cone_data(10, 20, 0.5, 500)
+    cache.store('GAIA', 10, 20, 0.5, None, None, data)
+
+    # only sources within the requested cone are returned
+    cached, complete = cache.retrieve('GAIA', 10.1, 20.1, 0.2, None)
+    assert complete
+    dist = catalog_cache.angular_separation(10.1, 20.1, data['ra_deg'],
+                                            data['dec_deg'])
+    assert list(cached['ident']) == list(data['ident'][dist <= 0.2])
+
+    # magnitude limit is applied to the requested field
+    cached, complete = cache.retrieve('GAIA', 10.1, 20.1, 0.2, None,
+                                      max_mag=15, mag_key='Gmag')
+    assert complete
+    assert list(cached['ident']) == \
+        list(data['ident'][(dist <= 0.2) & (data['Gmag'] < 15)])
+
+    # exact queries are not served from larger cones
+    assert cache.retrieve('GAIA', 10.1, 20.1, 0.2, None,
+                          exact=True) == (None, False)
+
+
+def test_retrieve_magnitude_limit(cache):
+    # cached queries need to be at least as deep as the requested one
+    cache.store('GAIA', 10, 20, 0.5, None, 18, cone_data(10, 20, 0.5, 100))
+    assert cache.retrieve('GAIA', 10, 20, 0.2, None,
+                          max_mag=19, mag_key='Gmag') == (None, False)
+    assert cache.retrieve('GAIA', 10, 20, 0.2, None) == (None, False)
+    cached, complete = cache.retrieve('GAIA', 10, 20, 0.2, None,
+                                      max_mag=17, mag_key='Gmag')
+    assert complete and np.all(cached['Gmag'] < 17)
+
+
+def test_retrieve_ra_wrap(cache):
+    data = cone_data(0, 0, 0.5, 500)
+    cache.store('GAIA', 0, 0, 0.5, None, None, data)
+    cached, complete = cache.retrieve('GAIA', 359.8, 0, 0.2, None)
+    assert complete and len(cached) > 0
+    assert np.all(catalog_cache.angular_separation(
+        359.8, 0, cached['ra_deg'], cached['dec_deg']) <= 0.2)
+
+
+def test_retrieve_row_limit(cache):
+    data = cone_data(10, 20, 0.5, 500)
+    cache.store('GAIA', 10, 20, 0.5, None, None, data)
+
+    # sources closest to the center are kept; data are truncated
+    cached, complete = cache.retrieve('GAIA', 10, 20, 0.3, 20)
+    assert not complete
+    assert len(cached) == 20
+    dist = catalog_cache.angular_separation(10, 20, data['ra_deg'],
+                                            data['dec_deg'])
+    assert sorted(cached['ident']) == \
+        sorted(data['ident'][np.argsort(dist)[:20]])
+
+
+def test_retrieve_truncated_entry(cache):
+    # the server returned as many rows as allowed
+    data = cone_data(10, 20, 0.5, 100)
+    cache.store('GAIA', 10, 20, 0.5, 100, None, data)
+
+    cached, complete = cache.retrieve('GAIA', 10, 20, 0.5, 100)
+    assert len(cached) == 100
+    assert not complete
+    # truncated entries do not serve other cones
+    assert cache.retrieve('GAIA', 10, 20, 0.2, 100) == (None, False)
+    assert cache.retrieve('GAIA', 10, 20, 0.2, None) == (None, False)
+
+
+def test_retrieve_missing_file(cache):
+    filename = cache.store('GAIA', 10, 20, 0.5, None, None,
+                           cone_data(10, 20, 0.5, 100))
+    os.remove(os.path.join(cache.path, filename))
+    assert cache.retrieve('GAIA', 10, 20, 0.5, None) == (None, False)
+    # stale entry is removed from the index
+    db_conn = cache.connect()
+    assert db_conn.execute('SELECT COUNT(*) FROM queries').fetchone()[0] == 0
+    db_conn.close()
+
+
+def test_evict(tmp_path):
+    cache = Catalog_Cache(path=str(tmp_path/'cache'), max_size=1)
+    first = cache.store('GAIA', 10, 20, 0.5, None, None,
+                        cone_data(10, 20, 0.5, 100))
+    second = cache.store('GAIA', 30, 20, 0.5, None, None,
+                         cone_data(30, 20, 0.5, 100))
+    # the most recently used entry is always kept
+    assert not os.path.exists(os.path.join(cache.path, first))
+    assert os.path.exists(os.path.join(cache.path, second))
+    assert cache.retrieve('GAIA', 10, 20, 0.5, None) == (None, False)
+    assert cache.retrieve('GAIA', 30, 20, 0.5, None)[0] is not None
+
+    cache.clear()
+    assert not os.path.exists(os.path.join(cache.path, second))
+    assert cache.retrieve('GAIA', 30, 20, 0.5, None) == (None, False)
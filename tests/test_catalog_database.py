@@ -0,0 +1,159 @@
+""" TEST_CATALOG_DATABASE - tests for catalog database files
+
+Offline tests of catalog.write_database and catalog.read_database with
+field and sky region selection.
+
+usage: python -m pytest tests/test_catalog_database.py
+"""
+
+import os
+import sys
+import sqlite3 as sql
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from catalog import catalog, sky_boxes
+from catalog_cache import angular_separation
+from catalog_tiles import offset_positions
+
+
+def frame(ra_deg, dec_deg, rad_deg, n_sources=3000, seed=0):
+    """calibrated frame catalog covering a cone; the first source has no
+    position"""
+    rng = np.random.default_rng(seed)
+    ra, dec = offset_positions(ra_deg, dec_deg,
+                               rad_deg*np.sqrt(rng.uniform(0, 1, n_sources)),
+                               rng.uniform(0, 360, n_sources))
+    ra[0], dec[0] = np.nan, np.nan
+    cat = catalog('frame.ldac')
+    cat.add_fields(['ident', 'ra_deg', 'dec_deg', 'FLAGS', 'Vmag',
+                    'e_Vmag', 'MAG_APER'],
+                   [np.arange(n_sources), ra, dec,
+                    rng.integers(0, 4, n_sources),
+                    rng.uniform(12, 18, n_sources),
+                    rng.uniform(0.01, 0.1, n_sources),
+                    rng.uniform(-12, -6, n_sources)])
+    cat.obstime = [2460000.5, 30.]
+    cat.filtername = 'V'
+    return cat
+
+
+def read(filename, **kwargs):
+    cat = catalog('read')
+    cat.read_database(filename, **kwargs)
+    return cat
+
+
+def in_box(cat, ra_min, ra_max, dec_min, dec_max):
+    ra, dec = cat['ra_deg'], cat['dec_deg']
+    if ra_min > ra_max:
+        ra_sel = (ra >= ra_min) | (ra <= ra_max)
+    else:
+        ra_sel = (ra >= ra_min) & (ra <= ra_max)
+    return ra_sel & (dec >= dec_min) & (dec <= dec_max)
+
+
+# sky boxes
+
+def test_sky_boxes():
+    assert sky_boxes((10, 20, 30, 40)) == [(10, 20, 30, 40)]
+    assert sky_boxes((350, 10, -5, 5)) == [(350, 360., -5, 5),
+                                           (0., 10, -5, 5)]
+    (box,) = sky_boxes((10, 0, 1))
+    assert np.allclose(box, (9, 11, -1, 1))
+    # cones across RA = 0 and at high declination
+    boxes = sky_boxes((0.5, 60, 1))
+    assert len(boxes) == 2
+    assert np.allclose([boxes[0][0], boxes[1][1]],
+                       [360+0.5-2.0003, 0.5+2.0003], atol=1e-4)
+    # cones including a pole
+    assert sky_boxes((100, 89.5, 1)) == [(0., 360., 88.5, 90.)]
+
+
+# region selection
+
+@pytest.mark.parametrize('region', [(10, 20, 0.3), (0.05, -30, 0.3),
+                                    (200, 89.7, 0.5), (10.2, 20.2, 0.1)])
+def test_read_cone(tmp_path, region):
+    cat = frame(region[0], region[1], 1)
+    filename = str(tmp_path/'frame.ldac.db')
+    cat.write_database(filename)
+
+    selected = read(filename, region=region)
+    dist = angular_separation(region[0], region[1], cat['ra_deg'],
+                              cat['dec_deg'])
+    assert 0 < selected.shape[0] < cat.shape[0]
+    # sources are read in file order
+    assert list(selected['ident']) == list(cat['ident'][dist <= region[2]])
+    assert list(selected.fields) == list(cat.fields)
+
+
+@pytest.mark.parametrize('box', [(9.8, 10.2, 19.9, 20.3),
+                                 (359.9, 0.2, -0.2, 0.3)])
+def test_read_box(tmp_path, box):
+    cat = frame((box[0]+box[1]+(360 if box[0] > box[1] else 0))/2 % 360,
+                (box[2]+box[3])/2, 1)
+    filename = str(tmp_path/'frame.ldac.db')
+    cat.write_database(filename)
+
+    selected = read(filename, region=box)
+    assert 0 < selected.shape[0] < cat.shape[0]
+    assert list(selected['ident']) == list(cat['ident'][in_box(cat, *box)])
+
+
+def test_read_empty_region(tmp_path):
+    cat = frame(10, 20, 1)
+    filename = str(tmp_path/'frame.ldac.db')
+    cat.write_database(filename)
+    selected = read(filename, region=(100, 20, 1))
+    assert selected.shape[0] == 0
+    assert list(selected.fields) == list(cat.fields)
+
+
+def test_read_without_position_index(tmp_path):
+    # database files written before positions were indexed
+    cat = frame(10, 20, 1)
+    filename = str(tmp_path/'frame.ldac.db')
+    cat.write_database(filename)
+    db_conn = sql.connect(filename)
+    db_conn.execute('DROP INDEX data_position')
+    db_conn.close()
+
+    selected = read(filename, region=(10, 20, 0.3))
+    dist = angular_separation(10, 20, cat['ra_deg'], cat['dec_deg'])
+    assert list(selected['ident']) == list(cat['ident'][dist <= 0.3])
+
+
+# field selection
+
+def test_read_fields(tmp_path):
+    cat = frame(10, 20, 1)
+    filename = str(tmp_path/'frame.ldac.db')
+    cat.write_database(filename)
+
+    # Johnson magnitudes are renamed in database files
+    db_conn = sql.connect(filename)
+    assert 'VJohnsonmag' in [row[1] for row in db_conn.execute(
+        'PRAGMA table_info(data)')]
+    db_conn.close()
+
+    selected = read(filename)
+    assert selected.shape[0] == cat.shape[0]
+    assert list(selected.fields) == list(cat.fields)
+    assert selected.filtername == 'V'
+    assert list(selected['Vmag']) == list(cat['Vmag'])
+
+    selected = read(filename, fields=['ident', 'Vmag', 'unknown'])
+    assert list(selected.fields) == ['ident', 'Vmag']
+    assert list(selected['Vmag']) == list(cat['Vmag'])
+
+    # selection functions see the header information
+    selected = read(filename, fields=lambda cat, key:
+                    key in ['ident', cat.filtername+'mag'],
+                    region=(10, 20, 0.3))
+    assert list(selected.fields) == ['ident', 'Vmag']
+    dist = angular_separation(10, 20, cat['ra_deg'], cat['dec_deg'])
+    assert list(selected['Vmag']) == list(cat['Vmag'][dist <= 0.3])
@@ -0,0 +1,186 @@
+""" TEST_CATALOG_MATCH - tests for catalog_match
+
+usage: python -m pytest tests/test_catalog_match.py
+"""
+
+import os
+import sys
+import pickle
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from catalog_match import (angle_to_chord, chord_to_angle, build_tree,
+                           build_pixel_tree, match_exclusive, match_nearest)
+
+arcsec = 1/3600.
+
+
+def exclusive_both_ways(ra1, dec1, ra2, dec2, tolerance):
+    """match_exclusive querying both the first and the second set;
+    both ways have to agree"""
+    idx1, idx2 = match_exclusive(ra1, dec1, ra2, dec2, tolerance)
+    tree_idx1, tree_idx2 = match_exclusive(ra1, dec1, ra2, dec2, tolerance,
+                                           tree1=build_tree(ra1, dec1))
+    assert list(idx1) == list(tree_idx1)
+    assert list(idx2) == list(tree_idx2)
+    return list(idx1), list(idx2)
+
+
+# angle_to_chord
+
+def test_angle_to_chord():
+    assert angle_to_chord(0) == 0
+    assert angle_to_chord(60) == pytest.approx(1)
+    assert angle_to_chord(180) == pytest.approx(2)
+    # separations beyond 180 deg are limited to opposite points
+    assert angle_to_chord(270) == pytest.approx(2)
+    angles = np.array([1e-4, 0.5, 10, 90, 179])
+    assert chord_to_angle(angle_to_chord(angles)) == \
+        pytest.approx(angles, rel=1e-9)
+
+
+# trees
+
+def test_tree_skips_nan_positions():
+    tree = build_tree([10, np.nan, 20, 30], [0, 0, np.nan, 0])
+    assert tree.n == 2
+    assert list(tree.index) == [0, 3]
+    tree = pickle.loads(pickle.dumps(tree))
+    assert tree.n == 2
+    assert list(tree.index) == [0, 3]
+
+    tree = build_pixel_tree([np.nan, 1, 2], [0, np.inf, 2])
+    assert list(tree.index) == [2]
+
+
+# match_exclusive
+
+def test_exclusive_single_counterparts():
+    ra1, dec1 = [10, 20, 30], [0, 0, 0]
+    ra2, dec2 = [30, 10+0.5*arcsec, 50], [0.5*arcsec, 0, 0]
+    assert exclusive_both_ways(ra1, dec1, ra2, dec2, arcsec) == \
+        ([0, 2], [1, 0])
+
+
+def test_exclusive_rejects_ambiguous_sources():
+    # first source has two counterparts, second one has exactly one
+    ra1, dec1 = [10, 20], [0, 0]
+    ra2, dec2 = [10, 10+0.5*arcsec, 20], [0.5*arcsec, 0, 0]
+    assert exclusive_both_ways(ra1, dec1, ra2, dec2, arcsec) == ([1], [2])
+
+
+def test_exclusive_tolerance():
+    ra1, dec1 = [10], [0]
+    assert exclusive_both_ways(ra1, dec1, [10+0.9*arcsec], [0],
+                               arcsec) == ([0], [0])
+    assert exclusive_both_ways(ra1, dec1, [10+1.1*arcsec], [0],
+                               arcsec) == ([], [])
+
+
+def test_exclusive_ra_wrap():
+    ra1, dec1 = [359.9999, 0.0001], [20, -20]
+    ra2, dec2 = [0.0001, 359.9999], [20, -20]
+    assert exclusive_both_ways(ra1, dec1, ra2, dec2, arcsec) == \
+        ([0, 1], [0, 1])
+
+
+def test_exclusive_poles():
+    # close to the poles, large differences in RA are small separations
+    ra1, dec1 = [0, 90], [90-0.2*arcsec, -90+0.2*arcsec]
+    ra2, dec2 = [180, 270], [90-0.2*arcsec, -90+0.2*arcsec]
+    assert exclusive_both_ways(ra1, dec1, ra2, dec2, arcsec) == \
+        ([0, 1], [0, 1])
+    # ...but not away from them
+    assert exclusive_both_ways([0], [89], [180], [89], arcsec) == ([], [])
+
+
+def test_exclusive_nan_positions():
+    ra1, dec1 = [10, np.nan, 30], [0, 0, np.nan]
+    ra2, dec2 = [np.nan, 10, 30, 30], [0, 0, np.nan, 0]
+    assert exclusive_both_ways(ra1, dec1, ra2, dec2, arcsec) == ([0], [1])
+
+
+def test_exclusive_empty():
+    assert exclusive_both_ways([], [], [10], [0], arcsec) == ([], [])
+    assert exclusive_both_ways([10], [0], [], [], arcsec) == ([], [])
+
+
+# match_nearest
+
+def test_nearest_keeps_closest_assignment():
+    # two sources of the second set are closest to the first source of
+    # the first set; only the closer one is kept
+    ra1, dec1 = [10, 20], [0, 0]
+    ra2, dec2 = [10+2*arcsec, 20, 10+arcsec], [0, 0, 0]
+    idx1, idx2 = match_nearest(ra1, dec1, ra2, dec2)
+    assert list(idx1) == [0, 1]
+    assert list(idx2) == [2, 1]
+
+
+def test_nearest_unique():
+    rng = np.random.default_rng(1)
+    ra1, dec1 = rng.uniform(0, 1, 200), rng.uniform(-1, 1, 200)
+    ra2, dec2 = rng.uniform(0, 1, 300), rng.uniform(-1, 1, 300)
+    idx1, idx2 = match_nearest(ra1, dec1, ra2, dec2)
+    assert len(np.unique(idx1)) == len(idx1)
+    assert len(np.unique(idx2)) == len(idx2)
+    assert list(idx1) == sorted(idx1)
+
+    # each pair is the nearest first-set source of its second-set source
+    dist = ((ra2[:, None]-ra1[None, :])**2 *
+            np.cos(np.deg2rad(dec2[:, None]))**2 +
+            (dec2[:, None]-dec1[None, :])**2)
+    assert list(np.argmin(dist[idx2], axis=1)) == list(idx1)
+
+
+def test_nearest_ties():
+    # equidistant sources in the second set: lower index wins
+    idx1, idx2 = match_nearest([10], [0], [10-arcsec, 10+arcsec],
+                               [0, 0])
+    assert list(idx1) == [0]
+    assert list(idx2) == [0]
+
+
+def test_nearest_ra_wrap_and_poles():
+    ra1, dec1 = [359.9999, 0, 45], [0, 90-0.2*arcsec, -90+0.2*arcsec]
+    ra2, dec2 = [225, 180, 0.0001], [-90+0.2*arcsec, 90-0.2*arcsec, 0]
+    idx1, idx2 = match_nearest(ra1, dec1, ra2, dec2)
+    assert list(idx1) == [0, 1, 2]
+    assert list(idx2) == [2, 1, 0]
+
+
+def test_nearest_nan_positions():
+    ra1, dec1 = [10, np.nan], [0, 0]
+    ra2, dec2 = [np.nan, 10, 10], [0, np.nan, arcsec]
+    idx1, idx2 = match_nearest(ra1, dec1, ra2, dec2)
+    assert list(idx1) == [0]
+    assert list(idx2) == [2]
+
+
+def test_nearest_groups():
+    # sources are only matched within the same group
+    ra1, dec1, groups1 = [10, 10], [0, 0], [0, 1]
+    ra2, dec2, groups2 = [10, 10, 10], [arcsec, 0, 0], [1, 0, 2]
+    idx1, idx2 = match_nearest(ra1, dec1, ra2, dec2, groups1=groups1,
+                               groups2=groups2)
+    assert list(idx1) == [0, 1]
+    assert list(idx2) == [1, 0]
+
+
+def test_nearest_never_matches_nan_entries():
+    # without groups, there is no distance limit; sources must not be
+    # assigned to entries without positions
+    idx1, idx2 = match_nearest([np.nan, np.nan], [0, np.nan], [10, np.nan],
+                               [0, 0])
+    assert list(idx1) == []
+    assert list(idx2) == []
+
+    ra1, dec1 = [np.nan, 10, np.nan, 20], [0, 0, 0, 0]
+    tree1 = build_tree(ra1, dec1)
+    idx1, idx2 = match_nearest(None, None, [20, np.nan, 10+arcsec],
+                               [0, np.nan, 0], tree1=tree1)
+    assert list(idx1) == [1, 3]
+    assert list(idx2) == [2, 0]
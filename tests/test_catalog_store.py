@@ -0,0 +1,193 @@
+""" TEST_CATALOG_STORE - tests for catalog_store
+
+Offline tests of the per-run photometry store: write/read round trips,
+replaced frames, frames with different fields, field and region
+selection, and queries across frames.
+
+usage: python -m pytest tests/test_catalog_store.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from astropy.table import MaskedColumn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from catalog_store import Catalog_Store, read_catalogs
+from catalog_cache import angular_separation
+from pp_setup import confcatalog
+from catalog import catalog
+
+
+def frame(name, n_sources=200, obstime_jd=2460000.5, seed=0):
+    """calibrated frame catalog; includes Johnson and SDSS magnitudes
+    (case-insensitive collision in SQLite), masked integers, positions
+    across RA = 0, and a source without position"""
+    rng = np.random.default_rng(seed)
+    cat = catalog(name)
+    ra = np.mod(rng.uniform(-0.5, 0.5, n_sources), 360)
+    ra[0] = np.nan
+    cat.add_fields(['ident', 'ra_deg', 'dec_deg', 'FLAGS', 'Rmag',
+                    'e_Rmag', 'rmag', 'e_rmag', 'MAG_APER'],
+                   [np.array(['src{:d}'.format(i)
+                              for i in range(n_sources)]),
+                    ra, rng.uniform(-0.5, 0.5, n_sources),
+                    rng.integers(0, 8, n_sources),
+                    rng.uniform(12, 18, n_sources),
+                    rng.uniform(0.01, 0.1, n_sources),
+                    rng.uniform(12, 18, n_sources),
+                    rng.uniform(0.01, 0.1, n_sources),
+                    rng.uniform(-12, -6, n_sources)])
+    cat.data['FLAGS'] = MaskedColumn(cat['FLAGS'], mask=rng.uniform(
+        0, 1, n_sources) < 0.1)
+    cat.obstime = [obstime_jd, 30.]
+    cat.origin = 'test;GAIA'
+    cat.history = 'calibrated'
+    cat.magsys = 'Vega'
+    cat.obj = 'target'
+    cat.filtername = 'R'
+    return cat
+
+
+def assert_catalogs_equal(cat1, cat2, fields=None):
+    if fields is None:
+        fields = cat1.fields
+    assert list(cat2.fields) == list(fields)
+    for attr in ['catalogname', 'origin', 'history', 'magsys', 'obj',
+                 'filtername', 'obstime']:
+        assert getattr(cat1, attr) == getattr(cat2, attr)
+    assert cat1.shape[0] == cat2.shape[0]
+    for key in fields:
+        values1, values2 = cat1[key], cat2[key]
+        assert values1.dtype.kind == values2.dtype.kind
+        assert list(np.ma.getmaskarray(values1)) == \
+            list(np.ma.getmaskarray(values2))
+        if values1.dtype.kind == 'f':
+            assert np.array_equal(values1, values2, equal_nan=True)
+        else:
+            assert list(values1) == list(values2)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return Catalog_Store(str(tmp_path/'photometry.db'))
+
+
+def test_write_read(store):
+    cat = frame('frame1.ldac')
+    assert not store.exists()
+    assert store.write(cat) == 200
+    assert store.frames() == ['frame1.ldac']
+    read = store.read('frame1.ldac')
+    assert_catalogs_equal(cat, read)
+    assert np.sum(np.ma.getmaskarray(read['FLAGS'])) > 0
+    assert store.read('frame2.ldac') is None
+
+
+def test_vector_fields(store):
+    # vector fields are not written
+    cat = frame('frame1.ldac')
+    cat.add_field('FLUX_APER', np.ones((200, 3)))
+    store.write(cat)
+    assert 'FLUX_APER' not in store.read('frame1.ldac').fields
+
+
+def test_replace_frame(store):
+    store.write(frame('frame1.ldac'))
+    cat = frame('frame1.ldac', n_sources=50, seed=1)
+    cat.filtername = 'V'
+    store.write(cat)
+    assert store.frames() == ['frame1.ldac']
+    assert_catalogs_equal(cat, store.read('frame1.ldac'))
+
+
+def test_frames_with_different_fields(store):
+    cats = [frame('frame2.ldac', obstime_jd=2460000.6, seed=1),
+            frame('frame1.ldac', seed=2)]
+    cats[0].add_field('_Vmag', cats[0]['Rmag']+0.3)
+    cats[1].data.remove_column('MAG_APER')
+    assert store.write_catalogs(cats) == 400
+
+    # frames are ordered by observation time
+    assert store.frames() == ['frame1.ldac', 'frame2.ldac']
+    for cat in cats:
+        assert_catalogs_equal(cat, store.read(cat.catalogname))
+
+
+def test_read_fields_and_region(store):
+    cat = frame('frame1.ldac', n_sources=2000)
+    store.write(cat)
+
+    read = store.read('frame1.ldac', fields=['ra_deg', 'dec_deg', 'Rmag'])
+    assert_catalogs_equal(cat, read, ['ra_deg', 'dec_deg', 'Rmag'])
+    read = store.read('frame1.ldac',
+                      fields=lambda cat, key: not key.startswith('e_'))
+    assert list(read.fields) == [key for key in cat.fields
+                                 if not key.startswith('e_')]
+
+    # cone across RA = 0
+    read = store.read('frame1.ldac', region=(359.9, 0.1, 0.3))
+    dist = angular_separation(359.9, 0.1, cat['ra_deg'], cat['dec_deg'])
+    assert 0 < read.shape[0] < 2000
+    assert list(read['ident']) == list(cat['ident'][dist <= 0.3])
+
+    # box across RA = 0
+    read = store.read('frame1.ldac', region=(359.8, 0.2, -0.1, 0.3))
+    sel = (((cat['ra_deg'] >= 359.8) | (cat['ra_deg'] <= 0.2)) &
+           (cat['dec_deg'] >= -0.1) & (cat['dec_deg'] <= 0.3))
+    assert list(read['ident']) == list(cat['ident'][sel])
+
+    # no sources
+    read = store.read('frame1.ldac', region=(180, 0, 1))
+    assert read.shape[0] == 0
+    assert list(read.fields) == list(cat.fields)
+
+
+def test_query(store):
+    cats = [frame('frame1.ldac', seed=1),
+            frame('frame2.ldac', obstime_jd=2460000.6, seed=2)]
+    cats[1].add_field('_Vmag', cats[1]['Rmag']+0.3)
+    store.write_catalogs(cats[::-1])
+
+    data = store.query(['ident', 'Rmag', 'rmag', '_Vmag'])
+    assert list(data['frame']) == ['frame1.ldac']*200 + ['frame2.ldac']*200
+    assert list(data['ident']) == (list(cats[0]['ident']) +
+                                   list(cats[1]['ident']))
+    assert np.allclose(data['Rmag'], np.hstack([cats[0]['Rmag'],
+                                                cats[1]['Rmag']]))
+    assert np.allclose(data['rmag'], np.hstack([cats[0]['rmag'],
+                                                cats[1]['rmag']]))
+    # fields that are missing in a frame are nan
+    assert np.all(np.isnan(data['_Vmag'][:200]))
+    assert np.allclose(data['_Vmag'][200:], cats[1]['_Vmag'])
+
+    data = store.query(['ident', 'Rmag'], where='Rjohnsonmag < ?',
+                       parameters=(14,))
+    assert len(data) == (np.sum(cats[0]['Rmag'] < 14) +
+                         np.sum(cats[1]['Rmag'] < 14))
+    assert np.all(data['Rmag'] < 14)
+
+
+def test_read_catalogs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(confcatalog, 'photometry_store', 'photometry.db')
+
+    # frame 1 from the store, frame 2 from its database file
+    cats = [frame('frame1.ldac', seed=1),
+            frame('frame2.ldac', obstime_jd=2460000.6, seed=2)]
+    Catalog_Store().write(cats[0])
+    cats[1].write_database('frame2.ldac.db')
+
+    read = read_catalogs(['frame1.fits', 'frame2.fits', 'frame3.fits'],
+                         fields=['ident', 'ra_deg', 'dec_deg', 'Rmag'],
+                         region=(0, 0, 0.3))
+    assert [cat.catalogname for cat in read] == ['frame1.ldac',
+                                                 'frame2.ldac']
+    for cat, stored in zip(cats, read):
+        dist = angular_separation(0, 0, cat['ra_deg'], cat['dec_deg'])
+        assert list(stored['ident']) == list(cat['ident'][dist <= 0.3])
+        assert list(stored.fields) == ['ident', 'ra_deg', 'dec_deg',
+                                       'Rmag']
@@ -0,0 +1,191 @@
+""" TEST_CATALOG_TILES - tests for catalog_tiles
+
+Offline tests of the HEALPix utilities, tile ingestion, and the
+assembly of cones from the local tile store.
+
+usage: python -m pytest tests/test_catalog_tiles.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import catalog_cache
+import catalog_tiles
+from catalog_tiles import (Tile_Store, healpix_ang2pix, healpix_pix2xyf,
+                           healpix_xyf2ang, offset_positions)
+from catalog_cache import Catalog_Cache, angular_separation
+from pp_setup import confcatalog
+from catalog import catalog
+
+
+def cone_data(ra_deg, dec_deg, rad_deg, n_sources, seed=0):
+    """sources distributed uniformly within a cone"""
+    rng = np.random.default_rng(seed)
+    dist = rad_deg*np.sqrt(rng.uniform(0, 1, n_sources))
+    ra, dec = offset_positions(ra_deg, dec_deg, dist,
+                               rng.uniform(0, 360, n_sources))
+    return Table({'ident': ['{:d}_{:d}'.format(seed, idx)
+                            for idx in range(n_sources)],
+                  'ra_deg': ra, 'dec_deg': dec,
+                  'Gmag': rng.uniform(10, 20, n_sources)})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return Tile_Store(path=str(tmp_path/'tiles'), nside=32)
+
+
+# HEALPix utilities
+
+@pytest.mark.parametrize('nside', [1, 4, 32])
+def test_healpix_pixel_centers(nside):
+    # pixel centers are located in their own pixels
+    pix = np.arange(12*nside**2)
+    ix, iy, face = healpix_pix2xyf(nside, pix)
+    ra, dec = healpix_xyf2ang((ix+0.5)/nside, (iy+0.5)/nside, face)
+    assert list(healpix_ang2pix(nside, ra, dec)) == list(pix)
+
+
+def test_healpix_equal_area():
+    # uniformly distributed positions populate all pixels equally
+    rng = np.random.default_rng(1)
+    n_sources = 240000
+    ra = rng.uniform(0, 360, n_sources)
+    dec = np.rad2deg(np.arcsin(rng.uniform(-1, 1, n_sources)))
+    counts = np.bincount(healpix_ang2pix(2, ra, dec), minlength=48)
+    assert len(counts) == 48
+    assert np.all(np.abs(counts-n_sources/48) < 5*np.sqrt(n_sources/48))
+
+
+@pytest.mark.parametrize('ra_deg, dec_deg', [(10, 20), (0.2, -5),
+                                             (200, 89.5), (45, -60)])
+def test_cone_tiles(store, ra_deg, dec_deg):
+    # all positions inside the cone are covered by the cone tiles
+    data = cone_data(ra_deg, dec_deg, 1.5, 20000)
+    tiles = store.cone_tiles(ra_deg, dec_deg, 1.5)
+    pix = healpix_ang2pix(store.nside, data['ra_deg'], data['dec_deg'])
+    assert set(pix) <= set(tiles)
+
+
+def test_offset_positions():
+    ra, dec = offset_positions(359.5, 10, np.array([0.5, 1, 2]),
+                               np.array([0, 90, 225]))
+    assert np.allclose(angular_separation(359.5, 10, ra, dec), [0.5, 1, 2])
+    assert ra[1] < 1
+
+
+# tile ingestion and assembly
+
+def test_assemble_contained_cone(store):
+    data = cone_data(10, 20, 5, 30000)
+    assert store.ingest('GAIA', data, 10, 20, 5, max_mag=21) > 0
+
+    # tiles of a cone well within the ingested cone are complete
+    assembled, complete = store.assemble('GAIA', 10.5, 20.5, 1)
+    assert complete
+    dist = angular_separation(10.5, 20.5, data['ra_deg'], data['dec_deg'])
+    assert sorted(assembled['ident']) == sorted(data['ident'][dist <= 1])
+
+    # magnitude limit
+    assembled, complete = store.assemble('GAIA', 10.5, 20.5, 1, max_mag=15,
+                                         mag_key='Gmag')
+    assert complete
+    assert sorted(assembled['ident']) == \
+        sorted(data['ident'][(dist <= 1) & (data['Gmag'] < 15)])
+
+
+def test_assemble_partial_coverage(store):
+    data = cone_data(10, 20, 2, 5000)
+    store.ingest('GAIA', data, 10, 20, 2)
+
+    # tiles at the edge of the ingested cone are incomplete
+    tiles = store.cone_tiles(10, 20, 2)
+    missing = store.missing_tiles('GAIA', tiles)
+    assert 0 < len(missing) < len(tiles)
+    for pix in missing:
+        assert not store.tile_in_cone(pix, 10, 20, 2)
+    assembled, complete = store.assemble('GAIA', 10, 20, 2)
+    assert not complete
+    assert len(assembled) == len(data)
+
+    # nothing ingested in this area
+    assert store.assemble('GAIA', 100, -20, 1) == (None, False)
+    assert store.assemble('2MASS', 10, 20, 1) == (None, False)
+
+
+def test_assemble_depth(store):
+    store.ingest('GAIA', cone_data(10, 20, 4, 2000), 10, 20, 4, max_mag=18)
+    tiles = store.cone_tiles(10, 20, 1)
+    assert len(store.missing_tiles('GAIA', tiles, max_mag=17)) == 0
+    assert len(store.missing_tiles('GAIA', tiles, max_mag=19)) == \
+        len(tiles)
+    assert not store.assemble('GAIA', 10, 20, 1, max_mag=19,
+                              mag_key='Gmag')[1]
+
+    # deeper data complete the tiles to the new depth
+    store.ingest('GAIA', cone_data(10, 20, 4, 2000, seed=1), 10, 20, 4,
+                 max_mag=20)
+    assert len(store.missing_tiles('GAIA', tiles, max_mag=19)) == 0
+
+
+def test_assemble_row_limit(store):
+    data = cone_data(10, 20, 4, 20000)
+    store.ingest('GAIA', data, 10, 20, 4)
+
+    # sources closest to the center are kept; data are truncated
+    assembled, complete = store.assemble('GAIA', 10, 20, 1, max_sources=50)
+    assert not complete
+    dist = angular_separation(10, 20, data['ra_deg'], data['dec_deg'])
+    assert sorted(assembled['ident']) == \
+        sorted(data['ident'][np.argsort(dist)[:50]])
+
+
+def test_ingest_overlapping_cones(store):
+    # sources of overlapping cones are only kept once
+    data = cone_data(10, 20, 3, 10000)
+    store.ingest('GAIA', data, 10, 20, 3)
+    store.ingest('GAIA', data[data['ra_deg'] > 10], 11, 20, 1)
+    assembled, complete = store.assemble('GAIA', 10, 20, 3)
+    assert sorted(assembled['ident']) == sorted(data['ident'])
+
+    # incomplete data do not mark tiles as complete
+    tiles = store.cone_tiles(50, 20, 1)
+    store.ingest('GAIA', cone_data(50, 20, 3, 5000), 50, 20, 3,
+                 complete=False)
+    assert len(store.missing_tiles('GAIA', tiles)) == len(tiles)
+
+
+def test_ra_wrap(store):
+    data = cone_data(0, 0, 3, 10000)
+    store.ingest('GAIA', data, 0, 0, 3)
+    assembled, complete = store.assemble('GAIA', 359.5, 0.5, 1)
+    assert complete
+    dist = angular_separation(359.5, 0.5, data['ra_deg'], data['dec_deg'])
+    assert sorted(assembled['ident']) == sorted(data['ident'][dist <= 1])
+
+
+def test_download_from_tile_store(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_tiles, 'store', store)
+    monkeypatch.setattr(catalog_cache, 'cache',
+                        Catalog_Cache(path=str(tmp_path/'cache')))
+    monkeypatch.setattr(confcatalog, 'offline', True)
+    monkeypatch.setattr(confcatalog, 'use_tile_store', True)
+
+    data = cone_data(10, 20, 4, 20000)
+    store.ingest('GAIA', data, 10, 20, 4, max_mag=21)
+
+    cat = catalog('GAIA')
+    dist = angular_separation(10, 20, data['ra_deg'], data['dec_deg'])
+    assert cat.download_catalog(10, 20, 1, 100000, max_mag=20) == \
+        np.sum((dist <= 1) & (data['Gmag'] < 20))
+    assert cat.query_complete()
+
+    cat = catalog('GAIA')
+    assert cat.download_catalog(10, 20, 1, 100) == 100
+    assert not cat.query_complete()
@@ -0,0 +1,233 @@
+""" TEST_CATALOG_TRANSFORM - regression tests for catalog_transform
+
+Compares catalog_transform.derive_magnitudes for every entry of the
+transformation registry with the formulas of the former if/elif chain
+in catalog.transform_filters.
+
+usage: python -m pytest tests/test_catalog_transform.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import catalog_transform
+
+
+def sdss_bvri(d):
+    """SDSS to BVRI (Chonis & Gaskell 2008)"""
+    g, r, i = d['gmag'], d['rmag'], d['imag']
+    e_g, e_r, e_i = d['e_gmag'], d['e_rmag'], d['e_imag']
+    keep = ((r-i > 0.08) & (r-i < 0.5) & (g-r > 0.2) & (g-r < 1.4) &
+            (g >= 14.5) & (g < 19.5) & (r >= 14.5) & (r < 19.5) &
+            (i >= 14.5) & (i < 19.5))
+    return {None: keep}, {
+        'B': (g + 0.327*(g - r) + 0.216,
+              np.sqrt(((1+0.327)*e_g)**2 + (0.327*e_r)**2 +
+                      ((g-r)*0.047)**2 + 0.027**2)),
+        'V': (g - 0.587*(g - r) - 0.011,
+              np.sqrt(((1+0.587)*e_g)**2 + (0.587*e_r)**2 +
+                      ((g-r)*0.022)**2 + 0.011**2)),
+        'R': (r - 0.272*(r - i) - 0.159,
+              np.sqrt(((1-0.272)*e_r)**2 + (0.272*e_i)**2 +
+                      ((r-i)*0.092)**2 + 0.022**2)),
+        'I': (i - 0.337*(r - i) - 0.370,
+              np.sqrt(((1+0.337)*e_i)**2 + (0.337*e_r)**2 +
+                      ((r-i)*0.191)**2 + 0.041**2))}
+
+
+def apass_ri(d):
+    """APASS/URAT to RI (Chonis & Gaskell 2008)"""
+    r, i, e_r, e_i = d['rmag'], d['imag'], d['e_rmag'], d['e_imag']
+    keep = (r-i > 0.08) & (r-i < 0.5)
+    return {None: keep}, {
+        'R': (r - 0.272*(r - i) - 0.159,
+              np.sqrt(((1-0.272)*e_r)**2 + (0.272*e_i)**2 +
+                      ((r-i)*0.092)**2 + 0.022**2)),
+        'I': (i - 0.337*(r - i) - 0.370,
+              np.sqrt(((1+0.337)*e_i)**2 + (0.337*e_r)**2 +
+                      ((r-i)*0.191)**2 + 0.041**2))}
+
+
+def twomass_ukirt(d):
+    """2MASS to UKIRT YZJHK (Hodgkin et al. 2009)"""
+    J, H, K = d['Jmag'], d['Hmag'], d['Ksmag']
+    e_J, e_H, e_K = d['e_Jmag'], d['e_Hmag'], d['e_Ksmag']
+    keep = ~((J-H < -0.1) | (J-H > 1.0) | (J > 18) | (H > 17))
+    return {None: keep}, {
+        'Z': (J + 0.95*(J - H) + 0.064, np.sqrt(e_J**2 + 0.035**2)),
+        'Y': (J + 0.5*(J - H) + 0.08, e_J),
+        'H': (H + 0.07*(J - K) - 0.03, e_H),
+        'J': (J - 0.065*(J - H), e_J),
+        'K': (K + 0.01*(J - K), e_K)}
+
+
+def panstarrs_bvri(d):
+    """PANSTARRS to BVRI (Tonry et al. 2012)"""
+    g, r, i = d['gp1mag'], d['rp1mag'], d['ip1mag']
+    e_g, e_r, e_i = d['e_gp1mag'], d['e_rp1mag'], d['e_ip1mag']
+    return {None: np.ones(len(g), dtype=bool)}, {
+        'B': (g + 0.212 + 0.556*(g-r) + 0.034*(g-r)**2,
+              np.sqrt(e_g**2 + 0.032**2)),
+        'V': (g + 0.005 - 0.536*(g-r) + 0.011*(g-r)**2,
+              np.sqrt(e_g**2 + 0.012**2)),
+        'R': (r - 0.137 - 0.108*(g-r) - 0.029*(g-r)**2,
+              np.sqrt(e_r**2 + 0.015**2)),
+        'I': (i - 0.366 - 0.136*(g-r) - 0.018*(g-r)**2,
+              np.sqrt(e_i**2 + 0.017**2))}
+
+
+def panstarrs_sdss(d):
+    """PANSTARRS to SDSS griz (Tonry et al. 2012)"""
+    g, r, i, z = d['gp1mag'], d['rp1mag'], d['ip1mag'], d['zp1mag']
+    e_g, e_r = d['e_gp1mag'], d['e_rp1mag']
+    e_i, e_z = d['e_ip1mag'], d['e_zp1mag']
+    return {None: np.ones(len(g), dtype=bool)}, {
+        'g': (g + 0.013 + 0.145*(g-r) + 0.019*(g-r)**2,
+              np.sqrt(e_g**2 + 0.008**2)),
+        'r': (r - 0.001 + 0.004*(g-r) + 0.007*(g-r)**2,
+              np.sqrt(e_r**2 + 0.004**2)),
+        'i': (i - 0.005 + 0.011*(g-r) + 0.010*(g-r)**2,
+              np.sqrt(e_i**2 + 0.004**2)),
+        'z': (z + 0.013 - 0.039*(g-r) - 0.012*(g-r)**2,
+              np.sqrt(e_z**2 + 0.01**2))}
+
+
+def sdss_ukirt_z(d):
+    """SDSS to UKIRT Z (Hewett et al. 2006)"""
+    z, i = d['zmag'], d['imag']
+    return {None: np.ones(len(z), dtype=bool)}, {
+        'Z': (z - 0.01 + 0.06*(i-z) - 0.528, d['e_zmag'])}
+
+
+def gaia_vri(d):
+    """Gaia to Johnson-Cousins VRI (Gaia DR2 documentation)"""
+    g, e_g = d['Gmag'], d['e_Gmag']
+    c = d['BPmag'] - d['RPmag']
+    keep = (c > -0.5) & (c < 2.75)
+    return {None: keep}, {
+        'V': (g - (-0.0176 - 0.00686*c - 0.1732*c**2),
+              np.sqrt(e_g**2 + 0.045858**2)),
+        'R': (g - (-0.003226 + 0.3833*c - 0.1345*c**2),
+              np.sqrt(e_g**2 + 0.04840**2)),
+        'I': (g - (0.02085 + 0.7419*c - 0.09531*c**2),
+              np.sqrt(e_g**2 + 0.04956**2))}
+
+
+def gaia_sdss(d):
+    """Gaia to SDSS gri (Gaia DR2 documentation)"""
+    g, e_g = d['Gmag'], d['e_Gmag']
+    c = d['BPmag'] - d['RPmag']
+    return {'g': (c > -0.5) & (c < 2.0),
+            'r': (c > 0.2) & (c < 2.7),
+            'i': (c > 0) & (c < 4.5)}, {
+        'g': (g - (0.13518 - 0.46245*c - 0.25171*c**2 + 0.021349*c**3),
+              np.sqrt(e_g**2 + 0.16497**2)),
+        'r': (g - (-0.12879 + 0.24662*c - 0.027464*c**2 -
+                   0.049465*c**3),
+              np.sqrt(e_g**2 + 0.066739**2)),
+        'i': (g - (-0.29676 + 0.64728*c - 0.10141*c**2),
+              np.sqrt(e_g**2 + 0.098957**2))}
+
+
+# former formulas for each registry entry, identified by its catalogs
+# and bands
+baseline = {(('SDSS', 'SkyMapper'), 'BIRV'): sdss_bvri,
+            (('APASS', 'URAT'), 'IR'): apass_ri,
+            (('2MASS',), 'HJKYZ'): twomass_ukirt,
+            (('PANSTARRS',), 'BIRV'): panstarrs_bvri,
+            (('PANSTARRS',), 'girz'): panstarrs_sdss,
+            (('SDSS',), 'Z'): sdss_ukirt_z,
+            (('GAIA',), 'IRV'): gaia_vri,
+            (('GAIA',), 'gir'): gaia_sdss}
+
+
+def entry_key(trans):
+    return trans['catalogs'], ''.join(sorted(trans['bands']))
+
+
+def catalog_data(trans, n_sources=2000):
+    """synthetic catalog with all fields used by a transformation;
+    magnitudes scatter around a common value, so that colors cover
+    the ranges of all selection criteria"""
+    rng = np.random.default_rng(7)
+    terms = [term for term, op, value in trans['select']]
+    for band in trans['bands'].values():
+        terms += [band['mag'][0], band['mag'][1]]
+        terms += [field for field, factor in band['err'][0]]
+        terms += [term for term, op, value in band.get('select', [])]
+    fields = sorted(set(sum([term.split('-') for term in terms], [])))
+
+    base = rng.uniform(13, 20, n_sources)
+    return Table({field: (rng.uniform(0.001, 0.1, n_sources)
+                          if field.startswith('e_') else
+                          base + rng.uniform(-0.8, 1.6, n_sources))
+                  for field in fields})
+
+
+@pytest.mark.parametrize('trans', catalog_transform.transformations,
+                         ids=['-'.join(entry_key(trans)[0]) + ':' +
+                              entry_key(trans)[1] for trans in
+                              catalog_transform.transformations])
+def test_registry_matches_former_formulas(trans):
+    assert entry_key(trans) in baseline
+    data = catalog_data(trans)
+    columns = {field: np.array(data[field]) for field in data.columns}
+    keep_former, mags_former = baseline[entry_key(trans)](columns)
+
+    assert sorted(mags_former) == sorted(trans['bands'])
+    for band in trans['bands']:
+        # the former color-color clipping (SDSS) is not reproduced; see
+        # test_sdss_clipping
+        keep, mags = catalog_transform.derive_magnitudes(
+            data, dict(trans, clip=None), [band])
+        expected_keep = keep_former.get(band, keep_former.get(None))
+        assert np.sum(expected_keep) > 0
+        assert list(keep) == list(expected_keep)
+
+        assert np.allclose(mags[band], mags_former[band][0],
+                           rtol=0, atol=1e-10)
+        assert np.allclose(mags['e_'+band], mags_former[band][1],
+                           rtol=0, atol=1e-10)
+
+
+def test_sdss_clipping():
+    # sources far off the color-color locus are rejected
+    trans = catalog_transform.transformations[0]
+    rng = np.random.default_rng(3)
+    n_sources = 500
+    r = rng.uniform(15, 19, n_sources)
+    ri = rng.uniform(0.1, 0.45, n_sources)
+    gr = 0.3 + 1.5*ri + rng.normal(0, 0.02, n_sources)
+    gr[:5] += 0.3
+    data = Table({'gmag': r+gr, 'rmag': r, 'imag': r-ri,
+                  'e_gmag': np.full(n_sources, 0.01),
+                  'e_rmag': np.full(n_sources, 0.01),
+                  'e_imag': np.full(n_sources, 0.01)})
+    keep, mags = catalog_transform.derive_magnitudes(data, trans, ['V'])
+    selected = catalog_transform.selection(data, trans['select'])
+    assert np.all(selected[:5]) and not np.any(keep[:5])
+    assert np.sum(keep[5:]) >= 0.98*np.sum(selected[5:])
+
+
+def test_find_transformations():
+    # SDSS to UKIRT Z only applies to AB magnitudes
+    found = catalog_transform.find_transformations('SDSS-R13', 'AB',
+                                                   ['Z'])
+    assert [(entry_key(trans), bands) for trans, bands in found] == \
+        [((('SDSS',), 'Z'), ['Z'])]
+    assert catalog_transform.find_transformations('SDSS-R13', 'Vega',
+                                                  ['Z']) == []
+    # bands are grouped by transformation
+    found = catalog_transform.find_transformations('GAIA', 'Vega',
+                                                   ['V', 'g', 'R'])
+    assert [(entry_key(trans), bands) for trans, bands in found] == \
+        [((('GAIA',), 'IRV'), ['V', 'R']), ((('GAIA',), 'gir'), ['g'])]
+    # no U band transformation
+    assert catalog_transform.find_transformations('SDSS-R13', 'AB',
+                                                  ['U']) == []
@@ -0,0 +1,181 @@
+""" TEST_EPHEMERIDES - tests for ephemerides
+
+Offline tests of batched, cached, and interpolated ephemerides; JPL
+Horizons is replaced with a synthetic ephemeris.
+
+usage: python -m pytest tests/test_ephemerides.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import ephemerides
+from ephemerides import Ephemerides, get_ephemerides
+from catalog_cache import angular_separation
+
+
+def position(targetname, epochs):
+    """synthetic ephemeris: curved path across RA = 0; 'wiggly' targets
+    oscillate on timescales of minutes"""
+    dt = np.asarray(epochs, dtype=float) - 2460000.5
+    ra = 359 + 0.8*dt + 0.05*dt**2
+    dec = 10 + 0.3*np.sin(dt/2)
+    if targetname == 'wiggly':
+        dec = dec + 0.01*np.sin(dt*500)
+    return ra % 360, dec
+
+
+class FakeHorizons():
+    """stand-in for services.Horizons; keeps track of all queries"""
+
+    queries = []
+
+    def __init__(self, targetname, id_type=None, epochs=None,
+                 location=None):
+        self.targetname = targetname
+        self.epochs = epochs
+        self.uri = 'fake://{:s}'.format(targetname)
+
+    def ephemerides(self):
+        if self.targetname == 'unknown':
+            raise ValueError('Unknown target (unknown).')
+        FakeHorizons.queries.append((self.targetname, list(self.epochs)))
+        ra, dec = position(self.targetname, self.epochs)
+        n = len(self.epochs)
+        return Table({'targetname': ['{:s} (2026 AA)'.format(
+                          self.targetname)]*n,
+                      'datetime_jd': self.epochs, 'RA': ra, 'DEC': dec,
+                      'RA_rate': np.zeros(n), 'DEC_rate': np.zeros(n),
+                      'V': np.ones(n)*18, 'r': np.ones(n)*2.5,
+                      'delta': np.ones(n)*1.5, 'alpha': np.ones(n)*5})
+
+
+@pytest.fixture
+def eph(tmp_path, monkeypatch):
+    """ephemerides with an empty cache, queries go to FakeHorizons"""
+    FakeHorizons.queries = []
+    monkeypatch.setattr(ephemerides, 'Horizons', FakeHorizons)
+    monkeypatch.setattr(ephemerides.conf, 'cache_ephemerides', True)
+    eph = Ephemerides(path=str(tmp_path/'cache'))
+    monkeypatch.setattr(ephemerides, 'ephemerides', eph)
+    return eph
+
+
+def n_queried():
+    return sum([len(epochs) for target, epochs in FakeHorizons.queries])
+
+
+# batched and cached queries
+
+def test_get(eph):
+    epochs = 2460000.5 + np.array([0.3, 0.1, 0.2, 0.1])
+    result = eph.get('target', epochs, '568', 'smallbody')
+
+    # one query for all unique epochs; results in the order of epochs
+    assert len(FakeHorizons.queries) == 1
+    assert n_queried() == 3
+    assert list(result['datetime_jd']) == list(epochs)
+    ra, dec = position('target', epochs)
+    assert np.allclose(result['RA'], ra) and np.allclose(result['DEC'], dec)
+    assert result['targetname'][0] == 'target (2026 AA)'
+    assert result['RA'].unit == 'deg'
+
+
+def test_get_chunks(eph, monkeypatch):
+    monkeypatch.setattr(ephemerides.conf, 'max_epochs_per_query', 40)
+    epochs = 2460000.5 + np.arange(100)/100
+    result = eph.get('target', epochs, '568')
+    assert [len(epochs) for target, epochs in FakeHorizons.queries] == \
+        [40, 40, 20]
+    assert np.allclose(result['DEC'], position('target', epochs)[1])
+
+
+def test_get_cached(eph, tmp_path):
+    epochs = 2460000.5 + np.arange(10)/10
+    eph.get('target', epochs[:6], '568')
+    assert n_queried() == 6
+
+    # in-memory cache: only new epochs are queried
+    eph.get('target', epochs, '568')
+    assert n_queried() == 10
+
+    # persistent cache
+    cached = Ephemerides(path=str(tmp_path/'cache'))
+    result = cached.get('target', epochs, '568')
+    assert n_queried() == 10
+    assert np.allclose(result['RA'], position('target', epochs)[0])
+    assert result['targetname'][0] == 'target (2026 AA)'
+
+    # different observatory or id type
+    cached.get('target', epochs, '500')
+    cached.get('target', epochs, '568', 'smallbody')
+    assert n_queried() == 30
+
+
+def test_get_expired(eph, tmp_path, monkeypatch):
+    epochs = 2460000.5 + np.arange(10)/10
+    eph.get('target', epochs, '568')
+    monkeypatch.setattr(ephemerides.conf, 'max_age', 0)
+    Ephemerides(path=str(tmp_path/'cache')).get('target', epochs, '568')
+    assert n_queried() == 20
+
+
+def test_get_unknown_target(eph):
+    assert eph.get('unknown', [2460000.5], '568') is None
+
+
+# interpolated ephemerides
+
+def test_interpolation_error(eph):
+    # interpolated positions agree with exact positions on a dense grid
+    epochs = 2460000.5 + np.linspace(0, 3, 2000)
+    result = eph.interpolate('target', epochs, '568')
+    assert n_queried() < 200
+
+    ra, dec = position('target', epochs)
+    error = angular_separation(result['RA'], result['DEC'], ra, dec)*3600
+    assert np.max(error) <= ephemerides.conf.max_interpolation_error
+    assert np.all((result['RA'] >= 0) & (result['RA'] < 360))
+    assert np.allclose(result['V'], 18)
+    assert list(result['datetime_jd']) == list(epochs)
+    assert result['targetname'][0] == 'target (2026 AA)'
+
+
+def test_interpolation_unordered_epochs(eph):
+    rng = np.random.default_rng(2)
+    epochs = 2460000.5 + rng.uniform(0, 2, 500)
+    result = eph.interpolate('target', epochs, '568')
+    ra, dec = position('target', epochs)
+    error = angular_separation(result['RA'], result['DEC'], ra, dec)*3600
+    assert np.max(error) <= ephemerides.conf.max_interpolation_error
+
+
+def test_interpolation_fallback(eph):
+    # motion that cannot be interpolated: exact ephemerides are used
+    epochs = 2460000.5 + np.linspace(0, 3, 500)
+    result = eph.interpolate('wiggly', epochs, '568', max_splits=1)
+    ra, dec = position('wiggly', epochs)
+    assert np.allclose(result['RA'], ra) and np.allclose(result['DEC'], dec)
+    queried = sum([epochs for target, epochs in FakeHorizons.queries], [])
+    assert set(epochs) <= set(queried)
+
+
+def test_get_ephemerides(eph, monkeypatch):
+    # short sequences are not interpolated
+    epochs = 2460000.5 + np.linspace(0, 1, 20)
+    get_ephemerides('target', epochs, '568')
+    assert n_queried() == 20
+
+    epochs = 2460000.5 + np.linspace(1, 2, 400)
+    get_ephemerides('target', epochs, '568')
+    assert n_queried() < 200
+
+    monkeypatch.setattr(ephemerides.conf, 'interpolate', False)
+    get_ephemerides('target', epochs, '500')
+    assert n_queried() > 400
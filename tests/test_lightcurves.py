@@ -0,0 +1,177 @@
+""" TEST_LIGHTCURVES - tests for pp_lightcurves
+
+Offline tests of the master source table: matching of frames, and
+write/read/update round trips.
+
+usage: python -m pytest tests/test_lightcurves.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from pp_lightcurves import SourceTable, lightcurves
+from catalog import catalog
+
+arcsec = 1/3600.
+
+
+def field(n_sources=300, seed=0):
+    """star field: positions (at least 20 arcsec apart) and magnitudes"""
+    rng = np.random.default_rng(seed)
+    idx = np.arange(n_sources)
+    return (150 + (idx % 20)*0.015 + rng.uniform(0, 0.005, n_sources),
+            -20.15 + (idx // 20)*0.015 + rng.uniform(0, 0.005, n_sources),
+            rng.uniform(12, 19, n_sources))
+
+
+def frame(filename, obstime_jd, star_field, seed, detected=0.9):
+    """calibrated frame catalog of a star field; positions scatter by
+    0.2 arcsec, a fraction of the stars is not detected, and one
+    source has no valid position"""
+    rng = np.random.default_rng(seed)
+    ra, dec, mag = star_field
+    idc = np.where(rng.uniform(0, 1, len(ra)) < detected)[0]
+    cat = catalog(filename)
+    cat.add_fields(
+        ['ra_deg', 'dec_deg', 'Vmag', 'e_Vmag', 'FLAGS'],
+        [np.hstack([ra[idc] + rng.normal(0, 0.2, len(idc))*arcsec /
+                    np.cos(np.deg2rad(dec[idc])), np.nan]),
+         np.hstack([dec[idc] + rng.normal(0, 0.2, len(idc))*arcsec, 0]),
+         np.hstack([mag[idc] + rng.normal(0, 0.01, len(idc)), 15]),
+         np.hstack([np.full(len(idc), 0.01), 0.01]),
+         np.hstack([rng.integers(0, 4, len(idc)), 0])])
+    cat.obstime = [obstime_jd, 60.]
+    cat.filtername = 'V'
+    return cat, idc
+
+
+def frames(n_frames=4, seed=0):
+    star_field = field(seed=seed)
+    return star_field, [frame('frame{:d}.ldac'.format(i), 2460000.5+i/100,
+                              star_field, seed+i+1)
+                        for i in range(n_frames)]
+
+
+def assert_tables_equal(table1, table2):
+    assert table1.n_sources == table2.n_sources
+    assert table1.tolerance == pytest.approx(table2.tolerance)
+    assert list(table1.n_detections) == list(table2.n_detections)
+    assert np.allclose(table1.vectors, table2.vectors, rtol=0, atol=1e-12)
+    assert table1.frames == table2.frames
+    for matrix1, matrix2 in zip(table1.matrices(), table2.matrices()):
+        assert np.array_equal(matrix1, matrix2, equal_nan=True)
+
+
+# matching
+
+def test_add_frames():
+    star_field, cats = frames()
+    table = SourceTable(tolerance=2*arcsec)
+    ids = [table.add_frame(cat) for cat, idc in cats]
+
+    # each star is a single master source; source ids do not change
+    assert table.n_sources == len(star_field[0])
+    star_ids = {}
+    for source_id, (cat, idc) in zip(ids, cats):
+        assert source_id[-1] == -1
+        for star, source in zip(idc, source_id[:-1]):
+            assert star_ids.setdefault(star, source) == source
+
+    # mean positions
+    ra, dec = table.positions()
+    stars = np.array(sorted(star_ids))
+    sources = np.array([star_ids[star] for star in stars])
+    assert np.allclose(ra[sources], star_field[0][stars], atol=0.5*arcsec)
+    assert np.allclose(dec[sources], star_field[1][stars], atol=0.5*arcsec)
+
+    # light curves
+    mag, magerr, flags = table.matrices()
+    assert mag.shape == (len(cats), table.n_sources)
+    for i, (cat, idc) in enumerate(cats):
+        assert np.allclose(mag[i, ids[i][:-1]], cat['Vmag'][:-1])
+        assert list(flags[i, ids[i][:-1]]) == list(cat['FLAGS'][:-1])
+        assert np.sum(np.isnan(mag[i])) == table.n_sources - len(idc)
+        assert np.sum(flags[i] < 0) == table.n_sources - len(idc)
+
+
+def test_tolerance():
+    # sources beyond the tolerance become new master sources
+    star_field = field(n_sources=50)
+    cat1, idc = frame('frame1.ldac', 2460000.5, star_field, 1, detected=1)
+    shifted = (star_field[0], star_field[1]+5*arcsec, star_field[2])
+    cat2, idc = frame('frame2.ldac', 2460000.6, shifted, 2, detected=1)
+    table = SourceTable(tolerance=2*arcsec)
+    table.add_frame(cat1)
+    assert list(table.add_frame(cat2)[:-1]) == list(range(50, 100))
+    assert list(table.n_detections) == [1]*100
+
+
+# write, read, and update
+
+def test_write_read(tmp_path):
+    star_field, cats = frames()
+    table = SourceTable(tolerance=2*arcsec)
+    for cat, idc in cats:
+        table.add_frame(cat)
+    filename = str(tmp_path/'lightcurves.fits')
+    table.write(filename, min_detections=4)
+
+    read = SourceTable.read(filename)
+    assert_tables_equal(table, read)
+    ra, dec = table.positions()
+    read_ra, read_dec = read.positions()
+    assert np.allclose(ra, read_ra, rtol=0, atol=1e-10)
+    assert np.allclose(dec, read_dec, rtol=0, atol=1e-10)
+
+    # selected sources
+    hdus = fits.open(filename)
+    assert hdus[0].header['NSOURCES'] == table.n_sources
+    assert hdus[0].header['NSELECT'] == np.sum(table.n_detections == 4)
+    assert list(hdus['SOURCES'].data['selected']) == \
+        list(table.n_detections == 4)
+    assert hdus['MAG'].data.shape == (len(cats), table.n_sources)
+    hdus.close()
+
+
+def test_update(tmp_path):
+    # adding frames to a table read from file gives the same table as
+    # adding all frames at once
+    star_field, cats = frames(n_frames=5)
+    table = SourceTable(tolerance=2*arcsec)
+    for cat, idc in cats:
+        table.add_frame(cat)
+
+    filename = str(tmp_path/'lightcurves.fits')
+    partial = SourceTable(tolerance=2*arcsec)
+    for cat, idc in cats[:2]:
+        partial.add_frame(cat)
+    partial.write(filename)
+
+    updated = SourceTable.read(filename)
+    for cat, idc in cats[2:]:
+        updated.add_frame(cat)
+    assert_tables_equal(table, updated)
+
+    updated.write(filename)
+    assert_tables_equal(table, SourceTable.read(filename))
+
+
+def test_lightcurves_update(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    star_field, cats = frames(n_frames=4)
+    cats = [cat for cat, idc in cats]
+    filename = str(tmp_path/'lightcurves.fits')
+
+    lightcurves(cats[:3], filename)
+    # known frames are skipped; frames are added in temporal order
+    table = lightcurves([cats[3], cats[1]], filename, update=True)
+    assert [frame['filename'] for frame in table.frames] == \
+        [cat.catalogname for cat in cats]
+    assert_tables_equal(table, lightcurves(cats[::-1],
+                                           str(tmp_path/'all.fits')))
@@ -220,6 +220,53 @@ def skycenter(catalogs, ra_key='ra_deg', dec_key='dec_deg'):
     return ra, dec, rad
 
 
+def tangent_plane(ra0_deg, dec0_deg, ra_deg, dec_deg):
+    """gnomonic projection of positions around (ra0_deg, dec0_deg)
+    return: xi, eta (rad), cosine of distance from projection center"""
+    ra0, dec0 = np.deg2rad(ra0_deg), np.deg2rad(dec0_deg)
+    ra, dec = np.deg2rad(ra_deg), np.deg2rad(dec_deg)
+    cos_c = (np.sin(dec0)*np.sin(dec) +
+             np.cos(dec0)*np.cos(dec)*np.cos(ra-ra0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xi = np.cos(dec)*np.sin(ra-ra0)/cos_c
+        eta = (np.cos(dec0)*np.sin(dec) -
+               np.sin(dec0)*np.cos(dec)*np.cos(ra-ra0))/cos_c
+    return xi, eta, cos_c
+
+
+def footprint_mask(catalogs, ra_deg, dec_deg, margin=0,
+                   ra_key='ra_deg', dec_key='dec_deg'):
+    """identify positions within the footprint of any of the catalogs;
+    a catalog footprint is the bounding box of its sources in the
+    tangent plane around their center, widened by margin (deg)
+    return: boolean array"""
+    ra_deg = np.atleast_1d(np.asarray(ra_deg, dtype=float))
+    dec_deg = np.atleast_1d(np.asarray(dec_deg, dtype=float))
+    mask = np.zeros(len(ra_deg), dtype=bool)
+
+    for cat in catalogs:
+        cat_ra = np.deg2rad(np.asarray(cat[ra_key], dtype=float))
+        cat_dec = np.deg2rad(np.asarray(cat[dec_key], dtype=float))
+        if len(cat_ra) == 0:
+            continue
+        # center: mean unit vector (safe at RA=0 and the poles)
+        x = np.mean(np.cos(cat_dec)*np.cos(cat_ra))
+        y = np.mean(np.cos(cat_dec)*np.sin(cat_ra))
+        z = np.mean(np.sin(cat_dec))
+        ra0 = np.rad2deg(np.arctan2(y, x))
+        dec0 = np.rad2deg(np.arctan2(z, np.hypot(x, y)))
+
+        cat_xi, cat_eta, cat_cos_c = tangent_plane(
+            ra0, dec0, np.rad2deg(cat_ra), np.rad2deg(cat_dec))
+        xi, eta, cos_c = tangent_plane(ra0, dec0, ra_deg, dec_deg)
+        m = np.deg2rad(margin)
+        mask |= ((cos_c > 0.5) &
+                 (xi >= np.min(cat_xi)-m) & (xi <= np.max(cat_xi)+m) &
+                 (eta >= np.min(cat_eta)-m) & (eta <= np.max(cat_eta)+m))
+
+    return mask
+
+
 # miscellaneous tools
 
 def if_val_in_dict(target_val, dic):